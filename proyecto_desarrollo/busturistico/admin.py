@@ -23,7 +23,8 @@ class ParadaAdmin(admin.ModelAdmin):
 
 @admin.register(ParadaAtractivo)
 class ParadaAtractivoAdmin(admin.ModelAdmin):
-    list_display = ('id', 'parada', 'atractivo')
+    list_display = ('id', 'parada', 'atractivo', 'distancia_m', 'automatico')
+    list_filter = ('automatico',)
 
 @admin.register(Atractivo)
 class AtractivoAdmin(admin.ModelAdmin):
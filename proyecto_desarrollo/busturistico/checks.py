@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+BACKENDS_POR_PROCESO = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@register(Tags.caches)
+def cache_compartido(app_configs, **kwargs):
+    """
+    Las invalidaciones (generaciones del catálogo, identidad de choferes) viven
+    en el cache: con un backend por proceso, los demás workers nunca se enteran.
+    """
+    if settings.DEBUG:
+        return []
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in BACKENDS_POR_PROCESO:
+        return [Error(
+            "El cache 'default' es por proceso y DEBUG está desactivado.",
+            hint="Usar un backend compartido entre workers: FileBasedCache, DatabaseCache, Redis o Memcached.",
+            id='busturistico.E001',
+        )]
+    return []
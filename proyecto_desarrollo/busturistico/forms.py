@@ -13,6 +13,7 @@ import datetime
 from django import forms
 import re
 from .models import Bus, EstadoBus
+from .services_ruta import haversine_m
 
 User = get_user_model()
 
@@ -86,6 +87,20 @@ class ChoferForm(forms.ModelForm):
             'activo': 'Activo',
         }
 
+class ImportarChoferesForm(forms.Form):
+    archivo = forms.FileField(
+        label='Archivo CSV o XLSX',
+        help_text='Columnas: nombre, apellido, legajo, dni, telefono, fecha_ingreso y (opcional) activo.',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}),
+    )
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data['archivo']
+        if not archivo.name.lower().endswith(('.csv', '.xlsx')):
+            raise ValidationError('El archivo tiene que ser .csv o .xlsx.')
+        return archivo
+
+
 class BusForm(forms.ModelForm):
     class Meta:
         model = Bus
@@ -331,8 +346,9 @@ class AtractivoForm(forms.ModelForm):
     parada_a_asignar = forms.ModelChoiceField(
         queryset=Parada.objects.all(),
         required=False,
-        empty_label="No asignar a una parada",
-        label="Asignar o reasignar a Parada"
+        empty_label="Solo las paradas cercanas",
+        label="Asignar además a Parada",
+        help_text="Las paradas a distancia de caminata se vinculan solas; esta queda como vínculo manual."
     )
 
     class Meta:
@@ -350,7 +366,7 @@ class AtractivoForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         self.fields['parada_a_asignar'].queryset = Parada.objects.all()
         if self.instance.pk:
-            parada_atractivo_actual = ParadaAtractivo.objects.filter(atractivo=self.instance).first()
+            parada_atractivo_actual = ParadaAtractivo.objects.filter(atractivo=self.instance, automatico=False).first()
             if parada_atractivo_actual:
                 self.fields['parada_a_asignar'].initial = parada_atractivo_actual.parada
 
@@ -360,11 +376,23 @@ class AtractivoForm(forms.ModelForm):
         instance.save()  # Explicitly save to assign PK
         if hasattr(self, 'cleaned_data'):
             parada = self.cleaned_data.get('parada_a_asignar')
-            # Delete existing relationships
-            ParadaAtractivo.objects.filter(atractivo=instance).delete()  # Use direct query instead of reverse relation
-            # Create new relationship if parada is selected
+            # Only the manual link is replaced; proximity links are kept in sync by the signals
+            manuales = ParadaAtractivo.objects.filter(atractivo=instance, automatico=False)
+            if parada:
+                manuales = manuales.exclude(parada=parada)
+            manuales.delete()
             if parada:
-                ParadaAtractivo.objects.get_or_create(parada=parada, atractivo=instance)
+                ParadaAtractivo.objects.update_or_create(
+                    parada=parada,
+                    atractivo=instance,
+                    defaults={
+                        'automatico': False,
+                        'distancia_m': haversine_m(
+                            instance.latitud_atractivo, instance.longitud_atractivo,
+                            parada.latitud_parada, parada.longitud_parada,
+                        ),
+                    },
+                )
         return instance
 
 
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from busturistico.models import Recorrido
+from busturistico.services_ruta import paradas_ordenadas, puntos_paradas, trazar_pendientes
+
+
+class Command(BaseCommand):
+    help = "Traza con OSRM (en paralelo) y guarda la geometría de los recorridos (todos o los indicados)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('recorridos', nargs='*', type=int, help="IDs de recorridos (por defecto, todos)")
+        parser.add_argument('--concurrencia', type=int, default=None, help="Pedidos simultáneos a OSRM")
+        parser.add_argument('--timeout', type=float, default=None, help="Timeout por pedido, en segundos")
+
+    def handle(self, *args, **options):
+        recorridos = Recorrido.objects.order_by('id')
+        if options['recorridos']:
+            recorridos = recorridos.filter(id__in=options['recorridos'])
+
+        pendientes = []
+        for recorrido in recorridos:
+            paradas_recorrido = paradas_ordenadas(recorrido)
+            puntos = puntos_paradas(paradas_recorrido)
+            if len(puntos) < 2:
+                self.stdout.write(self.style.WARNING(f"{recorrido}: menos de dos paradas, se omite."))
+                continue
+            pendientes.append((recorrido, paradas_recorrido, puntos))
+
+        inicio = timezone.now()
+        for ruta in trazar_pendientes(pendientes, options['concurrencia'], options['timeout']):
+            if ruta.fecha_actualizacion < inicio:
+                # OSRM no respondió: guardar_ruta conservó la ruta de OSRM ya guardada
+                origen = 'OSRM no disponible, se conserva la ruta anterior'
+            elif ruta.trazada_con_osrm:
+                origen = 'OSRM'
+            else:
+                origen = 'línea recta (OSRM no disponible)'
+            self.stdout.write(self.style.SUCCESS(
+                f"{ruta.recorrido}: {len(ruta.geometria)} puntos, {ruta.distancia_total_m / 1000:.1f} km ({origen})"
+            ))
@@ -0,0 +1,33 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from busturistico.services_viaje import MARGEN_FINALIZACION, finalizar_viajes_vencidos
+
+
+class Command(BaseCommand):
+    help = (
+        "Finaliza en bloque los viajes en curso que superaron su duración programada. "
+        "Pensado para correr desde cron o, con --intervalo, como proceso permanente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--margen', type=int, default=int(MARGEN_FINALIZACION.total_seconds() // 60),
+            help="Minutos de tolerancia por sobre la duración programada",
+        )
+        parser.add_argument(
+            '--intervalo', type=int, default=None,
+            help="Repetir cada N segundos en lugar de correr una sola vez",
+        )
+
+    def handle(self, *args, **options):
+        margen = timedelta(minutes=options['margen'])
+        while True:
+            finalizados = finalizar_viajes_vencidos(margen=margen)
+            if finalizados or options['verbosity'] > 1:
+                self.stdout.write(self.style.SUCCESS(f"{finalizados} viaje(s) finalizado(s)."))
+            if not options['intervalo']:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from busturistico.services_cache import incrementar_generacion
+from busturistico.services_imagenes import CAMPOS_FOTO, fotos_existentes, generar_derivadas
+
+
+class Command(BaseCommand):
+    help = "Genera las variantes WebP/JPEG redimensionadas de las fotos ya cargadas (recorridos, paradas, atractivos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modelo', choices=[modelo.__name__.lower() for modelo in CAMPOS_FOTO],
+                            action='append', help="Limitar a un modelo (se puede repetir)")
+        parser.add_argument('--forzar', action='store_true', help="Regenera aunque las variantes estén al día")
+        parser.add_argument('--concurrencia', type=int, default=2, help="Fotos procesadas en paralelo")
+
+    def handle(self, *args, **options):
+        modelos = [modelo for modelo in CAMPOS_FOTO if modelo.__name__.lower() in (options['modelo'] or [])]
+        fotos = list(fotos_existentes(modelos))
+
+        def procesar(foto):
+            modelo, nombre = foto
+            try:
+                return modelo, nombre, generar_derivadas(nombre, forzar=options['forzar']), None
+            except Exception as exc:
+                return modelo, nombre, None, exc
+
+        actualizados = set()
+        with ThreadPoolExecutor(max_workers=max(options['concurrencia'], 1)) as executor:
+            for modelo, nombre, manifiesto, error in executor.map(procesar, fotos):
+                if error is not None:
+                    self.stdout.write(self.style.WARNING(f"{nombre}: {error}"))
+                    continue
+                actualizados.add(modelo)
+                anchos = ', '.join(str(ancho) for ancho in manifiesto['anchos'])
+                self.stdout.write(self.style.SUCCESS(f"{nombre}: {anchos} px"))
+
+        for modelo in actualizados:
+            incrementar_generacion(modelo)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from busturistico.services_choferes import importar_choferes, leer_filas
+
+
+class Command(BaseCommand):
+    help = "Alta masiva de choferes (y sus usuarios) desde un CSV o XLSX."
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Ruta al .csv o .xlsx con encabezados.")
+        parser.add_argument(
+            '--procesos', type=int,
+            help="Procesos para hashear contraseñas (por defecto, uno por CPU hasta PROCESOS_MAXIMOS).",
+        )
+
+    def handle(self, *args, **options):
+        ruta = options['archivo']
+        try:
+            with open(ruta, 'rb') as archivo:
+                resultado = importar_choferes(leer_filas(archivo, ruta), procesos=options['procesos'])
+        except OSError as exc:
+            raise CommandError(f"No se pudo leer {ruta}: {exc}")
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        for fila, mensaje in resultado.errores:
+            self.stderr.write(f"Fila {fila}: {mensaje}")
+        estilo = self.style.SUCCESS if not resultado.errores else self.style.WARNING
+        self.stdout.write(estilo(
+            f"{len(resultado.creados)} choferes creados, {len(resultado.errores)} filas con errores."
+        ))
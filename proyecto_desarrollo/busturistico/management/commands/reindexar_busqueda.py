@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from busturistico.services_busqueda import crear_indice, reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda de texto (recorridos, paradas y atractivos)."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            crear_indice()
+            total = reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(f"{total} documentos indexados."))
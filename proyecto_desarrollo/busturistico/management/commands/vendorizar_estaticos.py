@@ -0,0 +1,39 @@
+import requests
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from busturistico.services_estaticos import ASSETS, carpeta_static, vendorizar
+
+
+class Command(BaseCommand):
+    help = (
+        "Descarga las dependencias de CDN (Bootstrap, Font Awesome, Bootstrap Icons, Leaflet) "
+        "a busturistico/static/vendor y, con --collectstatic, genera los estáticos "
+        "fingerprinteados y precomprimidos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('assets', nargs='*', help=f"Assets a descargar (por defecto, todos: {', '.join(ASSETS)})")
+        parser.add_argument('--forzar', action='store_true', help="Vuelve a descargar aunque ya estén")
+        parser.add_argument('--collectstatic', action='store_true', help="Corre collectstatic al terminar")
+
+    def handle(self, *args, **options):
+        nombres = options['assets'] or list(ASSETS)
+        desconocidos = [nombre for nombre in nombres if nombre not in ASSETS]
+        if desconocidos:
+            raise CommandError(f"Assets desconocidos: {', '.join(desconocidos)}")
+
+        destino = carpeta_static()
+        session = requests.Session()
+        for nombre in nombres:
+            try:
+                escritos = vendorizar(nombre, destino, session, options['forzar'])
+            except (requests.RequestException, ValueError) as exc:
+                raise CommandError(f"{nombre}: {exc}") from exc
+            if escritos:
+                self.stdout.write(self.style.SUCCESS(f"{nombre}: {len(escritos)} archivos"))
+            else:
+                self.stdout.write(f"{nombre}: ya vendorizado")
+
+        if options['collectstatic']:
+            call_command('collectstatic', interactive=False, verbosity=options['verbosity'])
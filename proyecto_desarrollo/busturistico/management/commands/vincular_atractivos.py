@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from busturistico.services_espacial import radio_caminata, vincular_por_cercania
+
+
+class Command(BaseCommand):
+    help = "Vincula cada atractivo con todas las paradas a distancia de caminata (índice espacial)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--radio', type=float,
+            help="Radio de caminata en metros (por defecto RADIO_CAMINATA_ATRACTIVOS_M o 400).",
+        )
+
+    def handle(self, *args, **options):
+        radio = options['radio'] or radio_caminata()
+        vinculos = vincular_por_cercania(radio_m=radio)
+        self.stdout.write(self.style.SUCCESS(f"{vinculos} vínculos automáticos a menos de {radio:.0f} m."))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('busturistico', '0008_precio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RutaRecorrido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geometria', models.JSONField(default=list)),
+                ('firma_paradas', models.CharField(max_length=64)),
+                ('trazada_con_osrm', models.BooleanField(default=False)),
+                ('distancia_total_m', models.FloatField(default=0)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('recorrido', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ruta', to='busturistico.recorrido')),
+            ],
+            options={
+                'verbose_name_plural': 'RutaRecorridos',
+            },
+        ),
+    ]
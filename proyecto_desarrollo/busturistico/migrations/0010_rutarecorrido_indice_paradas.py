@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('busturistico', '0009_rutarecorrido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rutarecorrido',
+            name='distancias_acumuladas',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='rutarecorrido',
+            name='indice_paradas',
+            field=models.JSONField(default=dict),
+        ),
+    ]
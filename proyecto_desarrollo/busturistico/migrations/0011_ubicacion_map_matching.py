@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('busturistico', '0010_rutarecorrido_indice_paradas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ubicacioncolectivo',
+            name='desvio_m',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ubicacioncolectivo',
+            name='distancia_recorrida_m',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ubicacioncolectivo',
+            name='segmento_ruta',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='ubicacioncolectivo',
+            index=models.Index(fields=['viaje', 'timestamp_ubicacion'], name='busturistic_viaje_i_990a30_idx'),
+        ),
+    ]
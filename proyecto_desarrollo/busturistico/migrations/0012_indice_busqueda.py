@@ -0,0 +1,98 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+TABLA_BUSQUEDA = 'busturistico_busqueda'
+
+# SQL congelado del índice tal como quedó en esta migración (no depende de services_busqueda)
+SQL_CREAR = {
+    'sqlite': [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_BUSQUEDA} USING fts5("
+        "tipo UNINDEXED, objeto_id UNINDEXED, titulo, cuerpo, "
+        "tokenize='unicode61 remove_diacritics 2')",
+    ],
+    'postgresql': [
+        f"CREATE TABLE IF NOT EXISTS {TABLA_BUSQUEDA} ("
+        "tipo varchar(20) NOT NULL, objeto_id bigint NOT NULL, documento tsvector NOT NULL, "
+        "PRIMARY KEY (tipo, objeto_id))",
+        f"CREATE INDEX IF NOT EXISTS {TABLA_BUSQUEDA}_documento ON {TABLA_BUSQUEDA} USING GIN (documento)",
+    ],
+}
+SQL_INSERTAR = {
+    'sqlite': f"INSERT INTO {TABLA_BUSQUEDA} (rowid, tipo, objeto_id, titulo, cuerpo) VALUES (%s, %s, %s, %s, %s)",
+    'postgresql': (
+        f"INSERT INTO {TABLA_BUSQUEDA} (tipo, objeto_id, documento) VALUES (%s, %s, "
+        "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'D'))"
+    ),
+}
+SQL_ELIMINAR = f"DROP TABLE IF EXISTS {TABLA_BUSQUEDA}"
+
+# tipo -> (código para el rowid, modelo, campos del título, campos del cuerpo)
+DOCUMENTOS = {
+    'recorrido': (1, 'Recorrido', ('color_recorrido',), ('descripcion_recorrido',)),
+    'parada': (2, 'Parada', ('nombre_parada',), ('direccion_parada', 'descripcion_parada')),
+    'atractivo': (3, 'Atractivo', ('nombre_atractivo',), ('descripcion_atractivo',)),
+}
+ROWID_POR_TIPO = 1_000_000_000
+
+# Copia del normalizador de services_busqueda; si después cambia, reindexar_busqueda rehace el índice
+PALABRAS_VACIAS = frozenset(
+    'a al con de del el en es la las lo los o para por que se su sus un una y'.split()
+)
+SUFIJOS = (
+    'amientos', 'imientos', 'amiento', 'imiento', 'aciones', 'uciones', 'adoras', 'adores',
+    'ancias', 'encias', 'idades', 'mente', 'acion', 'ucion', 'adora', 'ador', 'ancia', 'encia',
+    'idad', 'ivas', 'ivos', 'osas', 'osos', 'iva', 'ivo', 'osa', 'oso', 'es', 'as', 'os', 'a', 'o', 'e', 's',
+)
+LARGO_MINIMO_RAIZ = 3
+
+
+def raiz(palabra):
+    for sufijo in SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= LARGO_MINIMO_RAIZ:
+            return palabra[:-len(sufijo)]
+    return palabra
+
+
+def texto_documento(objeto, campos):
+    texto = ' '.join(str(getattr(objeto, campo) or '') for campo in campos)
+    plegado = ''.join(
+        c for c in unicodedata.normalize('NFKD', texto) if not unicodedata.combining(c)
+    ).lower()
+    return ' '.join(raiz(palabra) for palabra in re.findall(r'[a-z0-9]+', plegado) if palabra not in PALABRAS_VACIAS)
+
+
+def crear_indice_busqueda(apps, schema_editor):
+    conexion = schema_editor.connection
+    if conexion.vendor not in SQL_CREAR:
+        # Motores sin índice de texto: la búsqueda usa icontains
+        return
+    for sql in SQL_CREAR[conexion.vendor]:
+        schema_editor.execute(sql)
+    for tipo, (codigo, nombre_modelo, campos_titulo, campos_cuerpo) in DOCUMENTOS.items():
+        modelo = apps.get_model('busturistico', nombre_modelo)
+        for objeto in modelo.objects.using(conexion.alias).only('pk', *campos_titulo, *campos_cuerpo):
+            titulo = texto_documento(objeto, campos_titulo)
+            cuerpo = texto_documento(objeto, campos_cuerpo)
+            if conexion.vendor == 'sqlite':
+                params = [codigo * ROWID_POR_TIPO + objeto.pk, tipo, objeto.pk, titulo, cuerpo]
+            else:
+                params = [tipo, objeto.pk, titulo, cuerpo]
+            schema_editor.execute(SQL_INSERTAR[conexion.vendor], params)
+
+
+def eliminar_indice_busqueda(apps, schema_editor):
+    if schema_editor.connection.vendor in SQL_CREAR:
+        schema_editor.execute(SQL_ELIMINAR)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('busturistico', '0011_ubicacion_map_matching'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice_busqueda, eliminar_indice_busqueda),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('busturistico', '0012_indice_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paradaatractivo',
+            name='automatico',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='paradaatractivo',
+            name='distancia_m',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('busturistico', '0013_paradaatractivo_cercania'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ubicacioncolectivo',
+            name='dispositivo',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='ubicacioncolectivo',
+            name='secuencia',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='ubicacioncolectivo',
+            constraint=models.UniqueConstraint(condition=models.Q(('dispositivo__isnull', False)), fields=('dispositivo', 'secuencia'), name='ubicacion_unica_por_dispositivo'),
+        ),
+    ]
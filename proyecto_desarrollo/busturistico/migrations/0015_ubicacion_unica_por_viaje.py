@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('busturistico', '0014_ubicacion_dispositivo'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='ubicacioncolectivo',
+            name='ubicacion_unica_por_dispositivo',
+        ),
+        migrations.AddConstraint(
+            model_name='ubicacioncolectivo',
+            constraint=models.UniqueConstraint(condition=models.Q(('dispositivo__isnull', False)), fields=('viaje', 'dispositivo', 'secuencia'), name='ubicacion_unica_por_viaje_dispositivo'),
+        ),
+    ]
@@ -60,6 +60,9 @@ class Atractivo(models.Model):
 class ParadaAtractivo(models.Model):
     parada = models.ForeignKey(Parada, on_delete=models.CASCADE)
     atractivo = models.ForeignKey(Atractivo, on_delete=models.CASCADE)
+    # Distancia caminando en línea recta; los vínculos automáticos salen de la cercanía
+    distancia_m = models.FloatField(null=True, blank=True)
+    automatico = models.BooleanField(default=False)
 
     class Meta:
         unique_together = ('parada', 'atractivo')
@@ -108,18 +111,24 @@ class Chofer(models.Model):
     def __str__(self):
         return f"{self.nombre_chofer} {self.apellido_chofer}"
     
+    def datos_usuario(self):
+        """Campos del User que se le crea al chofer (la contraseña inicial es el DNI)."""
+        username = f"chofer_{self.legajo_chofer}"
+        return {
+            'username': username,
+            'email': f"{username}@busturistico.com",
+            'first_name': self.nombre_chofer,
+            'last_name': self.apellido_chofer,
+            'is_staff': False,  # NO es admin
+            'is_superuser': False,  # NO es superuser
+        }
+
     def save(self, *args, **kwargs):
         # Crear usuario automáticamente si no existe
         if not self.user and self.activo:
-            username = f"chofer_{self.legajo_chofer}"
             user = User.objects.create_user(
-                username=username,
-                email=f"{username}@busturistico.com",
                 password=str(self.dni_chofer),  # Usar DNI como password inicial
-                first_name=self.nombre_chofer,
-                last_name=self.apellido_chofer,
-                is_staff=False,  # NO es admin
-                is_superuser=False  # NO es superuser
+                **self.datos_usuario()
             )
             self.user = user
         elif self.user and not self.activo:
@@ -162,9 +171,28 @@ class UbicacionColectivo(models.Model):
     longitud = models.FloatField()
     timestamp_ubicacion = models.DateTimeField()
     viaje = models.ForeignKey(Viaje, on_delete=models.CASCADE, null=True, blank=True)
+    # Resultado del map-matching contra la ruta del recorrido
+    segmento_ruta = models.IntegerField(null=True, blank=True)
+    distancia_recorrida_m = models.FloatField(null=True, blank=True)
+    desvio_m = models.FloatField(null=True, blank=True)
+    # Origen de las posiciones subidas en lote: id del dispositivo y número
+    # correlativo que este le asignó (los reintentos repiten el par). La unicidad
+    # es por viaje: no depende de que la secuencia del dispositivo nunca se reinicie
+    dispositivo = models.CharField(max_length=64, null=True, blank=True)
+    secuencia = models.PositiveBigIntegerField(null=True, blank=True)
 
     class Meta:
         verbose_name_plural = "UbicacionColectivos"
+        indexes = [
+            models.Index(fields=['viaje', 'timestamp_ubicacion']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['viaje', 'dispositivo', 'secuencia'],
+                condition=models.Q(dispositivo__isnull=False),
+                name='ubicacion_unica_por_viaje_dispositivo',
+            ),
+        ]
 
 
 class HistorialEstadoViaje(models.Model):
@@ -211,3 +239,30 @@ class Precio(models.Model):
         return f"{self.get_tipo_display()} - ${self.precio_usd} USD"
 
 
+
+
+class RutaRecorrido(models.Model):
+    """Geometría trazada de un recorrido, guardada para no consultar OSRM en cada request."""
+    recorrido = models.OneToOneField(
+        Recorrido,
+        on_delete=models.CASCADE,
+        related_name='ruta'
+    )
+    # Lista de puntos [lat, lng] en el orden en que los recorre el bus
+    geometria = models.JSONField(default=list)
+    # Hash de las coordenadas de las paradas usadas para trazar la ruta
+    firma_paradas = models.CharField(max_length=64)
+    trazada_con_osrm = models.BooleanField(default=False)
+    distancia_total_m = models.FloatField(default=0)
+    # Distancia acumulada (m) hasta cada punto de la geometría
+    distancias_acumuladas = models.JSONField(default=list)
+    # Índice columnar de paradas: parada_ids, ordenes, distancias_m y offsets_s
+    # (segundos desde la salida), ordenado por posición a lo largo de la ruta
+    indice_paradas = models.JSONField(default=dict)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "RutaRecorridos"
+
+    def __str__(self):
+        return f"Ruta {self.recorrido}"
@@ -0,0 +1,190 @@
+import heapq
+import re
+import threading
+from bisect import bisect_left
+
+from django.urls import reverse
+
+from .services_busqueda import PALABRAS_VACIAS, plegar
+from .services_catalogo import catalogo
+
+SUGERENCIAS_POR_DEFECTO = 8
+SUGERENCIAS_MAXIMAS = 20
+# Ningún prefijo real llega a este carácter: cierra el rango de bisect
+FIN_PREFIJO = '\uffff'
+
+
+def palabras(texto):
+    return re.findall(r'[a-z0-9]+', plegar(texto))
+
+
+def claves_nombre(nombre):
+    """
+    Claves de prefijo de un nombre: desde cada palabra significativa hasta el
+    final, sin palabras vacías. 'Plaza de Mayo' -> ['plaza mayo', 'mayo'].
+    """
+    significativas = [palabra for palabra in palabras(nombre) if palabra not in PALABRAS_VACIAS]
+    return [' '.join(significativas[i:]) for i in range(len(significativas))]
+
+
+def prefijo_consulta(texto):
+    """Como claves_nombre, pero la última palabra (incompleta) nunca se descarta."""
+    todas = palabras(texto)
+    if not todas:
+        return ''
+    return ' '.join([palabra for palabra in todas[:-1] if palabra not in PALABRAS_VACIAS] + todas[-1:])
+
+
+def entidades_catalogo(cat):
+    """(tipo, id) -> (nombre, popularidad, url) de todo lo que se puede sugerir."""
+    entidades = {}
+    for recorrido in cat.recorridos.values():
+        entidades[('recorrido', recorrido.id)] = entidad_recorrido(recorrido)
+    for parada in cat.paradas.values():
+        entidades[('parada', parada.id)] = entidad_parada(parada)
+    for atractivo in cat.atractivos.values():
+        entidades[('atractivo', atractivo.id)] = entidad_atractivo(atractivo)
+    return entidades
+
+
+def entidad_recorrido(recorrido):
+    # Más paradas, más lugares donde subir
+    return (f"Recorrido {recorrido.color_recorrido}", len(recorrido.paradas),
+            reverse('usuario-detalle-recorrido', args=[recorrido.id]))
+
+
+def entidad_parada(parada):
+    # Las paradas de combinación y con más atractivos cerca son las más buscadas
+    popularidad = 2 * len({recorrido_id for recorrido_id, _ in parada.recorridos}) + len(parada.atractivos)
+    return parada.nombre_parada, popularidad, reverse('usuario-detalle-parada', args=[parada.id])
+
+
+def entidad_atractivo(atractivo):
+    url = reverse('usuario-detalle-parada', args=[atractivo.paradas[0].id]) if atractivo.paradas else None
+    return atractivo.nombre_atractivo, atractivo.calificacion_estrellas + len(atractivo.paradas), url
+
+
+class IndicePrefijos:
+    """
+    Arreglo ordenado de claves normalizadas con bisect: un prefijo es un rango
+    contiguo [bisect_left(p), bisect_left(p + FIN_PREFIJO)). Cada entidad aparece
+    una vez por palabra significativa de su nombre.
+    """
+
+    def __init__(self, generacion, entidades):
+        self.generacion = generacion
+        self.entidades = {}
+        self.claves = []
+        self.refs = []
+        for ref, entidad in entidades.items():
+            self.entidades[ref] = entidad
+            for clave in claves_nombre(entidad[0]):
+                self.claves.append(clave)
+                self.refs.append(ref)
+        orden = sorted(range(len(self.claves)), key=lambda i: (self.claves[i], self.refs[i]))
+        self.claves = [self.claves[i] for i in orden]
+        self.refs = [self.refs[i] for i in orden]
+
+    def copia(self, generacion):
+        nuevo = IndicePrefijos.__new__(IndicePrefijos)
+        nuevo.generacion = generacion
+        nuevo.entidades = dict(self.entidades)
+        nuevo.claves = list(self.claves)
+        nuevo.refs = list(self.refs)
+        return nuevo
+
+    def quitar(self, ref):
+        entidad = self.entidades.pop(ref, None)
+        if entidad is None:
+            return
+        for clave in claves_nombre(entidad[0]):
+            i = bisect_left(self.claves, clave)
+            while i < len(self.claves) and self.claves[i] == clave:
+                if self.refs[i] == ref:
+                    del self.claves[i]
+                    del self.refs[i]
+                    break
+                i += 1
+
+    def agregar(self, ref, entidad):
+        self.quitar(ref)
+        self.entidades[ref] = entidad
+        for clave in claves_nombre(entidad[0]):
+            i = bisect_left(self.claves, clave)
+            self.claves.insert(i, clave)
+            self.refs.insert(i, ref)
+
+    def sugerir(self, texto, k=SUGERENCIAS_POR_DEFECTO):
+        """Las k entidades más populares con alguna clave que empiece con el texto."""
+        prefijo = prefijo_consulta(texto)
+        if not prefijo:
+            return []
+        desde = bisect_left(self.claves, prefijo)
+        hasta = bisect_left(self.claves, prefijo + FIN_PREFIJO, desde)
+        candidatos = dict.fromkeys(self.refs[desde:hasta])
+        mejores = heapq.nsmallest(
+            k, candidatos,
+            key=lambda ref: (-self.entidades[ref][1], len(self.entidades[ref][0]), self.entidades[ref][0]),
+        )
+        return [
+            {'tipo': tipo, 'id': objeto_id, 'nombre': self.entidades[(tipo, objeto_id)][0],
+             'url': self.entidades[(tipo, objeto_id)][2]}
+            for tipo, objeto_id in mejores
+        ]
+
+
+_indice = None
+_lock = threading.Lock()
+
+
+def indice_prefijos() -> IndicePrefijos:
+    """
+    Índice vigente del proceso. Los cambios hechos en este proceso se aplican
+    de forma incremental (actualizar_entidades); si la generación del catálogo
+    cambió por otra vía, se reconstruye entero desde el catálogo.
+    """
+    global _indice
+    cat = catalogo()
+    actual = _indice
+    if actual is not None and actual.generacion == cat.generacion:
+        return actual
+    with _lock:
+        if _indice is None or _indice.generacion != cat.generacion:
+            _indice = IndicePrefijos(cat.generacion, entidades_catalogo(cat))
+        return _indice
+
+
+def actualizar_entidades(refs, generacion_previa, generacion_nueva):
+    """
+    Recalcula solo las entidades (tipo, id) afectadas por un cambio ya confirmado.
+    El parche vale únicamente si el índice está en la generación de justo antes
+    del cambio; si no (otro worker cambió el catálogo), se reconstruye entero.
+    Se modifica una copia y se publica al final: las lecturas en curso no ven
+    el índice a medio actualizar.
+    """
+    global _indice
+    with _lock:
+        if _indice is None:
+            return
+        cat = catalogo()
+        if _indice.generacion != generacion_previa:
+            _indice = IndicePrefijos(cat.generacion, entidades_catalogo(cat))
+            return
+        armadores = {
+            'recorrido': (cat.recorridos, entidad_recorrido),
+            'parada': (cat.paradas, entidad_parada),
+            'atractivo': (cat.atractivos, entidad_atractivo),
+        }
+        nuevo = _indice.copia(generacion_nueva)
+        for tipo, objeto_id in refs:
+            objetos, armar = armadores[tipo]
+            objeto = objetos.get(objeto_id)
+            if objeto is None:
+                nuevo.quitar((tipo, objeto_id))
+            else:
+                nuevo.agregar((tipo, objeto_id), armar(objeto))
+        _indice = nuevo
+
+
+def sugerencias(texto, k=SUGERENCIAS_POR_DEFECTO):
+    return indice_prefijos().sugerir(texto, k)
@@ -0,0 +1,312 @@
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+from django.urls import reverse
+
+from .models import Atractivo, Parada, Recorrido
+from .services_catalogo import catalogo
+
+TABLA_BUSQUEDA = 'busturistico_busqueda'
+RESULTADOS_POR_PAGINA = 10
+# Una coincidencia en el nombre pesa más que una en la descripción
+PESO_TITULO = 10.0
+PESO_CUERPO = 1.0
+
+# tipo -> (código para el rowid, modelo, campos del título, campos del cuerpo)
+DOCUMENTOS = {
+    'recorrido': (1, Recorrido, ('color_recorrido',), ('descripcion_recorrido',)),
+    'parada': (2, Parada, ('nombre_parada',), ('direccion_parada', 'descripcion_parada')),
+    'atractivo': (3, Atractivo, ('nombre_atractivo',), ('descripcion_atractivo',)),
+}
+TIPO_POR_MODELO = {modelo: tipo for tipo, (_, modelo, _, _) in DOCUMENTOS.items()}
+ROWID_POR_TIPO = 1_000_000_000
+
+PALABRAS_VACIAS = frozenset(
+    'a al con de del el en es la las lo los o para por que se su sus un una y'.split()
+)
+# Sufijos flexivos y derivativos frecuentes en español, del más largo al más corto
+SUFIJOS = (
+    'amientos', 'imientos', 'amiento', 'imiento', 'aciones', 'uciones', 'adoras', 'adores',
+    'ancias', 'encias', 'idades', 'mente', 'acion', 'ucion', 'adora', 'ador', 'ancia', 'encia',
+    'idad', 'ivas', 'ivos', 'osas', 'osos', 'iva', 'ivo', 'osa', 'oso', 'es', 'as', 'os', 'a', 'o', 'e', 's',
+)
+LARGO_MINIMO_RAIZ = 3
+
+
+def plegar(texto):
+    """Minúsculas y sin tildes ni diéresis: 'Ñandú Güemes' -> 'nandu guemes'."""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def raiz(palabra):
+    """Stemmer liviano: quita el primer sufijo que deje una raíz de al menos tres letras."""
+    for sufijo in SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= LARGO_MINIMO_RAIZ:
+            return palabra[:-len(sufijo)]
+    return palabra
+
+
+def terminos(texto):
+    return [raiz(palabra) for palabra in re.findall(r'[a-z0-9]+', plegar(texto)) if palabra not in PALABRAS_VACIAS]
+
+
+def normalizar(texto):
+    return ' '.join(terminos(texto))
+
+
+def texto_documento(objeto, campos):
+    return normalizar(' '.join(str(getattr(objeto, campo) or '') for campo in campos))
+
+
+class IndiceSqlite:
+    """Tabla virtual FTS5; el rowid codifica tipo y id para actualizar sin escanear."""
+
+    def crear(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_BUSQUEDA} USING fts5("
+            "tipo UNINDEXED, objeto_id UNINDEXED, titulo, cuerpo, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    def eliminar_tabla(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLA_BUSQUEDA}")
+
+    def guardar(self, cursor, tipo, objeto_id, titulo, cuerpo):
+        rowid = DOCUMENTOS[tipo][0] * ROWID_POR_TIPO + objeto_id
+        cursor.execute(f"DELETE FROM {TABLA_BUSQUEDA} WHERE rowid = %s", [rowid])
+        cursor.execute(
+            f"INSERT INTO {TABLA_BUSQUEDA} (rowid, tipo, objeto_id, titulo, cuerpo) VALUES (%s, %s, %s, %s, %s)",
+            [rowid, tipo, objeto_id, titulo, cuerpo],
+        )
+
+    def eliminar(self, cursor, tipo, objeto_id):
+        cursor.execute(
+            f"DELETE FROM {TABLA_BUSQUEDA} WHERE rowid = %s", [DOCUMENTOS[tipo][0] * ROWID_POR_TIPO + objeto_id]
+        )
+
+    def vaciar(self, cursor):
+        cursor.execute(f"DELETE FROM {TABLA_BUSQUEDA}")
+
+    def consulta(self, raices):
+        # Cada término como prefijo: "muse"* encuentra museo, museos, museística...
+        match = ' '.join(f'"{termino}"*' for termino in raices)
+        desde = f"FROM {TABLA_BUSQUEDA} WHERE {TABLA_BUSQUEDA} MATCH %s"
+        orden = f"ORDER BY bm25({TABLA_BUSQUEDA}, 0, 0, {PESO_TITULO}, {PESO_CUERPO})"
+        return desde, orden, [match]
+
+
+class IndicePostgres:
+    """
+    Tabla con tsvector ponderado e índice GIN. El texto ya llega plegado y con
+    raíces desde Python, así que se usa la configuración 'simple' (sin unaccent).
+    """
+
+    def crear(self, cursor):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABLA_BUSQUEDA} ("
+            "tipo varchar(20) NOT NULL, objeto_id bigint NOT NULL, documento tsvector NOT NULL, "
+            "PRIMARY KEY (tipo, objeto_id))"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {TABLA_BUSQUEDA}_documento ON {TABLA_BUSQUEDA} USING GIN (documento)"
+        )
+
+    def eliminar_tabla(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLA_BUSQUEDA}")
+
+    def guardar(self, cursor, tipo, objeto_id, titulo, cuerpo):
+        cursor.execute(
+            f"INSERT INTO {TABLA_BUSQUEDA} (tipo, objeto_id, documento) VALUES (%s, %s, "
+            "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'D')) "
+            "ON CONFLICT (tipo, objeto_id) DO UPDATE SET documento = EXCLUDED.documento",
+            [tipo, objeto_id, titulo, cuerpo],
+        )
+
+    def eliminar(self, cursor, tipo, objeto_id):
+        cursor.execute(f"DELETE FROM {TABLA_BUSQUEDA} WHERE tipo = %s AND objeto_id = %s", [tipo, objeto_id])
+
+    def vaciar(self, cursor):
+        cursor.execute(f"TRUNCATE {TABLA_BUSQUEDA}")
+
+    def consulta(self, raices):
+        query = ' & '.join(f"{termino}:*" for termino in raices)
+        pesos = f"'{{{PESO_CUERPO / PESO_TITULO}, 0, 0, 1.0}}'::float4[]"
+        desde = f"FROM {TABLA_BUSQUEDA} WHERE documento @@ to_tsquery('simple', %s)"
+        orden = f"ORDER BY ts_rank({pesos}, documento, to_tsquery('simple', %s)) DESC"
+        return desde, orden, [query, query]
+
+
+INDICES = {'sqlite': IndiceSqlite, 'postgresql': IndicePostgres}
+
+
+def indice(conexion=None):
+    """Implementación del índice para el motor de la conexión, o None si no hay soporte."""
+    clase = INDICES.get((conexion or connection).vendor)
+    return clase() if clase else None
+
+
+def crear_indice(conexion=None):
+    conexion = conexion or connection
+    motor = indice(conexion)
+    if motor:
+        with conexion.cursor() as cursor:
+            motor.crear(cursor)
+
+
+def eliminar_indice(conexion=None):
+    conexion = conexion or connection
+    motor = indice(conexion)
+    if motor:
+        with conexion.cursor() as cursor:
+            motor.eliminar_tabla(cursor)
+
+
+def indexar(objeto, conexion=None):
+    """Alta o actualización del documento de un recorrido, parada o atractivo."""
+    conexion = conexion or connection
+    motor = indice(conexion)
+    tipo = TIPO_POR_MODELO.get(type(objeto))
+    if motor is None or tipo is None:
+        return
+    _, _, campos_titulo, campos_cuerpo = DOCUMENTOS[tipo]
+    with conexion.cursor() as cursor:
+        motor.guardar(
+            cursor, tipo, objeto.pk, texto_documento(objeto, campos_titulo), texto_documento(objeto, campos_cuerpo)
+        )
+
+
+def desindexar(modelo, objeto_id, conexion=None):
+    conexion = conexion or connection
+    motor = indice(conexion)
+    tipo = TIPO_POR_MODELO.get(modelo)
+    if motor is None or tipo is None:
+        return
+    with conexion.cursor() as cursor:
+        motor.eliminar(cursor, tipo, objeto_id)
+
+
+def reconstruir_indice(modelos=None, conexion=None):
+    """
+    Vuelve a indexar todo. `modelos` permite pasar los modelos históricos desde
+    una migración ({'recorrido': Recorrido, ...}). Devuelve los documentos indexados.
+    """
+    conexion = conexion or connection
+    motor = indice(conexion)
+    if motor is None:
+        return 0
+    total = 0
+    with conexion.cursor() as cursor:
+        motor.vaciar(cursor)
+        for tipo, (_, modelo, campos_titulo, campos_cuerpo) in DOCUMENTOS.items():
+            modelo = (modelos or {}).get(tipo, modelo)
+            for objeto in modelo.objects.using(conexion.alias).only('pk', *campos_titulo, *campos_cuerpo):
+                motor.guardar(
+                    cursor, tipo, objeto.pk,
+                    texto_documento(objeto, campos_titulo), texto_documento(objeto, campos_cuerpo),
+                )
+                total += 1
+    return total
+
+
+class Resultado:
+    __slots__ = ('tipo', 'objeto', 'url')
+
+    def __init__(self, tipo, objeto, url):
+        self.tipo = tipo
+        self.objeto = objeto
+        self.url = url
+
+
+def _url(tipo, objeto):
+    if tipo == 'recorrido':
+        return reverse('usuario-detalle-recorrido', args=[objeto.pk])
+    if tipo == 'parada':
+        return reverse('usuario-detalle-parada', args=[objeto.pk])
+    # Los atractivos no tienen página propia: se enlaza la parada más cercana del catálogo
+    atractivo = catalogo().atractivos.get(objeto.pk)
+    if atractivo and atractivo.paradas:
+        return reverse('usuario-detalle-parada', args=[atractivo.paradas[0].id])
+    return None
+
+
+def _resultados(filas):
+    """(tipo, id) ordenados -> Resultado con el objeto cargado (una consulta por tipo)."""
+    ids_por_tipo = {}
+    for tipo, objeto_id in filas:
+        ids_por_tipo.setdefault(tipo, []).append(objeto_id)
+    objetos = {
+        tipo: DOCUMENTOS[tipo][1].objects.in_bulk(ids)
+        for tipo, ids in ids_por_tipo.items()
+    }
+    resultados = []
+    for tipo, objeto_id in filas:
+        objeto = objetos[tipo].get(objeto_id)
+        if objeto is not None:
+            resultados.append(Resultado(tipo, objeto, _url(tipo, objeto)))
+    return resultados
+
+
+class ResultadosBusqueda:
+    """
+    Resultados rankeados, evaluados de a una página: count() y el slice que pide
+    el Paginator se traducen en COUNT y LIMIT/OFFSET sobre el índice.
+    """
+
+    def __init__(self, motor, raices):
+        self.motor = motor
+        self.raices = raices
+        self._total = None
+
+    def count(self):
+        if self._total is None:
+            if not self.raices:
+                self._total = 0
+            else:
+                desde, _, params = self.motor.consulta(self.raices)
+                with connection.cursor() as cursor:
+                    cursor.execute(f"SELECT COUNT(*) {desde}", params[:1])
+                    self._total = cursor.fetchone()[0]
+        return self._total
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        inicio = item.start or 0
+        fin = self.count() if item.stop is None else item.stop
+        if not self.raices or fin <= inicio:
+            return []
+        desde, orden, params = self.motor.consulta(self.raices)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT tipo, objeto_id {desde} {orden} LIMIT %s OFFSET %s",
+                params + [fin - inicio, inicio],
+            )
+            return _resultados(cursor.fetchall())
+
+
+def _buscar_sin_indice(texto):
+    """Motores sin índice de texto: búsqueda por icontains, sin ranking."""
+    resultados = []
+    filtros = {
+        'recorrido': Q(color_recorrido__icontains=texto) | Q(descripcion_recorrido__icontains=texto),
+        'parada': Q(nombre_parada__icontains=texto) | Q(direccion_parada__icontains=texto),
+        'atractivo': Q(nombre_atractivo__icontains=texto) | Q(descripcion_atractivo__icontains=texto),
+    }
+    for tipo, filtro in filtros.items():
+        for objeto in DOCUMENTOS[tipo][1].objects.filter(filtro).order_by('pk'):
+            resultados.append(Resultado(tipo, objeto, _url(tipo, objeto)))
+    return resultados
+
+
+def buscar(texto):
+    """Resultados para el Paginator, del más al menos relevante."""
+    motor = indice()
+    if motor is None:
+        return _buscar_sin_indice(texto)
+    return ResultadosBusqueda(motor, terminos(texto))
@@ -0,0 +1,83 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+
+from .models import Atractivo, Parada, ParadaAtractivo, Precio, Recorrido, RecorridoParada, RutaRecorrido
+
+# Modelos del catálogo público: cualquier alta, baja o modificación invalida
+# las páginas y fragmentos que dependen de ellos
+MODELOS_CATALOGO = (Recorrido, Parada, RecorridoParada, Atractivo, ParadaAtractivo, Precio)
+# Además del catálogo, los tiempos entre paradas salen de la ruta trazada
+MODELOS_CON_TIEMPOS = MODELOS_CATALOGO + (RutaRecorrido,)
+
+# Las versiones viejas no se borran: expiran solas
+CACHE_PAGINAS_TIMEOUT = 24 * 3600
+
+
+def _clave_generacion(modelo):
+    return f"generacion:{modelo._meta.label_lower}"
+
+
+def generacion(*modelos) -> str:
+    """
+    Versión combinada de los modelos indicados. Si un contador no existe (o el
+    cache lo descartó) arranca en un valor basado en el reloj, para no repetir
+    una versión ya usada por entradas viejas.
+    """
+    claves = [_clave_generacion(modelo) for modelo in modelos]
+    valores = cache.get_many(claves)
+    for clave in claves:
+        if clave not in valores:
+            cache.add(clave, time.time_ns() // 1000, None)
+            valores[clave] = cache.get(clave)
+    return '.'.join(str(valores[clave]) for clave in claves)
+
+
+def incrementar_generacion(modelo):
+    """
+    Sube el contador del modelo. En backends sin incr propio (FileBasedCache)
+    BaseCache.incr es get + set con el timeout por defecto, así que después se
+    lo vuelve a dejar sin vencimiento con touch (que conserva el valor). Ese
+    get + set no es atómico: dos incrementos simultáneos pueden dar el mismo
+    valor. La generación igual cambia, pero una página cacheada entre ambos
+    cambios queda vigente hasta el próximo incremento o su timeout; con
+    Redis/Memcached el incr es atómico.
+    """
+    clave = _clave_generacion(modelo)
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.add(clave, time.time_ns() // 1000, None)
+    else:
+        cache.touch(clave, None)
+
+
+def generacion_anterior(generacion_combinada, modelo, modelos):
+    """
+    La generación combinada de `modelos` tal como estaba antes del último
+    incremento de `modelo`: su contador menos uno, los demás iguales.
+    """
+    valores = generacion_combinada.split('.')
+    posicion = modelos.index(modelo)
+    valores[posicion] = str(int(valores[posicion]) - 1)
+    return '.'.join(valores)
+
+
+def clave_por_generacion(nombre, modelos):
+    return f"{nombre}:g{generacion(*modelos)}"
+
+
+def cacheado_por_generacion(nombre, modelos, calcular, timeout=CACHE_PAGINAS_TIMEOUT):
+    """Devuelve calcular() cacheado bajo `nombre` hasta que cambie alguno de los modelos."""
+    clave = clave_por_generacion(nombre, modelos)
+    valor = cache.get(clave)
+    if valor is None:
+        valor = calcular()
+        cache.set(clave, valor, timeout)
+    return valor
+
+
+def clave_pagina(vista, ruta, extra=''):
+    digest = hashlib.md5(f"{ruta}|{extra}".encode()).hexdigest()
+    return f"pagina:{vista}:{digest}"
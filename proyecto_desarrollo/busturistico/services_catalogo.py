@@ -0,0 +1,133 @@
+import threading
+
+from django.db.models import F
+
+from .models import Atractivo, Parada, ParadaAtractivo, Recorrido, RecorridoParada
+from .services_cache import MODELOS_CATALOGO, generacion
+
+
+class RecorridoCatalogo:
+    __slots__ = ('id', 'color_recorrido', 'duracion_aproximada_recorrido', 'descripcion_recorrido',
+                 'paradas', 'ordenes')
+
+    def __init__(self, recorrido):
+        self.id = recorrido.id
+        self.color_recorrido = recorrido.color_recorrido
+        self.duracion_aproximada_recorrido = recorrido.duracion_aproximada_recorrido
+        self.descripcion_recorrido = recorrido.descripcion_recorrido
+        # Se completan al armar el catálogo, ya ordenadas por `orden`
+        self.paradas = ()
+        self.ordenes = ()
+
+    def __str__(self):
+        return f"Recorrido {self.id} - {self.color_recorrido}"
+
+
+class ParadaCatalogo:
+    __slots__ = ('id', 'nombre_parada', 'direccion_parada', 'latitud_parada', 'longitud_parada',
+                 'recorridos', 'atractivos')
+
+    def __init__(self, parada):
+        self.id = parada.id
+        self.nombre_parada = parada.nombre_parada
+        self.direccion_parada = parada.direccion_parada
+        self.latitud_parada = parada.latitud_parada
+        self.longitud_parada = parada.longitud_parada
+        # (recorrido_id, orden) de cada pasada de un recorrido por esta parada
+        self.recorridos = ()
+        self.atractivos = ()
+
+    def __str__(self):
+        return self.nombre_parada
+
+
+class AtractivoCatalogo:
+    __slots__ = ('id', 'nombre_atractivo', 'calificacion_estrellas', 'latitud_atractivo',
+                 'longitud_atractivo', 'paradas')
+
+    def __init__(self, atractivo):
+        self.id = atractivo.id
+        self.nombre_atractivo = atractivo.nombre_atractivo
+        self.calificacion_estrellas = atractivo.calificacion_estrellas
+        self.latitud_atractivo = atractivo.latitud_atractivo
+        self.longitud_atractivo = atractivo.longitud_atractivo
+        self.paradas = ()
+
+    def __str__(self):
+        return self.nombre_atractivo
+
+
+class Catalogo:
+    """
+    Foto de solo lectura de recorridos, paradas y atractivos con sus relaciones
+    resueltas e indexadas por id. Nunca se modifica: cuando cambian los datos se
+    arma una nueva y se reemplaza la referencia.
+    """
+    __slots__ = ('generacion', 'recorridos', 'paradas', 'atractivos')
+
+    def __init__(self, generacion_catalogo):
+        self.generacion = generacion_catalogo
+
+        self.recorridos = {r.id: RecorridoCatalogo(r) for r in Recorrido.objects.order_by('id')}
+        self.paradas = {p.id: ParadaCatalogo(p) for p in Parada.objects.order_by('nombre_parada')}
+        self.atractivos = {a.id: AtractivoCatalogo(a) for a in Atractivo.objects.order_by('nombre_atractivo')}
+
+        paradas_por_recorrido = {}
+        recorridos_por_parada = {}
+        for recorrido_id, parada_id, orden in (
+            RecorridoParada.objects.order_by('recorrido_id', 'orden').values_list('recorrido_id', 'parada_id', 'orden')
+        ):
+            paradas_por_recorrido.setdefault(recorrido_id, []).append((orden, parada_id))
+            recorridos_por_parada.setdefault(parada_id, []).append((recorrido_id, orden))
+
+        atractivos_por_parada = {}
+        paradas_por_atractivo = {}
+        # Las paradas de cada atractivo quedan de la más cercana a la más lejana
+        for parada_id, atractivo_id in ParadaAtractivo.objects.order_by(
+            F('distancia_m').asc(nulls_last=True), 'id'
+        ).values_list('parada_id', 'atractivo_id'):
+            atractivos_por_parada.setdefault(parada_id, []).append(atractivo_id)
+            paradas_por_atractivo.setdefault(atractivo_id, []).append(parada_id)
+
+        for recorrido in self.recorridos.values():
+            paradas = paradas_por_recorrido.get(recorrido.id, [])
+            recorrido.paradas = tuple(self.paradas[parada_id] for _, parada_id in paradas)
+            recorrido.ordenes = tuple(orden for orden, _ in paradas)
+        for parada in self.paradas.values():
+            parada.recorridos = tuple(recorridos_por_parada.get(parada.id, ()))
+            parada.atractivos = tuple(
+                sorted((self.atractivos[a] for a in atractivos_por_parada.get(parada.id, ())),
+                       key=lambda atractivo: atractivo.nombre_atractivo)
+            )
+        for atractivo in self.atractivos.values():
+            atractivo.paradas = tuple(self.paradas[p] for p in paradas_por_atractivo.get(atractivo.id, ()))
+
+    def recorridos_con_paradas(self):
+        return [recorrido for recorrido in self.recorridos.values() if recorrido.paradas]
+
+    def recorridos_de_parada(self, parada_id):
+        parada = self.paradas.get(parada_id)
+        if parada is None:
+            return []
+        ids = dict.fromkeys(recorrido_id for recorrido_id, _ in parada.recorridos)
+        return [self.recorridos[recorrido_id] for recorrido_id in ids]
+
+
+_catalogo = None
+_lock = threading.Lock()
+
+
+def catalogo() -> Catalogo:
+    """
+    Catálogo vigente del proceso. Solo se consulta el cache para comparar la
+    generación; si cambió, un único hilo arma la foto nueva y la publica.
+    """
+    global _catalogo
+    generacion_actual = generacion(*MODELOS_CATALOGO)
+    actual = _catalogo
+    if actual is not None and actual.generacion == generacion_actual:
+        return actual
+    with _lock:
+        if _catalogo is None or _catalogo.generacion != generacion_actual:
+            _catalogo = Catalogo(generacion_actual)
+        return _catalogo
@@ -0,0 +1,355 @@
+import csv
+import io
+import logging
+import multiprocessing
+import os
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Chofer, UbicacionColectivo, Viaje
+from .services_busqueda import plegar
+from .services_catalogo import catalogo
+
+logger = logging.getLogger(__name__)
+
+# Vida máxima de la identidad cacheada; los cambios en Chofer/User la invalidan antes
+CHOFER_CACHE_TIMEOUT = 300
+
+# Columna del archivo -> campo de Chofer (los encabezados se comparan sin tildes ni mayúsculas)
+COLUMNAS_IMPORTACION = {
+    'nombre': 'nombre_chofer',
+    'apellido': 'apellido_chofer',
+    'legajo': 'legajo_chofer',
+    'dni': 'dni_chofer',
+    'telefono': 'telefono',
+    'fecha ingreso': 'fecha_ingreso',
+    'activo': 'activo',
+}
+COLUMNAS_OBLIGATORIAS = ('nombre', 'apellido', 'legajo', 'dni', 'telefono', 'fecha ingreso')
+FORMATOS_FECHA = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y')
+VALORES_FALSOS = ('0', 'no', 'false', 'falso', 'n', 'inactivo')
+# Filas por bulk_create (y por transacción)
+TAMANO_LOTE = 200
+# Debajo de esta cantidad de contraseñas no vale la pena levantar procesos
+MINIMO_PARA_POOL = 20
+# Tope de procesos cuando no se indica cuántos (no uno por CPU en un servidor compartido)
+PROCESOS_MAXIMOS = 4
+# Importación desde el panel: corre dentro de una request, se usan pocos procesos
+PROCESOS_WEB = 2
+
+
+def _clave_chofer(user_id):
+    return f"chofer:usuario:{user_id}"
+
+
+def chofer_activo(user):
+    """
+    Chofer activo asociado al usuario, o None. Se cachea por id de usuario: las
+    requests del chofer (una por posición GPS) no vuelven a consultarlo.
+    """
+    clave = _clave_chofer(user.pk)
+    chofer = cache.get(clave)
+    if chofer is None:
+        chofer = Chofer.objects.filter(user_id=user.pk, activo=True).first()
+        if chofer is not None:
+            cache.set(clave, chofer, CHOFER_CACHE_TIMEOUT)
+    return chofer
+
+
+def invalidar_chofer(user_id):
+    if user_id is not None:
+        cache.delete(_clave_chofer(user_id))
+
+
+@dataclass
+class ResultadoImportacion:
+    creados: list = field(default_factory=list)
+    # (número de fila en el archivo, mensaje)
+    errores: list = field(default_factory=list)
+
+    def error(self, fila, mensaje):
+        self.errores.append((fila, mensaje))
+
+
+def _normalizar_encabezado(texto):
+    return ' '.join(plegar(str(texto or '')).replace('_', ' ').split())
+
+
+def leer_filas(archivo, nombre):
+    """
+    (número de fila, {columna: valor}) de un CSV (',' o ';') o XLSX. Los
+    encabezados se normalizan: 'Fecha_Ingreso' y 'fecha ingreso' son la misma columna.
+    """
+    if nombre.lower().endswith('.xlsx'):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:  # opcional: sin el paquete solo se aceptan CSV
+            raise ValueError("Para importar XLSX hay que instalar openpyxl (o exportar el archivo como CSV).")
+        hoja = load_workbook(archivo, read_only=True, data_only=True).active
+        filas = hoja.iter_rows(values_only=True)
+    else:
+        texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+        muestra = texto.read(4096)
+        texto.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=',;')
+        except csv.Error:
+            dialecto = csv.excel
+        filas = csv.reader(texto, dialecto)
+
+    encabezados = None
+    for numero, fila in enumerate(filas, start=1):
+        if encabezados is None:
+            encabezados = [_normalizar_encabezado(celda) for celda in fila]
+            faltantes = [columna for columna in COLUMNAS_OBLIGATORIAS if columna not in encabezados]
+            if faltantes:
+                raise ValueError(f"Faltan columnas: {', '.join(faltantes)}.")
+            continue
+        if not any(celda not in (None, '') for celda in fila):
+            continue
+        yield numero, dict(zip(encabezados, fila))
+
+
+def _fecha(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(str(valor).strip(), formato).date()
+        except ValueError:
+            continue
+    raise ValidationError({'fecha_ingreso': f"Fecha inválida: {valor}."})
+
+
+def chofer_desde_fila(fila):
+    """Chofer sin guardar, validado campo por campo (la unicidad se controla en lote)."""
+    datos = {}
+    for columna, campo in COLUMNAS_IMPORTACION.items():
+        valor = fila.get(columna)
+        datos[campo] = str(valor).strip() if isinstance(valor, (str, int)) and not isinstance(valor, bool) else valor
+    # Excel guarda los números como float: 30123456.0 -> '30123456'
+    for campo in ('legajo_chofer', 'dni_chofer', 'telefono'):
+        if isinstance(datos[campo], float) and datos[campo].is_integer():
+            datos[campo] = str(int(datos[campo]))
+    datos['fecha_ingreso'] = _fecha(datos['fecha_ingreso'])
+    activo = datos['activo']
+    datos['activo'] = activo in (None, '') or activo is True or (
+        activo is not False and plegar(str(activo)).strip() not in VALORES_FALSOS
+    )
+    chofer = Chofer(**datos)
+    chofer.full_clean(exclude=['user'], validate_unique=False, validate_constraints=False)
+    return chofer
+
+
+def hashear_contrasena(texto):
+    return make_password(texto)
+
+
+def hashear_contrasenas(textos, procesos=None):
+    """
+    PBKDF2 es CPU puro a propósito: con cientos de contraseñas se reparte en
+    procesos (los hilos no sirven por el GIL). Devuelve los hashes en el mismo orden.
+    Los procesos se lanzan con spawn (no heredan hilos ni conexiones del padre)
+    y cargan Django al arrancar; si el pool no se puede usar, se hashea en serie.
+    """
+    procesos = procesos or min(os.cpu_count() or 1, PROCESOS_MAXIMOS)
+    if len(textos) < MINIMO_PARA_POOL or procesos == 1:
+        return [make_password(texto) for texto in textos]
+    try:
+        with ProcessPoolExecutor(
+            max_workers=procesos, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+        ) as pool:
+            return list(pool.map(hashear_contrasena, textos, chunksize=16))
+    except (BrokenProcessPool, OSError) as exc:
+        logger.warning("No se pudo hashear en paralelo (%s); se sigue en un solo proceso.", exc)
+        return [make_password(texto) for texto in textos]
+
+
+def _mensaje(exc):
+    if isinstance(exc, ValidationError) and hasattr(exc, 'message_dict'):
+        return '; '.join(f"{campo}: {' '.join(mensajes)}" for campo, mensajes in exc.message_dict.items())
+    return '; '.join(getattr(exc, 'messages', [str(exc)]))
+
+
+def _crear_lote(lote, resultado):
+    """Crea usuarios y choferes del lote; si el lote choca con la base, se reintenta fila por fila."""
+    try:
+        with transaction.atomic():
+            _insertar(lote)
+    except IntegrityError:
+        for elemento in lote:
+            try:
+                with transaction.atomic():
+                    _insertar([elemento])
+            except IntegrityError as exc:
+                resultado.error(elemento[0], f"No se pudo guardar: {exc}")
+            else:
+                resultado.creados.append(elemento[1].legajo_chofer)
+        return
+    resultado.creados.extend(chofer.legajo_chofer for _, chofer, _ in lote)
+
+
+def _insertar(lote):
+    for _, chofer, usuario in lote:
+        # Un intento anterior revertido pudo dejarles pk: se insertan siempre como nuevos
+        chofer.pk = None
+        if usuario is not None:
+            usuario.pk = None
+    con_usuario = [(chofer, usuario) for _, chofer, usuario in lote if usuario is not None]
+    User.objects.bulk_create([usuario for _, usuario in con_usuario])
+    for chofer, usuario in con_usuario:
+        chofer.user = usuario
+    # bulk_create no pasa por Chofer.save: el User ya quedó creado arriba
+    Chofer.objects.bulk_create([chofer for _, chofer, _ in lote])
+
+
+def importar_choferes(filas, procesos=None, tamano_lote=TAMANO_LOTE):
+    """
+    Alta masiva de choferes desde filas de leer_filas. Una fila con errores no
+    frena el resto: se reporta con su número y se sigue. Los choferes activos
+    reciben su User (contraseña inicial = DNI), igual que con Chofer.save.
+    """
+    resultado = ResultadoImportacion()
+    validos = []
+    legajos_vistos = {}
+    for numero, fila in filas:
+        try:
+            chofer = chofer_desde_fila(fila)
+        except ValidationError as exc:
+            resultado.error(numero, _mensaje(exc))
+            continue
+        if chofer.legajo_chofer in legajos_vistos:
+            resultado.error(numero, f"Legajo {chofer.legajo_chofer} repetido (fila {legajos_vistos[chofer.legajo_chofer]}).")
+            continue
+        legajos_vistos[chofer.legajo_chofer] = numero
+        validos.append((numero, chofer))
+
+    # Unicidad contra la base: una consulta por tabla para todo el archivo
+    legajos = [chofer.legajo_chofer for _, chofer in validos]
+    existentes = set(Chofer.objects.filter(legajo_chofer__in=legajos).values_list('legajo_chofer', flat=True))
+    usuarios = set(User.objects.filter(
+        username__in=[f"chofer_{legajo}" for legajo in legajos]
+    ).values_list('username', flat=True))
+    pendientes = []
+    for numero, chofer in validos:
+        if chofer.legajo_chofer in existentes:
+            resultado.error(numero, f"Ya existe un chofer con legajo {chofer.legajo_chofer}.")
+        elif chofer.activo and chofer.datos_usuario()['username'] in usuarios:
+            resultado.error(numero, f"Ya existe el usuario {chofer.datos_usuario()['username']}.")
+        else:
+            pendientes.append((numero, chofer))
+
+    activos = [chofer for _, chofer in pendientes if chofer.activo]
+    hashes = iter(hashear_contrasenas([str(chofer.dni_chofer) for chofer in activos], procesos))
+    lote = []
+    for numero, chofer in pendientes:
+        usuario = User(password=next(hashes), **chofer.datos_usuario()) if chofer.activo else None
+        lote.append((numero, chofer, usuario))
+        if len(lote) == tamano_lote:
+            _crear_lote(lote, resultado)
+            lote = []
+    if lote:
+        _crear_lote(lote, resultado)
+    resultado.errores.sort()
+    return resultado
+
+
+def viajes_pendientes(chofer):
+    """
+    (viaje en curso o None, viajes sin iniciar ordenados por fecha y hora) del
+    chofer, en una sola consulta. El viaje en curso trae además la distancia
+    recorrida según su última posición y el índice de paradas de su ruta.
+    """
+    ultima = (
+        UbicacionColectivo.objects
+        .filter(viaje=OuterRef('pk'), distancia_recorrida_m__isnull=False)
+        .order_by('-timestamp_ubicacion')
+        .values('distancia_recorrida_m')[:1]
+    )
+    viajes = (
+        Viaje.objects
+        .filter(chofer=chofer, fecha_hora_fin_real__isnull=True)
+        .select_related('recorrido', 'patente_bus')
+        # Solo el índice de la ruta: la geometría completa no hace falta acá
+        .annotate(distancia=Subquery(ultima), indice_paradas=F('recorrido__ruta__indice_paradas'))
+        .order_by('fecha_programada', 'hora_inicio_programada', 'id')
+    )
+    en_curso = None
+    sin_iniciar = []
+    for viaje in viajes:
+        if viaje.fecha_hora_inicio_real is None:
+            sin_iniciar.append(viaje)
+        elif en_curso is None:
+            en_curso = viaje
+    return en_curso, sin_iniciar
+
+
+def proxima_parada(viaje):
+    """Próxima parada del viaje en curso según su última posición matcheada (o la primera)."""
+    paradas = catalogo().paradas
+    indice = viaje.indice_paradas or {}
+    distancias = indice.get('distancias_m') or []
+    posicion = bisect_right(distancias, viaje.distancia) if viaje.distancia is not None else 0
+    if posicion >= len(distancias) or indice['parada_ids'][posicion] not in paradas:
+        return None
+    parada = paradas[indice['parada_ids'][posicion]]
+    return {
+        'id': parada.id,
+        'nombre': parada.nombre_parada,
+        'orden': indice['ordenes'][posicion],
+        'distancia_m': round(distancias[posicion] - (viaje.distancia or 0.0)),
+    }
+
+
+def _viaje_resumen(viaje):
+    return {
+        'id': viaje.id,
+        'recorrido': {'id': viaje.recorrido_id, 'color': viaje.recorrido.color_recorrido},
+        'bus': {'patente': viaje.patente_bus_id, 'numero_unidad': viaje.patente_bus.numero_unidad},
+        'fecha_programada': viaje.fecha_programada.isoformat(),
+        'hora_inicio_programada': viaje.hora_inicio_programada.strftime('%H:%M'),
+    }
+
+
+def estado_chofer(chofer, ahora=None):
+    """
+    Lo que necesita la app del chofer para su pantalla principal: viaje en
+    curso (tiempo transcurrido y próxima parada) y los viajes asignados de hoy.
+    El tiempo va en minutos para que el estado (y su ETag) no cambie a cada segundo.
+    """
+    ahora = ahora or timezone.now()
+    en_curso, sin_iniciar = viajes_pendientes(chofer)
+    hoy = timezone.localdate(ahora)
+    viaje_en_curso = None
+    if en_curso is not None:
+        viaje_en_curso = {
+            **_viaje_resumen(en_curso),
+            'inicio': en_curso.fecha_hora_inicio_real.isoformat(),
+            'transcurrido_min': int((ahora - en_curso.fecha_hora_inicio_real).total_seconds() // 60),
+            'distancia_recorrida_m': en_curso.distancia,
+            'proxima_parada': proxima_parada(en_curso),
+        }
+    return {
+        'chofer': {
+            'id': chofer.id,
+            'nombre': str(chofer),
+            'legajo': chofer.legajo_chofer,
+        },
+        'viaje_en_curso': viaje_en_curso,
+        # Incluye los de días anteriores que quedaron sin iniciar
+        'asignados': [_viaje_resumen(viaje) for viaje in sin_iniciar if viaje.fecha_programada <= hoy],
+    }
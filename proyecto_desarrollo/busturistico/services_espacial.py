@@ -0,0 +1,363 @@
+import heapq
+import math
+import threading
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Atractivo, Parada, ParadaAtractivo
+from .services_autocompletar import actualizar_entidades
+from .services_cache import MODELOS_CATALOGO, generacion, generacion_anterior, incrementar_generacion
+from .services_catalogo import catalogo
+from .services_ruta import haversine_m, invalidar_geojson, resolver_color
+
+RADIO_CERCANAS_M = 500
+RADIO_MAXIMO_M = 5000
+CERCANAS_POR_DEFECTO = 5
+CERCANAS_MAXIMAS = 50
+# Misma aproximación plana que la grilla de map matching
+METROS_POR_GRADO_LAT = 110540.0
+METROS_POR_GRADO_LNG_ECUADOR = 111320.0
+# Debajo de este zoom los puntos del viewport se agrupan en una grilla
+ZOOM_AGRUPAR = 15
+# Puntos sueltos por capa en ZOOM_AGRUPAR; se duplica con cada nivel de zoom hasta el máximo.
+# Si el viewport tiene más, también se agrupan
+LIMITE_VIEWPORT = 150
+LIMITE_VIEWPORT_MAXIMO = 1000
+# Lado de una celda de la grilla de agrupamiento, en píxeles de pantalla
+CELDA_GRUPO_PX = 64
+# Unos cinco minutos a pie: más lejos, el atractivo ya no es "de la parada"
+RADIO_CAMINATA_M = 400
+# Holgura de la cota plana: la distancia final se confirma con haversine
+HOLGURA_PLANA = 1.01
+
+
+class KDTree:
+    """
+    KD-tree estático de dos dimensiones guardado en un arreglo: cada rango
+    [lo, hi) tiene su nodo en la mediana y alterna el eje (x = lng, y = lat) por
+    nivel. Las coordenadas se proyectan a metros alrededor de la latitud media,
+    suficiente para distancias dentro de una ciudad.
+    """
+
+    def __init__(self, elementos):
+        """elementos: iterable de (lat, lng, valor); se ignoran los que no tienen coordenadas."""
+        elementos = [(lat, lng, valor) for lat, lng, valor in elementos if lat is not None and lng is not None]
+        lat0 = sum(lat for lat, _, _ in elementos) / len(elementos) if elementos else 0.0
+        self.kx = METROS_POR_GRADO_LNG_ECUADOR * math.cos(math.radians(lat0))
+        self.ky = METROS_POR_GRADO_LAT
+        self.puntos = [(lng * self.kx, lat * self.ky, lat, lng, valor) for lat, lng, valor in elementos]
+        self._construir(0, len(self.puntos), 0)
+
+    def __len__(self):
+        return len(self.puntos)
+
+    def _construir(self, lo, hi, eje):
+        if hi - lo <= 1:
+            return
+        self.puntos[lo:hi] = sorted(self.puntos[lo:hi], key=itemgetter(eje))
+        medio = (lo + hi) // 2
+        self._construir(lo, medio, 1 - eje)
+        self._construir(medio + 1, hi, 1 - eje)
+
+    def cercanos(self, lat, lng, radio_m, k):
+        """Hasta k (distancia_m, lat, lng, valor) dentro del radio, del más cercano al más lejano."""
+        if k <= 0 or not self.puntos:
+            return []
+        x, y = lng * self.kx, lat * self.ky
+        limite2 = (radio_m * HOLGURA_PLANA) ** 2
+        mejores = []  # heap de -d2: en la raíz, el peor de los k
+
+        def cota():
+            return limite2 if len(mejores) < k else min(limite2, -mejores[0])
+
+        def buscar_k(lo, hi, eje):
+            if lo >= hi:
+                return
+            medio = (lo + hi) // 2
+            punto = self.puntos[medio]
+            d2 = (punto[0] - x) ** 2 + (punto[1] - y) ** 2
+            if d2 <= cota():
+                if len(mejores) < k:
+                    heapq.heappush(mejores, -d2)
+                else:
+                    heapq.heapreplace(mejores, -d2)
+            delta = (x, y)[eje] - punto[eje]
+            cerca, lejos = ((lo, medio), (medio + 1, hi)) if delta < 0 else ((medio + 1, hi), (lo, medio))
+            buscar_k(*cerca, 1 - eje)
+            # El otro lado solo puede tener algo mejor si el plano de corte cae dentro de la cota
+            if delta * delta <= cota():
+                buscar_k(*lejos, 1 - eje)
+
+        # 1) k-ésima distancia en el plano; 2) todo lo que está dentro de esa cota con
+        # holgura, ordenado por haversine: el error de la proyección no cambia el top k
+        buscar_k(0, len(self.puntos), 0)
+        if not mejores:
+            return []
+        candidatos = self._en_circulo(x, y, min(limite2, cota() * HOLGURA_PLANA ** 2))
+        return self._confirmar(lat, lng, radio_m, candidatos)[:k]
+
+    def en_radio(self, lat, lng, radio_m):
+        """Todos los (distancia_m, lat, lng, valor) dentro del radio, del más cercano al más lejano."""
+        if not self.puntos:
+            return []
+        candidatos = self._en_circulo(lng * self.kx, lat * self.ky, (radio_m * HOLGURA_PLANA) ** 2)
+        return self._confirmar(lat, lng, radio_m, candidatos)
+
+    def _en_circulo(self, x, y, limite2):
+        """Puntos a distancia plana al cuadrado <= limite2 de (x, y)."""
+        candidatos = []
+
+        def recolectar(lo, hi, eje):
+            if lo >= hi:
+                return
+            medio = (lo + hi) // 2
+            punto = self.puntos[medio]
+            if (punto[0] - x) ** 2 + (punto[1] - y) ** 2 <= limite2:
+                candidatos.append(punto)
+            delta = (x, y)[eje] - punto[eje]
+            if delta < 0 or delta * delta <= limite2:
+                recolectar(lo, medio, 1 - eje)
+            if delta >= 0 or delta * delta <= limite2:
+                recolectar(medio + 1, hi, 1 - eje)
+
+        recolectar(0, len(self.puntos), 0)
+        return candidatos
+
+    @staticmethod
+    def _confirmar(lat, lng, radio_m, candidatos):
+        resultado = []
+        for _, _, lat_p, lng_p, valor in candidatos:
+            distancia = haversine_m(lat, lng, lat_p, lng_p)
+            if distancia <= radio_m:
+                resultado.append((distancia, lat_p, lng_p, valor))
+        resultado.sort(key=itemgetter(0))
+        return resultado
+
+    def en_rectangulo(self, sur, oeste, norte, este):
+        """(lat, lng, valor) de los puntos dentro del rectángulo, sin recorrer las ramas de afuera."""
+        minimos = (oeste * self.kx, sur * self.ky)
+        maximos = (este * self.kx, norte * self.ky)
+        encontrados = []
+
+        def visitar(lo, hi, eje):
+            if lo >= hi:
+                return
+            medio = (lo + hi) // 2
+            punto = self.puntos[medio]
+            if minimos[0] <= punto[0] <= maximos[0] and minimos[1] <= punto[1] <= maximos[1]:
+                encontrados.append((punto[2], punto[3], punto[4]))
+            if minimos[eje] <= punto[eje]:
+                visitar(lo, medio, 1 - eje)
+            if maximos[eje] >= punto[eje]:
+                visitar(medio + 1, hi, 1 - eje)
+
+        visitar(0, len(self.puntos), 0)
+        return encontrados
+
+
+class IndicesEspaciales:
+    """KD-trees de paradas y atractivos armados sobre una generación del catálogo."""
+    __slots__ = ('generacion', 'paradas', 'atractivos')
+
+    def __init__(self, cat):
+        self.generacion = cat.generacion
+        self.paradas = KDTree(
+            (parada.latitud_parada, parada.longitud_parada, parada) for parada in cat.paradas.values()
+        )
+        self.atractivos = KDTree(
+            (atractivo.latitud_atractivo, atractivo.longitud_atractivo, atractivo)
+            for atractivo in cat.atractivos.values()
+        )
+
+
+_indices = None
+_lock = threading.Lock()
+
+
+def indices_espaciales() -> IndicesEspaciales:
+    """Índices vigentes: se rearman solo cuando cambia la generación del catálogo."""
+    global _indices
+    cat = catalogo()
+    actual = _indices
+    if actual is not None and actual.generacion == cat.generacion:
+        return actual
+    with _lock:
+        if _indices is None or _indices.generacion != cat.generacion:
+            _indices = IndicesEspaciales(cat)
+        return _indices
+
+
+def paradas_cercanas(lat, lng, radio_m=RADIO_CERCANAS_M, k=CERCANAS_POR_DEFECTO):
+    """Las k paradas más cercanas al punto dentro del radio, con su distancia en metros."""
+    return [
+        {
+            'id': parada.id,
+            'nombre': parada.nombre_parada,
+            'direccion': parada.direccion_parada,
+            'lat': lat_p,
+            'lng': lng_p,
+            'distancia_m': round(distancia, 1),
+            'recorridos': list(dict.fromkeys(recorrido_id for recorrido_id, _ in parada.recorridos)),
+        }
+        for distancia, lat_p, lng_p, parada in indices_espaciales().paradas.cercanos(lat, lng, radio_m, k)
+    ]
+
+
+def limite_viewport(zoom):
+    """Cuántos puntos sueltos por capa se mandan a este zoom (0: siempre agrupar)."""
+    if zoom < ZOOM_AGRUPAR:
+        return 0
+    return min(LIMITE_VIEWPORT * 2 ** (zoom - ZOOM_AGRUPAR), LIMITE_VIEWPORT_MAXIMO)
+
+
+def agrupar(puntos, zoom):
+    """
+    Agrupa (lat, lng, valor) en celdas de CELDA_GRUPO_PX a ese zoom. La grilla
+    está anclada al mundo y no al viewport, así los grupos no saltan al mover el
+    mapa. Devuelve (sueltos, grupos): las celdas de un solo punto quedan sueltas.
+    """
+    if not puntos:
+        return [], []
+    # Web Mercator: a ese zoom un píxel mide 360 / (256 * 2^zoom) grados de longitud
+    celda_lng = CELDA_GRUPO_PX * 360 / (256 * 2 ** zoom)
+    lat_media = sum(lat for lat, _, _ in puntos) / len(puntos)
+    celda_lat = celda_lng * math.cos(math.radians(lat_media))
+    celdas = {}
+    for punto in puntos:
+        celdas.setdefault((math.floor(punto[1] / celda_lng), math.floor(punto[0] / celda_lat)), []).append(punto)
+
+    sueltos, grupos = [], []
+    for miembros in celdas.values():
+        if len(miembros) == 1:
+            sueltos.append(miembros[0])
+            continue
+        grupos.append({
+            'lat': sum(lat for lat, _, _ in miembros) / len(miembros),
+            'lng': sum(lng for _, lng, _ in miembros) / len(miembros),
+            'cantidad': len(miembros),
+        })
+    return sueltos, grupos
+
+
+def capa_viewport(arbol, sur, oeste, norte, este, zoom, serializar):
+    """Puntos de un KD-tree dentro del viewport: sueltos si son pocos, agrupados si no."""
+    puntos = arbol.en_rectangulo(sur, oeste, norte, este)
+    if len(puntos) <= limite_viewport(zoom):
+        sueltos, grupos = puntos, []
+    else:
+        sueltos, grupos = agrupar(puntos, zoom)
+    return {'elementos': [serializar(valor) for _, _, valor in sueltos], 'grupos': grupos}
+
+
+def elementos_viewport(sur, oeste, norte, este, zoom, capas=('paradas', 'atractivos')):
+    """Paradas y atractivos visibles en el rectángulo, listos para el mapa."""
+    cat = catalogo()
+    indices = indices_espaciales()
+    colores = {recorrido.id: resolver_color(recorrido.color_recorrido) for recorrido in cat.recorridos.values()}
+
+    def parada(valor):
+        return {
+            'id': valor.id,
+            'nombre': valor.nombre_parada,
+            'lat': valor.latitud_parada,
+            'lng': valor.longitud_parada,
+            'recorridos': [
+                {'id': recorrido_id, 'orden': orden, 'color': colores.get(recorrido_id)}
+                for recorrido_id, orden in valor.recorridos
+            ],
+        }
+
+    def atractivo(valor):
+        return {
+            'id': valor.id,
+            'nombre': valor.nombre_atractivo,
+            'lat': valor.latitud_atractivo,
+            'lng': valor.longitud_atractivo,
+            'calificacion_estrellas': valor.calificacion_estrellas,
+        }
+
+    resultado = {}
+    if 'paradas' in capas:
+        resultado['paradas'] = capa_viewport(indices.paradas, sur, oeste, norte, este, zoom, parada)
+    if 'atractivos' in capas:
+        resultado['atractivos'] = capa_viewport(indices.atractivos, sur, oeste, norte, este, zoom, atractivo)
+    return resultado
+
+
+def radio_caminata():
+    return getattr(settings, 'RADIO_CAMINATA_ATRACTIVOS_M', RADIO_CAMINATA_M)
+
+
+def vincular_por_cercania(atractivo_ids=None, parada_ids=None, radio_m=None):
+    """
+    Rehace los vínculos automáticos parada-atractivo a menos de radio_m a pie.
+    Sin argumentos recalcula todo; con ids, solo los vínculos de esos atractivos
+    y paradas (los que cambiaron de coordenadas). Los vínculos cargados a mano
+    se conservan y solo se les actualiza la distancia. Devuelve cuántos
+    vínculos automáticos quedaron dentro del alcance recalculado.
+    """
+    radio_m = radio_m or radio_caminata()
+    completo = atractivo_ids is None and parada_ids is None
+    atractivo_ids = set(atractivo_ids or ())
+    parada_ids = set(parada_ids or ())
+
+    atractivos = Atractivo.objects.values_list('latitud_atractivo', 'longitud_atractivo', 'id')
+    paradas = Parada.objects.values_list('latitud_parada', 'longitud_parada', 'id')
+    coordenadas_atractivos = {a_id: (lat, lng) for lat, lng, a_id in atractivos}
+    coordenadas_paradas = {p_id: (lat, lng) for lat, lng, p_id in paradas}
+
+    distancias = {}
+    if completo or atractivo_ids:
+        arbol = KDTree((lat, lng, p_id) for p_id, (lat, lng) in coordenadas_paradas.items())
+        for atractivo_id in (coordenadas_atractivos if completo else atractivo_ids):
+            if atractivo_id not in coordenadas_atractivos:
+                continue
+            lat, lng = coordenadas_atractivos[atractivo_id]
+            for distancia, _, _, parada_id in arbol.en_radio(lat, lng, radio_m):
+                distancias[(parada_id, atractivo_id)] = distancia
+    if parada_ids:
+        arbol = KDTree((lat, lng, a_id) for a_id, (lat, lng) in coordenadas_atractivos.items())
+        for parada_id in parada_ids:
+            if parada_id not in coordenadas_paradas:
+                continue
+            lat, lng = coordenadas_paradas[parada_id]
+            for distancia, _, _, atractivo_id in arbol.en_radio(lat, lng, radio_m):
+                distancias[(parada_id, atractivo_id)] = distancia
+
+    alcance = ParadaAtractivo.objects.all()
+    if not completo:
+        alcance = alcance.filter(atractivo_id__in=atractivo_ids) | alcance.filter(parada_id__in=parada_ids)
+
+    with transaction.atomic():
+        anteriores = set(alcance.values_list('parada_id', 'atractivo_id'))
+        alcance.filter(automatico=True).delete()
+        # Los manuales quedan: solo se recalcula su distancia
+        manuales = list(alcance.filter(automatico=False))
+        for vinculo in manuales:
+            lat_a, lng_a = coordenadas_atractivos[vinculo.atractivo_id]
+            lat_p, lng_p = coordenadas_paradas[vinculo.parada_id]
+            vinculo.distancia_m = haversine_m(lat_a, lng_a, lat_p, lng_p)
+        ParadaAtractivo.objects.bulk_update(manuales, ['distancia_m'], batch_size=500)
+        ParadaAtractivo.objects.bulk_create(
+            [
+                ParadaAtractivo(parada_id=parada_id, atractivo_id=atractivo_id, distancia_m=distancia, automatico=True)
+                for (parada_id, atractivo_id), distancia in distancias.items()
+            ],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+    # bulk_create no dispara post_save: se invalida a mano lo que dependía de los vínculos
+    incrementar_generacion(ParadaAtractivo)
+    invalidar_geojson()
+    afectados = anteriores | set(distancias)
+    nueva = generacion(*MODELOS_CATALOGO)
+    actualizar_entidades(
+        {('parada', parada_id) for parada_id, _ in afectados}
+        | {('atractivo', atractivo_id) for _, atractivo_id in afectados},
+        generacion_anterior(nueva, ParadaAtractivo, MODELOS_CATALOGO),
+        nueva,
+    )
+    return len(distancias)
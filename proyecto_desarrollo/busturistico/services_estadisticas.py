@@ -0,0 +1,40 @@
+from django.db.models import OuterRef, Subquery
+
+from .models import Bus, EstadoBusHistorial
+from .services_cache import cacheado_por_generacion
+from .services_catalogo import catalogo
+
+ESTADO_OPERATIVO = 'Operativo'
+# El estado actual de cada bus sale de su historial: cada alta o baja en él es una nueva versión
+MODELOS_ESTADO_BUSES = (EstadoBusHistorial,)
+
+
+def _estado_actual():
+    return Subquery(
+        EstadoBusHistorial.objects
+        .filter(patente_bus=OuterRef('pk'))
+        .order_by('-fecha_inicio_estado', '-id')
+        .values('estado_bus__nombre_estado')[:1]
+    )
+
+
+def contar_buses_operativos():
+    """Buses cuyo estado actual (último del historial) es Operativo, en una consulta."""
+    return Bus.objects.annotate(estado=_estado_actual()).filter(estado=ESTADO_OPERATIVO).count()
+
+
+def estadisticas_inicio():
+    """
+    Contadores de la página de inicio. Recorridos y paradas salen del catálogo
+    del proceso; los buses operativos se cuentan en la base una vez por versión
+    del historial de estados. Nada se actualiza a mano desde los signals, así
+    que dos workers no pueden pisarse los contadores.
+    """
+    cat = catalogo()
+    return {
+        'total_recorridos': len(cat.recorridos),
+        'total_paradas': len(cat.paradas),
+        'buses_operativos': cacheado_por_generacion(
+            'estadisticas:buses_operativos', MODELOS_ESTADO_BUSES, contar_buses_operativos
+        ),
+    }
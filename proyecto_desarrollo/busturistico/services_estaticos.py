@@ -0,0 +1,139 @@
+import re
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+# Carpeta (dentro de busturistico/static) donde se vendorizan las dependencias de CDN
+CARPETA_VENDOR = 'vendor'
+TIMEOUT_DESCARGA_S = 30
+
+# Assets de terceros con versión fija. 'ruta' es relativa a static/; los recursos
+# referenciados con url() desde las hojas de estilo se descargan junto a ellas.
+ASSETS = {
+    'bootstrap-css': {
+        'url': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css',
+        'ruta': 'vendor/bootstrap/5.3.2/css/bootstrap.min.css',
+    },
+    'bootstrap-js': {
+        'url': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js',
+        'ruta': 'vendor/bootstrap/5.3.2/js/bootstrap.bundle.min.js',
+    },
+    'font-awesome-css': {
+        'url': 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css',
+        'ruta': 'vendor/font-awesome/6.4.0/css/all.min.css',
+    },
+    'bootstrap-icons-css': {
+        'url': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.5/font/bootstrap-icons.css',
+        'ruta': 'vendor/bootstrap-icons/1.10.5/bootstrap-icons.css',
+    },
+    'leaflet-css': {
+        'url': 'https://unpkg.com/leaflet@1.9.4/dist/leaflet.css',
+        'ruta': 'vendor/leaflet/1.9.4/leaflet.css',
+        'integrity': 'sha256-p4NxAoJBhIIN+hmNHrzRCf9tD/miZyoHS5obTRR9BMY=',
+        # Leaflet arma la ruta del ícono por defecto a partir de la hoja de estilo
+        'extras': ['images/marker-icon.png', 'images/marker-icon-2x.png', 'images/marker-shadow.png'],
+    },
+    'leaflet-js': {
+        'url': 'https://unpkg.com/leaflet@1.9.4/dist/leaflet.js',
+        'ruta': 'vendor/leaflet/1.9.4/leaflet.js',
+        'integrity': 'sha256-20nQCchB9co0qIjJZRGuk2/Z9VM+kNiyxNV1lvTlZBo=',
+    },
+}
+
+URL_CSS = re.compile(r"""url\(\s*(['"]?)(?P<ref>[^'")]+)\1\s*\)""")
+# Comentarios de source map (los mismos que reescribe ManifestStaticFilesStorage)
+SOURCE_MAP = {
+    '.css': re.compile(rb"^/\*#[ \t]sourceMappingURL=.*?\*/[ \t]*$\n?", re.MULTILINE),
+    '.js': re.compile(rb"^//#[ \t]sourceMappingURL=.*$\n?", re.MULTILINE),
+}
+
+
+def carpeta_static():
+    return Path(settings.BASE_DIR) / 'busturistico' / 'static'
+
+
+@lru_cache(maxsize=None)
+def esta_vendorizado(ruta):
+    """True si el archivo existe entre los estáticos. Se evalúa una vez por proceso."""
+    return finders.find(ruta) is not None
+
+
+def etiqueta_asset(nombre):
+    """
+    <link>/<script> del asset: la copia local si ya se vendorizó, o el CDN
+    original (con su SRI, si lo tiene) mientras no se haya corrido el build.
+    """
+    asset = ASSETS[nombre]
+    if esta_vendorizado(asset['ruta']):
+        url, integrity = static(asset['ruta']), None
+    else:
+        url, integrity = asset['url'], asset.get('integrity')
+    atributos = format_html(' integrity="{}" crossorigin=""', integrity) if integrity else ''
+    if asset['ruta'].endswith('.css'):
+        return format_html('<link rel="stylesheet" href="{}"{}>', url, atributos)
+    return format_html('<script src="{}"{}></script>', url, atributos)
+
+
+def referencias_css(contenido):
+    """Rutas relativas usadas con url() en una hoja de estilo (sin data: ni URLs absolutas)."""
+    referencias = []
+    for match in URL_CSS.finditer(contenido):
+        ref = match.group('ref').strip()
+        if ref.startswith(('data:', '#', '/')) or urlsplit(ref).scheme:
+            continue
+        ref = urlsplit(ref).path
+        if ref and ref not in referencias:
+            referencias.append(ref)
+    return referencias
+
+
+def sin_source_map(contenido, sufijo):
+    """
+    Quita el comentario sourceMappingURL: los .map no se vendorizan y collectstatic
+    (ManifestStaticFilesStorage) falla si el archivo referenciado no existe.
+    """
+    patron = SOURCE_MAP.get(sufijo)
+    return patron.sub(b'', contenido) if patron else contenido
+
+
+def _descargar(session, url, destino):
+    respuesta = session.get(url, timeout=TIMEOUT_DESCARGA_S)
+    respuesta.raise_for_status()
+    contenido = sin_source_map(respuesta.content, destino.suffix)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    destino.write_bytes(contenido)
+    return contenido
+
+
+def vendorizar(nombre, destino=None, session=None, forzar=False):
+    """
+    Descarga el asset y los recursos que referencia (fuentes, imágenes) respetando
+    la estructura relativa, para que los url() sigan resolviendo. Devuelve las
+    rutas escritas (vacío si ya estaba y no se forzó).
+    """
+    asset = ASSETS[nombre]
+    destino = Path(destino or carpeta_static())
+    session = session or requests.Session()
+    archivo = destino / asset['ruta']
+    if archivo.exists() and not forzar:
+        return []
+
+    contenido = _descargar(session, asset['url'], archivo)
+    escritos = [archivo]
+    relativas = list(asset.get('extras', []))
+    if archivo.suffix == '.css':
+        relativas += [ref for ref in referencias_css(contenido.decode('utf-8')) if ref not in relativas]
+    for relativa in relativas:
+        local = (archivo.parent / relativa).resolve()
+        if not local.is_relative_to(destino.resolve()):
+            raise ValueError(f"{nombre}: la referencia {relativa} sale de la carpeta de estáticos")
+        _descargar(session, urljoin(asset['url'], relativa), local)
+        escritos.append(local)
+    esta_vendorizado.cache_clear()
+    return escritos
@@ -0,0 +1,152 @@
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import UbicacionColectivo, Viaje
+from .services_catalogo import catalogo
+from .services_ruta import obtener_ruta
+
+
+def viajes_en_curso(recorrido_ids, ahora):
+    """Viajes en curso anotados con la distancia de su última posición matcheada."""
+    ultima_ubicacion = (
+        UbicacionColectivo.objects
+        .filter(
+            viaje=OuterRef('pk'),
+            timestamp_ubicacion__lte=ahora,
+            distancia_recorrida_m__isnull=False,
+        )
+        .order_by('-timestamp_ubicacion')
+    )
+    return (
+        Viaje.objects
+        .filter(
+            recorrido_id__in=recorrido_ids,
+            fecha_hora_inicio_real__isnull=False,
+            fecha_hora_fin_real__isnull=True,
+        )
+        .annotate(distancia_actual_m=Subquery(ultima_ubicacion.values('distancia_recorrida_m')[:1]))
+        .select_related('patente_bus', 'recorrido')
+        .order_by('fecha_hora_inicio_real')
+    )
+
+
+def offset_por_distancia(indice, distancia_m):
+    """Convierte una distancia recorrida en segundos de recorrido programado (interpolando entre paradas)."""
+    distancias = indice['distancias_m']
+    offsets = indice['offsets_s']
+    j = bisect_right(distancias, distancia_m)
+    if j == 0:
+        return offsets[0]
+    if j == len(distancias):
+        return offsets[-1]
+    d0, d1 = distancias[j - 1], distancias[j]
+    if d1 <= d0:
+        return offsets[j - 1]
+    return offsets[j - 1] + (offsets[j] - offsets[j - 1]) * (distancia_m - d0) / (d1 - d0)
+
+
+def progreso_viaje_s(viaje, ahora, indice=None):
+    """
+    Segundos de recorrido programado que el viaje ya cubrió. Si hay posiciones
+    matcheadas sobre la ruta se usa la distancia real; si no, el tiempo transcurrido.
+    """
+    distancia_m = getattr(viaje, 'distancia_actual_m', None)
+    if distancia_m is not None and indice and indice.get('distancias_m'):
+        return offset_por_distancia(indice, distancia_m)
+    return max((ahora - viaje.fecha_hora_inicio_real).total_seconds(), 0.0)
+
+
+def posiciones_por_parada(ruta):
+    """Posiciones (ordenadas) de cada parada dentro del índice. Se calcula una vez por instancia."""
+    posiciones = getattr(ruta, '_posiciones_por_parada', None)
+    if posiciones is None:
+        posiciones = {}
+        for posicion, parada_id in enumerate(ruta.indice_paradas.get('parada_ids', [])):
+            posiciones.setdefault(parada_id, []).append(posicion)
+        ruta._posiciones_por_parada = posiciones
+    return posiciones
+
+
+def etas_siguientes(indice, progreso_s):
+    """ETA (segundos) a cada parada que el viaje todavía no pasó, por bisect sobre los offsets."""
+    offsets = indice.get('offsets_s', [])
+    desde = bisect_right(offsets, progreso_s)
+    return [
+        {
+            'parada_id': indice['parada_ids'][posicion],
+            'orden': indice['ordenes'][posicion],
+            'eta_s': offsets[posicion] - progreso_s,
+        }
+        for posicion in range(desde, len(offsets))
+    ]
+
+
+def eta_a_parada(ruta, parada_id, progreso_s):
+    """ETA (segundos) del viaje a la próxima pasada por parada_id, o None si ya no pasa."""
+    offsets = ruta.indice_paradas.get('offsets_s', [])
+    desde = bisect_right(offsets, progreso_s)
+    posiciones = posiciones_por_parada(ruta).get(parada_id, [])
+    k = bisect_left(posiciones, desde)
+    if k == len(posiciones):
+        return None
+    return offsets[posiciones[k]] - progreso_s
+
+
+def _llegada(ahora, eta_s):
+    return (ahora + timedelta(seconds=eta_s)).isoformat()
+
+
+def etas_recorrido(recorrido, ahora=None, ruta=None):
+    """ETA de cada viaje en curso del recorrido a todas las paradas que le quedan."""
+    ahora = ahora or timezone.localtime()
+    ruta = ruta or obtener_ruta(recorrido, trazar=False)
+    viajes = []
+    if ruta and ruta.indice_paradas:
+        for viaje in viajes_en_curso([recorrido.id], ahora):
+            progreso_s = progreso_viaje_s(viaje, ahora, ruta.indice_paradas)
+            paradas = etas_siguientes(ruta.indice_paradas, progreso_s)
+            for parada in paradas:
+                parada['llegada'] = _llegada(ahora, parada['eta_s'])
+                parada['eta_s'] = round(parada['eta_s'])
+            viajes.append({
+                'viaje_id': viaje.id,
+                'bus': viaje.patente_bus_id,
+                'progreso_s': round(progreso_s),
+                'paradas': paradas,
+            })
+    return {
+        'recorrido_id': recorrido.id,
+        'generado': ahora.isoformat(),
+        'viajes': viajes,
+    }
+
+
+def llegadas_a_parada(parada, ahora=None):
+    """Próxima llegada de cada viaje en curso que todavía tiene que pasar por la parada."""
+    ahora = ahora or timezone.localtime()
+    recorridos = {recorrido.id: recorrido for recorrido in catalogo().recorridos_de_parada(parada.id)}
+    rutas = {}
+    llegadas = []
+    for viaje in viajes_en_curso(recorridos.keys(), ahora):
+        if viaje.recorrido_id not in rutas:
+            rutas[viaje.recorrido_id] = obtener_ruta(viaje.recorrido, trazar=False)
+        ruta = rutas[viaje.recorrido_id]
+        if not ruta or not ruta.indice_paradas:
+            continue
+        eta_s = eta_a_parada(ruta, parada.id, progreso_viaje_s(viaje, ahora, ruta.indice_paradas))
+        if eta_s is None:
+            continue
+        llegadas.append({
+            'recorrido_id': viaje.recorrido_id,
+            'recorrido_color': recorridos[viaje.recorrido_id].color_recorrido,
+            'viaje_id': viaje.id,
+            'bus': viaje.patente_bus_id,
+            'eta_s': round(eta_s),
+            'eta_min': max(round(eta_s / 60), 0),
+            'llegada': _llegada(ahora, eta_s),
+        })
+    llegadas.sort(key=lambda llegada: llegada['eta_s'])
+    return llegadas
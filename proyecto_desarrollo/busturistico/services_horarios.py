@@ -0,0 +1,152 @@
+from bisect import bisect_left
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import Recorrido, Viaje
+from .services_ruta import obtener_ruta
+
+# Cuántas salidas se guardan por recorrido (el detalle muestra 6, el listado 3)
+SALIDAS_POR_RECORRIDO = 6
+# Pasadas que muestra por defecto el tablero de una parada
+PASADAS_POR_PARADA = 8
+
+
+def _clave_salidas(fecha):
+    return f"horarios:proximas_salidas:{fecha.isoformat()}"
+
+
+def calcular_proximas_salidas(ahora, limite=SALIDAS_POR_RECORRIDO):
+    """
+    Próximas `limite` salidas programadas de hoy (viajes no iniciados) de todos
+    los recorridos en una sola consulta, numerando por recorrido con ROW_NUMBER().
+    Devuelve {recorrido_id: [time, ...]} ordenado por horario.
+    """
+    filas = (
+        Viaje.objects
+        .filter(
+            fecha_hora_inicio_real__isnull=True,
+            fecha_programada=ahora.date(),
+            hora_inicio_programada__gte=ahora.time(),
+        )
+        .annotate(fila=Window(
+            RowNumber(),
+            partition_by=F('recorrido_id'),
+            order_by=[F('hora_inicio_programada').asc(), F('id').asc()],
+        ))
+        .filter(fila__lte=limite)
+        .order_by('recorrido_id', 'fila')
+        .values_list('recorrido_id', 'hora_inicio_programada')
+    )
+    salidas = {}
+    for recorrido_id, hora in filas:
+        salidas.setdefault(recorrido_id, []).append(hora)
+    return salidas
+
+
+def _segundos_hasta_vencer(salidas, ahora):
+    """El resultado vale hasta que pase la primera salida listada (o hasta medianoche)."""
+    horas = [horas[0] for horas in salidas.values() if horas]
+    if horas:
+        limite = datetime.combine(ahora.date(), min(horas)) + timedelta(seconds=1)
+    else:
+        limite = datetime.combine(ahora.date() + timedelta(days=1), time.min)
+    limite = timezone.make_aware(limite, ahora.tzinfo)
+    return max(int((limite - ahora).total_seconds()) + 1, 1)
+
+
+def proximas_salidas(ahora=None):
+    """{recorrido_id: [time, ...]} con las próximas salidas de hoy, cacheado hasta la próxima salida."""
+    ahora = ahora or timezone.localtime()
+    clave = _clave_salidas(ahora.date())
+    salidas = cache.get(clave)
+    if salidas is None:
+        salidas = calcular_proximas_salidas(ahora)
+        cache.set(clave, salidas, _segundos_hasta_vencer(salidas, ahora))
+    return salidas
+
+
+def horarios_recorrido(recorrido_id, limite, salidas=None):
+    """Próximas salidas del recorrido como strings HH:MM."""
+    salidas = proximas_salidas() if salidas is None else salidas
+    return [hora.strftime('%H:%M') for hora in salidas.get(recorrido_id, [])[:limite]]
+
+
+def invalidar_proximas_salidas():
+    cache.delete(_clave_salidas(timezone.localdate()))
+
+
+def _clave_tablero(fecha):
+    return f"horarios:tablero_paradas:{fecha.isoformat()}"
+
+
+def calcular_tablero(fecha):
+    """
+    Pasadas programadas de hoy por cada parada: hora de salida de cada viaje no
+    iniciado + offset de la parada en el índice de su ruta.
+    Devuelve {parada_id: [(llegada, recorrido_id, color, viaje_id, salida), ...]} ordenado por llegada.
+    """
+    viajes = list(
+        Viaje.objects
+        .filter(fecha_programada=fecha, fecha_hora_inicio_real__isnull=True)
+        .order_by('hora_inicio_programada', 'id')
+        .values_list('id', 'recorrido_id', 'hora_inicio_programada')
+    )
+    recorridos = Recorrido.objects.filter(id__in={recorrido_id for _, recorrido_id, _ in viajes})
+    indices = {}
+    colores = {}
+    for recorrido in recorridos:
+        ruta = obtener_ruta(recorrido, trazar=False)
+        if ruta and ruta.indice_paradas:
+            indices[recorrido.id] = ruta.indice_paradas
+            colores[recorrido.id] = recorrido.color_recorrido
+
+    tablero = {}
+    for viaje_id, recorrido_id, hora in viajes:
+        indice = indices.get(recorrido_id)
+        if not indice:
+            continue
+        salida = timezone.make_aware(datetime.combine(fecha, hora))
+        for parada_id, offset_s in zip(indice['parada_ids'], indice['offsets_s']):
+            llegada = salida + timedelta(seconds=round(offset_s))
+            tablero.setdefault(parada_id, []).append(
+                (llegada, recorrido_id, colores[recorrido_id], viaje_id, salida)
+            )
+    for pasadas in tablero.values():
+        pasadas.sort()
+    return tablero
+
+
+def tablero_paradas(fecha=None):
+    """Tablero de todas las paradas para la fecha; se materializa una vez por cambio de horarios."""
+    fecha = fecha or timezone.localdate()
+    clave = _clave_tablero(fecha)
+    tablero = cache.get(clave)
+    if tablero is None:
+        tablero = calcular_tablero(fecha)
+        cache.set(clave, tablero, 2 * 24 * 3600)
+    return tablero
+
+
+def pasadas_por_parada(parada_id, limite=PASADAS_POR_PARADA, ahora=None):
+    """Próximas pasadas programadas por la parada (lectura del tablero cacheado + bisect)."""
+    ahora = ahora or timezone.localtime()
+    pasadas = tablero_paradas(ahora.date()).get(parada_id, [])
+    desde = bisect_left(pasadas, (ahora,))
+    return [
+        {
+            'llegada': timezone.localtime(llegada),
+            'recorrido_id': recorrido_id,
+            'recorrido_color': color,
+            'viaje_id': viaje_id,
+            'salida': timezone.localtime(salida),
+        }
+        for llegada, recorrido_id, color, viaje_id, salida in pasadas[desde:desde + limite]
+    ]
+
+
+def invalidar_tablero():
+    cache.delete(_clave_tablero(timezone.localdate()))
@@ -0,0 +1,206 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import Atractivo, Parada, Recorrido
+from .services_cache import incrementar_generacion
+
+logger = logging.getLogger(__name__)
+
+# Anchos (px) de las variantes; nunca se agranda la foto original
+ANCHOS = (320, 640, 1024)
+# Formato de Pillow y opciones de guardado de cada variante
+FORMATOS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+CARPETA_DERIVADAS = 'derivadas'
+CAMPOS_FOTO = {
+    Recorrido: 'foto_recorrido',
+    Parada: 'foto_parada',
+    Atractivo: 'foto_atractivo',
+}
+WORKERS_DERIVADAS = 2
+# Cada cuánto se vuelve a buscar el manifiesto de una foto que todavía no tenía
+# (lo pudo generar otro worker, o reintentar una generación que falló)
+REINTENTO_MANIFIESTO_S = 60
+
+
+def _base(nombre):
+    ruta = PurePosixPath(nombre)
+    # Con la extensión: verde.jpg y verde.webp no comparten variantes
+    return f"{CARPETA_DERIVADAS}/{ruta.parent.as_posix()}/{ruta.name}"
+
+
+def nombre_derivada(nombre, ancho, formato):
+    """media/recorridos/verde.jpg -> derivadas/recorridos/verde.jpg-640w.webp"""
+    return f"{_base(nombre)}-{ancho}w.{formato}"
+
+
+def nombre_manifiesto(nombre):
+    return f"{_base(nombre)}.json"
+
+
+def _version_original(nombre, storage):
+    """Identifica el contenido del original sin leerlo (tamaño + fecha de modificación)."""
+    return f"{storage.size(nombre)}-{storage.get_modified_time(nombre).timestamp():.0f}"
+
+
+def leer_manifiesto(nombre, storage=default_storage):
+    try:
+        with storage.open(nombre_manifiesto(nombre)) as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError):
+        return None
+
+
+def _guardar(storage, nombre, contenido):
+    if storage.exists(nombre):
+        storage.delete(nombre)
+    storage.save(nombre, ContentFile(contenido))
+
+
+def _codificar(imagen, formato):
+    formato_pil, opciones = FORMATOS[formato]
+    if formato_pil == 'JPEG' and imagen.mode != 'RGB':
+        # JPEG no tiene canal alfa: se aplana sobre fondo blanco
+        fondo = Image.new('RGB', imagen.size, (255, 255, 255))
+        rgba = imagen.convert('RGBA')
+        fondo.paste(rgba, mask=rgba.getchannel('A'))
+        imagen = fondo
+    elif imagen.mode not in ('RGB', 'RGBA'):
+        imagen = imagen.convert('RGBA' if 'A' in imagen.getbands() else 'RGB')
+    salida = BytesIO()
+    imagen.save(salida, formato_pil, **opciones)
+    return salida.getvalue()
+
+
+def generar_derivadas(nombre, storage=default_storage, forzar=False):
+    """
+    Genera las variantes WebP/JPEG de la foto y un manifiesto con los anchos
+    generados. Si el manifiesto corresponde a la versión actual del original no
+    se hace nada (cache en disco). Devuelve el manifiesto.
+    """
+    version = _version_original(nombre, storage)
+    manifiesto = leer_manifiesto(nombre, storage)
+    if manifiesto and manifiesto.get('version') == version and not forzar:
+        return manifiesto
+
+    with storage.open(nombre) as archivo:
+        original = Image.open(archivo)
+        original = ImageOps.exif_transpose(original)
+        original.load()
+
+    anchos = sorted({min(ancho, original.width) for ancho in ANCHOS})
+    for ancho in anchos:
+        if ancho < original.width:
+            alto = max(round(original.height * ancho / original.width), 1)
+            imagen = original.resize((ancho, alto), Image.Resampling.LANCZOS)
+        else:
+            imagen = original
+        for formato in FORMATOS:
+            _guardar(storage, nombre_derivada(nombre, ancho, formato), _codificar(imagen, formato))
+
+    manifiesto = {'version': version, 'anchos': anchos}
+    _guardar(storage, nombre_manifiesto(nombre), json.dumps(manifiesto).encode())
+    return manifiesto
+
+
+# Manifiestos ya leídos por este proceso
+_manifiestos = {}
+# Fotos sin manifiesto -> time.monotonic() de la última vez que se buscó
+_sin_manifiesto = {}
+_en_proceso = set()
+_lock = threading.Lock()
+_executor = None
+
+
+def _ejecutor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=WORKERS_DERIVADAS, thread_name_prefix='derivadas')
+    return _executor
+
+
+def _generar_en_segundo_plano(nombre, modelo, forzar):
+    try:
+        manifiesto = generar_derivadas(nombre, forzar=forzar)
+    except Exception as exc:
+        logger.error(
+            "Error generando variantes de %s: %s (se reintenta en %s s)", nombre, exc, REINTENTO_MANIFIESTO_S
+        )
+        return
+    finally:
+        with _lock:
+            _en_proceso.discard(nombre)
+    _manifiestos[nombre] = manifiesto
+    _sin_manifiesto.pop(nombre, None)
+    if modelo is not None:
+        # Las páginas cacheadas con el <img> original pasan a usar las variantes
+        incrementar_generacion(modelo)
+
+
+def programar_derivadas(nombre, modelo=None, forzar=False):
+    """Encola la generación de variantes (una sola vez por foto, aunque se pida varias)."""
+    with _lock:
+        if nombre in _en_proceso:
+            return
+        _en_proceso.add(nombre)
+    # _manifiestos no se toca: hasta que esté el nuevo se siguen sirviendo las variantes anteriores
+    _ejecutor().submit(_generar_en_segundo_plano, nombre, modelo, forzar)
+
+
+def manifiesto_de(foto):
+    """
+    Manifiesto de variantes de un ImageFieldFile, o None si todavía no existen
+    (en ese caso se encola la generación y la plantilla usa el original). La
+    ausencia se recuerda solo REINTENTO_MANIFIESTO_S: después se vuelve a leer
+    y, si sigue sin estar, se vuelve a encolar.
+    """
+    if not foto:
+        return None
+    nombre = foto.name
+    manifiesto = _manifiestos.get(nombre)
+    if manifiesto is not None:
+        return manifiesto
+    buscado = _sin_manifiesto.get(nombre)
+    if buscado is not None and time.monotonic() - buscado < REINTENTO_MANIFIESTO_S:
+        return None
+    manifiesto = leer_manifiesto(nombre, foto.storage)
+    if manifiesto is not None:
+        _manifiestos[nombre] = manifiesto
+        _sin_manifiesto.pop(nombre, None)
+        return manifiesto
+    _sin_manifiesto[nombre] = time.monotonic()
+    modelo = type(foto.instance)
+    programar_derivadas(nombre, modelo if modelo in CAMPOS_FOTO else None)
+    return None
+
+
+def srcset(foto, formato='jpeg'):
+    """'/media/derivadas/...-320w.jpeg 320w, ...' o '' si no hay variantes."""
+    manifiesto = manifiesto_de(foto)
+    if not manifiesto:
+        return ''
+    return ', '.join(
+        f"{foto.storage.url(nombre_derivada(foto.name, ancho, formato))} {ancho}w"
+        for ancho in manifiesto['anchos']
+    )
+
+
+def fotos_existentes(modelos=None):
+    """(modelo, nombre) de todas las fotos cargadas, para el backfill."""
+    for modelo, campo in CAMPOS_FOTO.items():
+        if modelos and modelo not in modelos:
+            continue
+        nombres = modelo.objects.exclude(**{campo: ''}).exclude(**{f'{campo}__isnull': True}).values_list(campo, flat=True)
+        for nombre in nombres.distinct():
+            yield modelo, nombre
@@ -0,0 +1,225 @@
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UbicacionColectivo, Viaje
+from .services_ruta import distancias_acumuladas, obtener_ruta, programar_trazado, proyectar_en_segmento
+
+# Lado de cada celda de la grilla de segmentos, en metros
+CELDA_M = 150
+# Cuántos segmentos hacia adelante se buscan a partir del último match
+VENTANA_SEGMENTOS = 40
+# Retroceso tolerado (ruido del GPS) respecto del último segmento
+RETROCESO_SEGMENTOS = 2
+# A partir de este desvío lateral se considera que el bus salió de la ruta
+UMBRAL_FUERA_DE_RUTA_M = 75
+# Posiciones por lote subido desde el dispositivo del chofer
+LOTE_MAXIMO = 500
+# Tolerancia para relojes de dispositivos algo adelantados
+ADELANTO_RELOJ = timedelta(minutes=2)
+
+
+class IndiceSegmentos:
+    """
+    Grilla regular sobre los segmentos de una ruta: cada celda guarda los
+    índices de los segmentos cuyo bounding box la toca. Permite encontrar los
+    segmentos cercanos a un punto sin recorrer toda la geometría.
+    """
+
+    def __init__(self, geometria, distancias=None):
+        self.geometria = geometria
+        self.distancias = distancias or distancias_acumuladas(geometria)
+        self.lat0 = geometria[0][0] if geometria else 0.0
+        self.lng0 = geometria[0][1] if geometria else 0.0
+        self.kx = 111320.0 * math.cos(math.radians(self.lat0))
+        self.ky = 110540.0
+        self.celdas = {}
+        for i in range(len(geometria) - 1):
+            (cx1, cy1), (cx2, cy2) = self._celda(geometria[i]), self._celda(geometria[i + 1])
+            for cx in range(min(cx1, cx2), max(cx1, cx2) + 1):
+                for cy in range(min(cy1, cy2), max(cy1, cy2) + 1):
+                    self.celdas.setdefault((cx, cy), []).append(i)
+
+    def _celda(self, punto):
+        x = (punto[1] - self.lng0) * self.kx
+        y = (punto[0] - self.lat0) * self.ky
+        return int(math.floor(x / CELDA_M)), int(math.floor(y / CELDA_M))
+
+    def candidatos(self, punto):
+        """Segmentos en la celda del punto y sus 8 vecinas."""
+        cx, cy = self._celda(punto)
+        segmentos = set()
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                segmentos.update(self.celdas.get((cx + dx, cy + dy), ()))
+        return segmentos
+
+    def distancia_en(self, segmento, fraccion):
+        inicio = self.distancias[segmento]
+        return inicio + fraccion * (self.distancias[segmento + 1] - inicio)
+
+    def matchear(self, punto, segmento_previo=0, distancia_previa=0.0):
+        """
+        Ubica el punto sobre la ruta buscando solo hacia adelante desde el último
+        segmento conocido. Devuelve (segmento, distancia recorrida, desvío lateral).
+        """
+        if len(self.geometria) < 2:
+            return None
+
+        desde = max(segmento_previo - RETROCESO_SEGMENTOS, 0)
+        hasta = segmento_previo + VENTANA_SEGMENTOS
+        cercanos = self.candidatos(punto)
+        ventana = [i for i in cercanos if desde <= i <= hasta]
+        if not ventana:
+            # El bus pudo avanzar más que la ventana (ej. sin señal un rato)
+            ventana = [i for i in cercanos if i >= desde]
+        if not ventana:
+            # Fuera de la grilla: se mide el desvío contra la ventana hacia adelante
+            ventana = range(desde, min(hasta, len(self.geometria) - 2) + 1)
+
+        mejor = None
+        for i in ventana:
+            fraccion, lateral = proyectar_en_segmento(punto, self.geometria[i], self.geometria[i + 1])
+            if mejor is None or lateral < mejor[2] or (lateral == mejor[2] and i < mejor[0]):
+                mejor = (i, fraccion, lateral)
+
+        segmento, fraccion, desvio = mejor
+        if desvio > UMBRAL_FUERA_DE_RUTA_M:
+            # Fuera de ruta: no se avanza sobre la geometría
+            return segmento_previo, distancia_previa, desvio
+        distancia = max(self.distancia_en(segmento, fraccion), distancia_previa)
+        return segmento, distancia, desvio
+
+
+_indices = {}
+
+
+def indice_de_ruta(ruta):
+    """IndiceSegmentos de la ruta, cacheado por proceso hasta que la ruta se vuelva a trazar."""
+    cacheado = _indices.get(ruta.pk)
+    if cacheado is None or cacheado[0] != ruta.fecha_actualizacion:
+        cacheado = (ruta.fecha_actualizacion, IndiceSegmentos(ruta.geometria, ruta.distancias_acumuladas))
+        _indices[ruta.pk] = cacheado
+    return cacheado[1]
+
+
+def ultimo_match(viaje, hasta):
+    """(segmento, distancia) de la última ubicación ya matcheada del viaje."""
+    ultima = (
+        UbicacionColectivo.objects
+        .filter(viaje=viaje, timestamp_ubicacion__lte=hasta, segmento_ruta__isnull=False)
+        .order_by('-timestamp_ubicacion')
+        .values_list('segmento_ruta', 'distancia_recorrida_m')
+        .first()
+    )
+    return ultima or (0, 0.0)
+
+
+def ruta_para_matching(viaje):
+    """
+    Ruta guardada del recorrido, sin trazar nunca dentro del request del chofer:
+    OSRM lo bloquearía y cambiaría la geometría bajo los segmentos ya guardados.
+    Si falta o quedó en línea recta, se encola el trazado en segundo plano.
+    """
+    ruta = obtener_ruta(viaje.recorrido, trazar=False)
+    if ruta is None or not ruta.trazada_con_osrm:
+        programar_trazado([viaje.recorrido_id])
+    return ruta
+
+
+def aplicar_match(ubicacion, match):
+    if match is not None:
+        ubicacion.segmento_ruta, distancia, desvio = match
+        ubicacion.distancia_recorrida_m = round(distancia, 1)
+        ubicacion.desvio_m = round(desvio, 1)
+    return ubicacion
+
+
+def registrar_ubicacion(viaje, lat, lng, timestamp=None):
+    """Guarda una posición GPS del viaje junto con su proyección sobre la ruta."""
+    timestamp = timestamp or timezone.now()
+    ubicacion = UbicacionColectivo(latitud=lat, longitud=lng, timestamp_ubicacion=timestamp, viaje=viaje)
+    ruta = ruta_para_matching(viaje)
+    if ruta:
+        segmento, distancia = ultimo_match(viaje, timestamp)
+        aplicar_match(ubicacion, indice_de_ruta(ruta).matchear((lat, lng), segmento, distancia))
+    ubicacion.save()
+    return ubicacion
+
+
+def registrar_lote(viaje, dispositivo, posiciones):
+    """
+    Guarda un lote de posiciones [secuencia, epoch_ms, lat, lng] encoladas por
+    el dispositivo. Es idempotente: las secuencias ya guardadas para el viaje se
+    ignoran, así que reenviar un lote (timeout, respuesta perdida) no duplica filas.
+    Devuelve cuántas se guardaron, cuántas ya estaban (o las guardó un reintento
+    simultáneo) y cuántas se descartaron por inválidas (reintentarlas no sirve:
+    el dispositivo también las descarta).
+    """
+    limite = timezone.now() + ADELANTO_RELOJ
+    if viaje.fecha_hora_fin_real:
+        limite = min(limite, viaje.fecha_hora_fin_real + ADELANTO_RELOJ)
+    validas = {}
+    rechazadas = 0
+    for posicion in posiciones:
+        try:
+            secuencia, epoch_ms, lat, lng = posicion
+            secuencia = int(secuencia)
+            timestamp = datetime.fromtimestamp(float(epoch_ms) / 1000, tz=dt_timezone.utc)
+            lat, lng = float(lat), float(lng)
+        except (TypeError, ValueError, OverflowError, OSError):
+            rechazadas += 1
+            continue
+        if secuencia < 0 or not (-90 <= lat <= 90 and -180 <= lng <= 180) or timestamp > limite:
+            rechazadas += 1
+            continue
+        validas[secuencia] = (timestamp, lat, lng)
+
+    ruta = ruta_para_matching(viaje) if validas else None
+    guardadas = set()
+    with transaction.atomic():
+        # Los lotes del mismo viaje se procesan de a uno: el conteo y el último match son exactos
+        Viaje.objects.select_for_update().filter(pk=viaje.pk).first()
+        existentes = UbicacionColectivo.objects.filter(
+            viaje=viaje, dispositivo=dispositivo, secuencia__in=validas.keys()
+        )
+        repetidas = set(existentes.values_list('secuencia', flat=True))
+        nuevas = sorted(
+            (timestamp, secuencia, lat, lng)
+            for secuencia, (timestamp, lat, lng) in validas.items() if secuencia not in repetidas
+        )
+        ubicaciones = [
+            UbicacionColectivo(latitud=lat, longitud=lng, timestamp_ubicacion=timestamp, viaje=viaje,
+                               dispositivo=dispositivo, secuencia=secuencia)
+            for timestamp, secuencia, lat, lng in nuevas
+        ]
+        if ubicaciones:
+            if ruta:
+                segmento, distancia = ultimo_match(viaje, ubicaciones[0].timestamp_ubicacion)
+                matchear_secuencia(ruta, ubicaciones, segmento, distancia)
+            # Red de seguridad ante un reintento simultáneo: la fila que choca se saltea
+            UbicacionColectivo.objects.bulk_create(ubicaciones, ignore_conflicts=True)
+            # bulk_create con ignore_conflicts no informa qué insertó: se cuenta lo que quedó
+            guardadas = set(existentes.values_list('secuencia', flat=True)) - repetidas
+    return {
+        'guardadas': len(guardadas),
+        'repetidas': len(validas) - len(guardadas),
+        'rechazadas': rechazadas,
+    }
+
+
+def matchear_secuencia(ruta, ubicaciones, segmento=0, distancia=0.0):
+    """Matchea en orden una lista de UbicacionColectivo sin guardar (para bulk_create)."""
+    indice = indice_de_ruta(ruta)
+    for ubicacion in ubicaciones:
+        match = indice.matchear((ubicacion.latitud, ubicacion.longitud), segmento, distancia)
+        aplicar_match(ubicacion, match)
+        if match is not None:
+            segmento, distancia = match[0], match[1]
+    return ubicaciones
+
+
+def fuera_de_ruta(ubicacion) -> bool:
+    return ubicacion.desvio_m is not None and ubicacion.desvio_m > UMBRAL_FUERA_DE_RUTA_M
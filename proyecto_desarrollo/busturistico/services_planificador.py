@@ -0,0 +1,252 @@
+import threading
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from .models import RutaRecorrido, Viaje
+from .services_cache import MODELOS_CON_TIEMPOS, generacion
+from .services_catalogo import catalogo
+from .services_espacial import KDTree
+from .services_ruta import duracion_segundos, haversine_m
+
+# Caminata en línea recta a ~4,3 km/h
+VELOCIDAD_CAMINATA_MS = 1.2
+# Hasta dónde se camina para subir al primer bus o desde el último
+RADIO_ACCESO_M = 1000
+# Trasbordo caminando entre paradas distintas
+RADIO_TRASBORDO_M = 300
+# Tiempo mínimo para bajar de un bus y subir a otro
+MARGEN_TRASBORDO_S = 60
+INFINITO = float('inf')
+
+
+def segundos_del_dia(momento):
+    return momento.hour * 3600 + momento.minute * 60 + momento.second
+
+
+def offsets_por_orden(recorrido):
+    """
+    Offsets (s desde la salida) de las paradas de un recorrido sin ruta trazada:
+    la duración se reparte según la distancia en línea recta entre paradas.
+    """
+    distancias = [0.0]
+    for anterior, parada in zip(recorrido.paradas, recorrido.paradas[1:]):
+        distancias.append(distancias[-1] + haversine_m(
+            anterior.latitud_parada, anterior.longitud_parada, parada.latitud_parada, parada.longitud_parada,
+        ))
+    total_m = distancias[-1]
+    duracion_s = duracion_segundos(recorrido, total_m)
+    return [distancia / total_m * duracion_s if total_m else 0.0 for distancia in distancias]
+
+
+class RedViajes:
+    """
+    Horario del día como conexiones elementales (un bus yendo de una parada a la
+    siguiente) ordenadas por hora de salida, más los trasbordos a pie entre
+    paradas cercanas. Es la entrada del Connection Scan Algorithm.
+    """
+    __slots__ = ('clave', 'fecha', 'conexiones', 'salidas', 'caminatas', 'paradas', 'arbol', 'colores')
+
+    def __init__(self, clave, fecha):
+        self.clave = clave
+        self.fecha = fecha
+        cat = catalogo()
+        self.paradas = cat.paradas
+        self.colores = {recorrido.id: recorrido.color_recorrido for recorrido in cat.recorridos.values()}
+
+        # Paradas y offsets de cada recorrido: el índice de la ruta trazada si está
+        # al día con el orden de RecorridoParada, si no una estimación por distancia
+        indices = dict(RutaRecorrido.objects.values_list('recorrido_id', 'indice_paradas'))
+        tramos = {}
+        for recorrido in cat.recorridos.values():
+            parada_ids = [parada.id for parada in recorrido.paradas]
+            if len(parada_ids) < 2:
+                continue
+            indice = indices.get(recorrido.id)
+            if indice and indice.get('parada_ids') == parada_ids:
+                tramos[recorrido.id] = (parada_ids, indice['offsets_s'])
+            else:
+                tramos[recorrido.id] = (parada_ids, offsets_por_orden(recorrido))
+
+        # (salida_s, llegada_s, desde, hasta, viaje_id, recorrido_id, posición en el recorrido)
+        conexiones = []
+        viajes = Viaje.objects.filter(
+            fecha_programada=fecha, fecha_hora_fin_real__isnull=True, recorrido_id__in=tramos.keys(),
+        ).values_list('id', 'recorrido_id', 'hora_inicio_programada', 'fecha_hora_inicio_real')
+        for viaje_id, recorrido_id, hora, inicio_real in viajes:
+            # Un viaje ya iniciado se planifica con su salida real
+            salida = segundos_del_dia(timezone.localtime(inicio_real) if inicio_real else hora)
+            parada_ids, offsets = tramos[recorrido_id]
+            for posicion in range(len(parada_ids) - 1):
+                desde, hasta = parada_ids[posicion], parada_ids[posicion + 1]
+                if desde == hasta:
+                    continue
+                conexiones.append((
+                    salida + round(offsets[posicion]), salida + round(offsets[posicion + 1]),
+                    desde, hasta, viaje_id, recorrido_id, posicion,
+                ))
+        conexiones.sort()
+        self.conexiones = conexiones
+        self.salidas = [conexion[0] for conexion in conexiones]
+
+        self.arbol = KDTree(
+            (parada.latitud_parada, parada.longitud_parada, parada.id) for parada in self.paradas.values()
+        )
+        self.caminatas = {}
+        for parada in self.paradas.values():
+            vecinas = [
+                (otra_id, round(distancia / VELOCIDAD_CAMINATA_MS), distancia)
+                for distancia, _, _, otra_id in self.arbol.en_radio(
+                    parada.latitud_parada, parada.longitud_parada, RADIO_TRASBORDO_M,
+                )
+                if otra_id != parada.id
+            ]
+            if vecinas:
+                self.caminatas[parada.id] = vecinas
+
+    def planificar(self, origen, destino, desde_s):
+        """
+        Connection Scan: recorre las conexiones una sola vez en orden de salida
+        a partir de desde_s y se detiene cuando ya no pueden mejorar la llegada.
+        Devuelve (llegada_s, tramos) o None si no hay forma de llegar.
+        """
+        llegada = {}
+        padre = {}
+        for distancia, _, _, parada_id in self.arbol.en_radio(*origen, RADIO_ACCESO_M):
+            llegada[parada_id] = desde_s + round(distancia / VELOCIDAD_CAMINATA_MS)
+            padre[parada_id] = ('origen', distancia)
+        egreso = {
+            parada_id: distancia
+            for distancia, _, _, parada_id in self.arbol.en_radio(*destino, RADIO_ACCESO_M)
+        }
+        directo = haversine_m(*origen, *destino)
+        mejor = desde_s + round(directo / VELOCIDAD_CAMINATA_MS) if directo <= RADIO_ACCESO_M else INFINITO
+        ultima = None
+
+        def alcanzar(parada_id, momento, via):
+            nonlocal mejor, ultima
+            if momento >= llegada.get(parada_id, INFINITO):
+                return
+            llegada[parada_id] = momento
+            padre[parada_id] = via
+            if parada_id in egreso:
+                final = momento + round(egreso[parada_id] / VELOCIDAD_CAMINATA_MS)
+                if final < mejor:
+                    mejor, ultima = final, parada_id
+
+        subido = {}
+        conexiones = self.conexiones
+        for i in range(bisect_left(self.salidas, desde_s), len(conexiones)):
+            salida, arribo, desde, hasta, viaje_id, _, _ = conexiones[i]
+            if salida >= mejor:
+                break
+            if viaje_id not in subido:
+                listo = llegada.get(desde, INFINITO)
+                if padre.get(desde, ('',))[0] == 'bus':
+                    listo += MARGEN_TRASBORDO_S
+                if listo > salida:
+                    continue
+                subido[viaje_id] = i
+            if arribo < llegada.get(hasta, INFINITO):
+                alcanzar(hasta, arribo, ('bus', subido[viaje_id], i))
+                for otra_id, segundos, distancia in self.caminatas.get(hasta, ()):
+                    alcanzar(otra_id, arribo + segundos, ('caminar', hasta, distancia))
+
+        if mejor == INFINITO:
+            return None
+        if ultima is None:
+            return mejor, [self._caminata(desde_s, mejor, directo, origen=True, destino=True)]
+        return mejor, self._reconstruir(ultima, padre, llegada, egreso[ultima], mejor)
+
+    def _reconstruir(self, ultima, padre, llegada, egreso_m, final):
+        tramos = [self._caminata(llegada[ultima], final, egreso_m, desde=ultima, destino=True)]
+        parada_id = ultima
+        while True:
+            via = padre[parada_id]
+            if via[0] == 'origen':
+                tramos.append(self._caminata(llegada[parada_id] - round(via[1] / VELOCIDAD_CAMINATA_MS),
+                                             llegada[parada_id], via[1], origen=True, hasta=parada_id))
+                break
+            if via[0] == 'caminar':
+                _, desde, distancia = via
+                tramos.append(self._caminata(llegada[desde], llegada[parada_id], distancia, desde=desde, hasta=parada_id))
+                parada_id = desde
+                continue
+            _, subida, bajada = via
+            sube, baja = self.conexiones[subida], self.conexiones[bajada]
+            tramos.append({
+                'tipo': 'bus',
+                'recorrido_id': sube[5],
+                'recorrido_color': self.colores.get(sube[5]),
+                'viaje_id': sube[4],
+                'desde': self._parada(sube[2]),
+                'hasta': self._parada(baja[3]),
+                'salida': self.hora(sube[0]),
+                'llegada': self.hora(baja[1]),
+                'paradas': baja[6] - sube[6] + 1,
+            })
+            parada_id = sube[2]
+        tramos.reverse()
+        # Caminatas de 0 m (origen o destino justo en la parada) no aportan nada
+        return [tramo for tramo in tramos if tramo['tipo'] == 'bus' or tramo['distancia_m'] > 0]
+
+    def _parada(self, parada_id):
+        parada = self.paradas[parada_id]
+        return {'id': parada.id, 'nombre': parada.nombre_parada,
+                'lat': parada.latitud_parada, 'lng': parada.longitud_parada}
+
+    def hora(self, segundos):
+        momento = datetime.combine(self.fecha, datetime.min.time()) + timedelta(seconds=segundos)
+        return timezone.make_aware(momento).isoformat()
+
+    def _caminata(self, salida_s, llegada_s, distancia, desde=None, hasta=None, origen=False, destino=False):
+        return {
+            'tipo': 'caminar',
+            'desde': 'origen' if origen else self._parada(desde),
+            'hasta': 'destino' if destino else self._parada(hasta),
+            'distancia_m': round(distancia),
+            'salida': self.hora(salida_s),
+            'llegada': self.hora(llegada_s),
+        }
+
+
+_red = None
+_lock = threading.Lock()
+
+
+def red_viajes(fecha=None) -> RedViajes:
+    """
+    Red del día vigente. Se arma una vez y se reutiliza hasta que cambien el
+    catálogo, las rutas o los viajes (o el día).
+    """
+    global _red
+    fecha = fecha or timezone.localdate()
+    clave = (fecha, generacion(*MODELOS_CON_TIEMPOS, Viaje))
+    actual = _red
+    if actual is not None and actual.clave == clave:
+        return actual
+    with _lock:
+        if _red is None or _red.clave != clave:
+            _red = RedViajes(clave, fecha)
+        return _red
+
+
+def planificar_viaje(origen, destino, ahora=None):
+    """
+    Cómo llegar de origen a destino ((lat, lng)) saliendo ahora: el itinerario
+    que llega más temprano combinando caminatas y buses de hoy, o None.
+    """
+    ahora = ahora or timezone.localtime()
+    red = red_viajes(ahora.date())
+    resultado = red.planificar(origen, destino, segundos_del_dia(ahora))
+    if resultado is None:
+        return None
+    llegada_s, tramos = resultado
+    return {
+        'salida': red.hora(segundos_del_dia(ahora)),
+        'llegada': red.hora(llegada_s),
+        'duracion_min': round((llegada_s - segundos_del_dia(ahora)) / 60),
+        'trasbordos': max(sum(1 for tramo in tramos if tramo['tipo'] == 'bus') - 1, 0),
+        'tramos': tramos,
+    }
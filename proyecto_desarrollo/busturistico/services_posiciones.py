@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from bisect import bisect_right
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Recorrido, UbicacionColectivo, Viaje
+from .services_mapmatching import UMBRAL_FUERA_DE_RUTA_M
+from .services_ruta import animacion_programada, obtener_ruta, rumbo_grados
+
+logger = logging.getLogger(__name__)
+
+# Cada cuántos segundos se recalculan las posiciones de un recorrido
+TICK_SEGUNDOS = 2
+# Sin eventos durante este tiempo se manda un comentario para mantener viva la conexión
+HEARTBEAT_SEGUNDOS = 15
+# Eventos pendientes por suscriptor; si un cliente lento se atrasa se descartan los más viejos
+COLA_MAXIMA = 10
+# Si otro proceso está calculando, cuánto se espera su resultado antes de usar el snapshot anterior
+ESPERA_CALCULO_SEGUNDOS = 0.2
+# Vida del último snapshot calculado, que se sirve mientras otro proceso calcula el nuevo
+SNAPSHOT_ANTERIOR_TIMEOUT = 60
+
+
+def _ultima(ubicaciones, campo):
+    return Subquery(ubicaciones.values(campo)[:1])
+
+
+def posiciones_recorrido(recorrido_id, ruta=None, ahora=None):
+    """
+    Última posición conocida de cada viaje en curso del recorrido, con rumbo y
+    próxima parada. Devuelve {viaje_id: posicion}. Una sola consulta.
+    """
+    ahora = ahora or timezone.now()
+    ubicaciones = (
+        UbicacionColectivo.objects
+        .filter(viaje=OuterRef('pk'), timestamp_ubicacion__lte=ahora)
+        .order_by('-timestamp_ubicacion')
+    )
+    viajes = (
+        Viaje.objects
+        .filter(
+            recorrido_id=recorrido_id,
+            fecha_hora_inicio_real__isnull=False,
+            fecha_hora_fin_real__isnull=True,
+        )
+        .annotate(
+            lat=_ultima(ubicaciones, 'latitud'),
+            lng=_ultima(ubicaciones, 'longitud'),
+            timestamp=_ultima(ubicaciones, 'timestamp_ubicacion'),
+            segmento=_ultima(ubicaciones, 'segmento_ruta'),
+            distancia=_ultima(ubicaciones, 'distancia_recorrida_m'),
+            desvio=_ultima(ubicaciones, 'desvio_m'),
+        )
+        .select_related('patente_bus')
+        .order_by('id')
+    )
+
+    geometria = ruta.geometria if ruta else []
+    indice = ruta.indice_paradas if ruta else {}
+    posiciones = {}
+    for viaje in viajes:
+        if viaje.lat is None:
+            continue
+
+        rumbo = None
+        if viaje.segmento is not None and viaje.segmento + 1 < len(geometria):
+            rumbo = round(rumbo_grados(geometria[viaje.segmento], geometria[viaje.segmento + 1]))
+
+        proxima_parada = None
+        if viaje.distancia is not None and indice.get('distancias_m'):
+            posicion = bisect_right(indice['distancias_m'], viaje.distancia)
+            if posicion < len(indice['distancias_m']):
+                proxima_parada = {
+                    'parada_id': indice['parada_ids'][posicion],
+                    'orden': indice['ordenes'][posicion],
+                    'distancia_m': round(indice['distancias_m'][posicion] - viaje.distancia),
+                }
+
+        posiciones[viaje.id] = {
+            'viaje_id': viaje.id,
+            'bus': viaje.patente_bus_id,
+            'numero_unidad': viaje.patente_bus.numero_unidad,
+            'lat': viaje.lat,
+            'lng': viaje.lng,
+            'timestamp': viaje.timestamp.isoformat(),
+            'rumbo': rumbo,
+            'distancia_recorrida_m': viaje.distancia,
+            'fuera_de_ruta': viaje.desvio is not None and viaje.desvio > UMBRAL_FUERA_DE_RUTA_M,
+            'proxima_parada': proxima_parada,
+        }
+    return posiciones
+
+
+def viajes_en_curso(recorrido, ahora=None):
+    """
+    Viajes en curso del recorrido con su animación programada, para el mapa
+    público (la página se cachea entera y los pide aparte). La animación es
+    None si la ruta todavía no está trazada.
+    """
+    ahora = ahora or timezone.now()
+    ruta = obtener_ruta(recorrido, trazar=False)
+    animacion = animacion_programada(recorrido, ruta) if ruta and ruta.geometria else None
+    viajes = (
+        Viaje.objects
+        .filter(recorrido=recorrido, fecha_hora_inicio_real__isnull=False, fecha_hora_fin_real__isnull=True)
+        .select_related('patente_bus', 'chofer')
+        .order_by('fecha_hora_inicio_real')
+    )
+    return {
+        'recorrido_id': recorrido.id,
+        'server_now_ms': int(ahora.timestamp() * 1000),
+        'animation': animacion,
+        # Pasada la duración programada el bus queda en la terminal hasta que
+        # finalizar_viajes_vencidos cierre el viaje: sigue estando en curso
+        'viajes': [_viaje_en_curso(recorrido, viaje) for viaje in viajes],
+    }
+
+
+def _viaje_en_curso(recorrido, viaje):
+    bus_patente = viaje.patente_bus.patente_bus if viaje.patente_bus_id else None
+    bus_numero = viaje.patente_bus.numero_unidad if viaje.patente_bus_id else None
+    chofer = str(viaje.chofer) if viaje.chofer_id else None
+    tooltip = [f"Recorrido {recorrido.color_recorrido}"]
+    if bus_numero is not None:
+        tooltip.append(f"Unidad {bus_numero}")
+    if bus_patente:
+        tooltip.append(f"Patente {bus_patente}")
+    if chofer:
+        tooltip.append(f"Chofer {chofer}")
+    return {
+        'viaje_id': viaje.id,
+        'start_ms': int(viaje.fecha_hora_inicio_real.timestamp() * 1000),
+        'bus_patente': bus_patente,
+        'bus_numero': bus_numero,
+        'chofer': chofer,
+        'tooltip': " · ".join(tooltip),
+    }
+
+
+def delta_posiciones(anteriores, actuales):
+    """Buses cuya posición cambió (o que aparecieron) y viajes que dejaron de estar en curso."""
+    return {
+        'actualizados': [
+            posicion for viaje_id, posicion in actuales.items()
+            if anteriores.get(viaje_id) != posicion
+        ],
+        'removidos': [viaje_id for viaje_id in anteriores if viaje_id not in actuales],
+    }
+
+
+def _clave_posiciones(recorrido_id):
+    return f"posiciones:recorrido:{recorrido_id}"
+
+
+def _calcular_entrada(recorrido_id):
+    recorrido = Recorrido.objects.filter(pk=recorrido_id).first()
+    if recorrido is None:
+        return None
+    posiciones = posiciones_recorrido(recorrido_id, obtener_ruta(recorrido, trazar=False))
+    cuerpo = json.dumps(
+        {'recorrido_id': recorrido_id, 'buses': list(posiciones.values())},
+        cls=DjangoJSONEncoder, separators=(',', ':'),
+    ).encode()
+    etag = hashlib.sha256(cuerpo).hexdigest()[:32]
+
+    # Last-Modified es el momento en que el contenido cambió por última vez,
+    # no el del cálculo: si nada se movió se conserva el anterior
+    clave_anterior = f"{_clave_posiciones(recorrido_id)}:anterior"
+    anterior = cache.get(clave_anterior)
+    if anterior and anterior[0] == etag:
+        modificado = anterior[1]
+    else:
+        modificado = timezone.now().replace(microsecond=0)
+        cache.set(clave_anterior, (etag, modificado), None)
+    return {'posiciones': posiciones, 'cuerpo': cuerpo, 'etag': etag, 'modificado': modificado}
+
+
+def posiciones_cacheadas(recorrido_id):
+    """
+    Posiciones del recorrido ya serializadas, con su ETag y Last-Modified.
+    Se calculan a lo sumo una vez por tick y se comparten en el cache entre
+    todos los procesos (polling JSON y productores del stream SSE).
+    Devuelve None si el recorrido no existe.
+    """
+    clave = _clave_posiciones(recorrido_id)
+    entrada = cache.get(clave)
+    if entrada is not None:
+        return entrada
+
+    # Solo un proceso calcula; el resto espera un momento y, si todavía no está,
+    # sirve el snapshot anterior (a lo sumo un tick más viejo) en lugar de esperar
+    clave_lock = f"{clave}:calculando"
+    calcula = cache.add(clave_lock, True, TICK_SEGUNDOS)
+    if not calcula:
+        time.sleep(ESPERA_CALCULO_SEGUNDOS)
+        entrada = cache.get(clave) or cache.get(f"{clave}:ultima")
+        if entrada is not None:
+            return entrada
+
+    try:
+        entrada = _calcular_entrada(recorrido_id)
+        cache.set(clave, entrada, TICK_SEGUNDOS)
+        cache.set(f"{clave}:ultima", entrada, SNAPSHOT_ANTERIOR_TIMEOUT)
+    finally:
+        # El lock se libera solo si es propio
+        if calcula:
+            cache.delete(clave_lock)
+    return entrada
+
+
+def buses_en_rectangulo(sur, oeste, norte, este):
+    """
+    Buses en curso de todos los recorridos dentro del rectángulo. Son pocos y se
+    mueven a cada tick: se filtran sobre las posiciones ya cacheadas, sin índice.
+    """
+    recorrido_ids = (
+        Viaje.objects
+        .filter(fecha_hora_inicio_real__isnull=False, fecha_hora_fin_real__isnull=True)
+        .values_list('recorrido_id', flat=True)
+        .distinct()
+    )
+    buses = []
+    for recorrido_id in recorrido_ids:
+        entrada = posiciones_cacheadas(recorrido_id)
+        for posicion in (entrada['posiciones'].values() if entrada else ()):
+            if sur <= posicion['lat'] <= norte and oeste <= posicion['lng'] <= este:
+                buses.append({'recorrido_id': recorrido_id, **posicion})
+    return buses
+
+
+class CanalPosiciones:
+    """
+    Productor único de posiciones para un recorrido. Mientras haya suscriptores
+    calcula las posiciones una vez por tick y reparte el mismo delta a todas las
+    colas, sin importar cuántos clientes estén mirando el mapa.
+    """
+
+    def __init__(self, clave, recorrido_id):
+        self.clave = clave
+        self.recorrido_id = recorrido_id
+        self.suscriptores = set()
+        self.posiciones = None
+        self.tarea = None
+
+    def suscribir(self):
+        cola = asyncio.Queue(maxsize=COLA_MAXIMA)
+        if self.posiciones is not None:
+            cola.put_nowait({'tipo': 'snapshot', 'buses': list(self.posiciones.values())})
+        self.suscriptores.add(cola)
+        if self.tarea is None:
+            self.tarea = asyncio.get_running_loop().create_task(self._producir())
+        return cola
+
+    def desuscribir(self, cola):
+        self.suscriptores.discard(cola)
+
+    def _publicar(self, evento):
+        for cola in list(self.suscriptores):
+            if cola.full():
+                cola.get_nowait()
+            cola.put_nowait(evento)
+
+    async def _producir(self):
+        try:
+            while self.suscriptores:
+                try:
+                    # Lectura sin estado de hilo: no ocupa el hilo sync compartido de ASGI
+                    entrada = await sync_to_async(posiciones_cacheadas, thread_sensitive=False)(self.recorrido_id)
+                    actuales = entrada['posiciones'] if entrada else {}
+                except Exception as exc:
+                    logger.error("Error calculando posiciones del recorrido %s: %s", self.recorrido_id, exc)
+                else:
+                    if self.posiciones is None:
+                        self._publicar({'tipo': 'snapshot', 'buses': list(actuales.values())})
+                    else:
+                        delta = delta_posiciones(self.posiciones, actuales)
+                        if delta['actualizados'] or delta['removidos']:
+                            self._publicar({'tipo': 'delta', **delta})
+                    self.posiciones = actuales
+                await asyncio.sleep(TICK_SEGUNDOS)
+        finally:
+            self.tarea = None
+            self.posiciones = None
+            if _canales.get(self.clave) is self and not self.suscriptores:
+                del _canales[self.clave]
+
+
+# Un canal por recorrido y por event loop (bajo ASGI hay un único loop por proceso)
+_canales = {}
+
+
+def canal_posiciones(recorrido_id):
+    clave = (id(asyncio.get_running_loop()), recorrido_id)
+    canal = _canales.get(clave)
+    if canal is None:
+        canal = _canales[clave] = CanalPosiciones(clave, recorrido_id)
+    return canal
+
+
+def evento_sse(evento):
+    datos = json.dumps(evento, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return f"event: {evento['tipo']}\ndata: {datos}\n\n"
+
+
+async def stream_posiciones(recorrido_id):
+    """Generador de eventos Server-Sent Events con las posiciones del recorrido."""
+    canal = canal_posiciones(recorrido_id)
+    cola = canal.suscribir()
+    try:
+        yield f'retry: {int(TICK_SEGUNDOS * 1000)}\n\n'
+        while True:
+            try:
+                evento = await asyncio.wait_for(cola.get(), HEARTBEAT_SEGUNDOS)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            yield evento_sse(evento)
+    finally:
+        canal.desuscribir(cola)
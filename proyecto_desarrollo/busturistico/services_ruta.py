@@ -0,0 +1,504 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from .models import Atractivo, ParadaAtractivo, Recorrido, RecorridoParada, RutaRecorrido
+
+logger = logging.getLogger(__name__)
+
+COLOR_PALETTE = {
+    'rojo': '#dc3545',
+    'verde': '#198754',
+    'azul': '#0d6efd',
+    'amarillo': '#ffc107',
+    'naranja': '#fd7e14',
+    'violeta': '#6f42c1',
+    'purpura': '#6f42c1',
+    'morado': '#6f42c1',
+    'rosa': '#e83e8c',
+    'celeste': '#0dcaf0',
+    'cian': '#0dcaf0',
+    'gris': '#6c757d',
+}
+COLOR_POR_DEFECTO = '#0d6efd'
+
+OSRM_PARAMS = {'overview': 'full', 'geometries': 'geojson'}
+GEOJSON_VERSION = 1
+
+# Velocidad usada para estimar tiempos cuando el recorrido no tiene duración cargada
+VELOCIDAD_PROMEDIO_MS = 25 / 3.6
+# Distancia máxima (m) para considerar que la ruta pasa por una parada
+TOLERANCIA_PARADA_M = 30
+
+
+def resolver_color(nombre: str) -> str:
+    if not nombre:
+        return COLOR_POR_DEFECTO
+    return COLOR_PALETTE.get(nombre.strip().lower(), COLOR_POR_DEFECTO)
+
+
+def haversine_m(lat1, lon1, lat2, lon2) -> float:
+    """Distancia en metros entre dos coordenadas."""
+    R = 6371000.0
+    lat1_rad, lon1_rad, lat2_rad, lon2_rad = map(math.radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
+    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def rumbo_grados(a, b) -> float:
+    """Rumbo (0 = norte, sentido horario) para ir del punto a al b."""
+    lat1, lat2 = math.radians(a[0]), math.radians(b[0])
+    dlon = math.radians(b[1] - a[1])
+    x = math.sin(dlon) * math.cos(lat2)
+    y = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dlon)
+    return (math.degrees(math.atan2(x, y)) + 360) % 360
+
+
+def distancias_acumuladas(puntos):
+    acumulada = 0.0
+    distancias = [0.0]
+    for a, b in zip(puntos, puntos[1:]):
+        acumulada += haversine_m(a[0], a[1], b[0], b[1])
+        distancias.append(round(acumulada, 1))
+    return distancias
+
+
+def proyectar_en_segmento(punto, a, b):
+    """
+    Proyecta punto sobre el segmento a-b (todos [lat, lng]) en un plano local.
+    Devuelve (fraccion del segmento, distancia lateral en metros).
+    """
+    kx = 111320.0 * math.cos(math.radians(a[0]))
+    ky = 110540.0
+    bx, by = (b[1] - a[1]) * kx, (b[0] - a[0]) * ky
+    px, py = (punto[1] - a[1]) * kx, (punto[0] - a[0]) * ky
+    largo2 = bx * bx + by * by
+    t = 0.0 if largo2 == 0 else max(0.0, min(1.0, (px * bx + py * by) / largo2))
+    return t, math.hypot(px - t * bx, py - t * by)
+
+
+def duracion_segundos(recorrido, distancia_total_m) -> float:
+    duracion = recorrido.duracion_aproximada_recorrido
+    segundos = duracion.hour * 3600 + duracion.minute * 60 + duracion.second if duracion else 0
+    if segundos:
+        return float(segundos)
+    return distancia_total_m / VELOCIDAD_PROMEDIO_MS
+
+
+def animacion_programada(recorrido, ruta):
+    """
+    Contrato de animación del mapa: el bus recorre la ruta en la duración
+    programada del recorrido (la misma que usan las ETA y finalizar_viajes_vencidos).
+    Los keyframes [ms desde la salida, fracción de la distancia total] salen de
+    los offsets del índice de paradas; el navegador toma la geometría del
+    GeoJSON (route_feature_id) y ubica el bus por distancia recorrida.
+    """
+    total_m = ruta.distancia_total_m
+    duracion_ms = int(duracion_segundos(recorrido, total_m) * 1000)
+    keyframes = [[0, 0.0]]
+    if total_m:
+        indice = ruta.indice_paradas or {}
+        for offset_s, distancia in zip(indice.get('offsets_s', []), indice.get('distancias_m', [])):
+            keyframes.append([min(int(offset_s * 1000), duracion_ms), min(distancia / total_m, 1.0)])
+    keyframes.append([duracion_ms, 1.0])
+    return {
+        'duration_ms': duracion_ms,
+        'keyframes': keyframes,
+        'route_feature_id': f"recorrido-{recorrido.id}",
+        'route_vertices': len(ruta.geometria),
+    }
+
+
+def construir_indice_paradas(recorrido, paradas_recorrido, geometria, distancias):
+    """
+    Ubica cada parada sobre la geometría (avanzando siempre hacia adelante) y
+    precalcula su distancia acumulada y el tiempo programado desde la salida.
+    """
+    paradas_recorrido = [
+        rp for rp in paradas_recorrido
+        if rp.parada.latitud_parada is not None and rp.parada.longitud_parada is not None
+    ]
+    total_m = distancias[-1] if distancias else 0.0
+    duracion_s = duracion_segundos(recorrido, total_m)
+    indice = {'parada_ids': [], 'ordenes': [], 'distancias_m': [], 'offsets_s': []}
+
+    segmento_desde = 0
+    for rp in paradas_recorrido:
+        punto = (rp.parada.latitud_parada, rp.parada.longitud_parada)
+        mejor = None
+        for i in range(segmento_desde, len(geometria) - 1):
+            t, lateral = proyectar_en_segmento(punto, geometria[i], geometria[i + 1])
+            if mejor is None or lateral < mejor[2]:
+                mejor = (i, t, lateral)
+            if lateral <= TOLERANCIA_PARADA_M:
+                break
+
+        if mejor is None:
+            distancia = total_m
+        else:
+            i, t, _ = mejor
+            segmento_desde = i
+            distancia = distancias[i] + t * (distancias[i + 1] - distancias[i])
+        if indice['distancias_m']:
+            # Nunca retroceder: el índice tiene que quedar ordenado para poder usar bisect
+            distancia = max(distancia, indice['distancias_m'][-1])
+
+        indice['parada_ids'].append(rp.parada_id)
+        indice['ordenes'].append(rp.orden)
+        indice['distancias_m'].append(round(distancia, 1))
+        indice['offsets_s'].append(round(distancia / total_m * duracion_s, 1) if total_m else 0.0)
+    return indice
+
+
+def actualizar_indice_paradas(ruta, paradas_recorrido=None, guardar=True):
+    """
+    Recalcula el índice de paradas de una ruta ya trazada (sin volver a consultar
+    OSRM). Con guardar=False solo se actualiza la instancia en memoria.
+    """
+    if paradas_recorrido is None:
+        paradas_recorrido = paradas_ordenadas(ruta.recorrido)
+    if not ruta.distancias_acumuladas:
+        ruta.distancias_acumuladas = distancias_acumuladas(ruta.geometria)
+    ruta.indice_paradas = construir_indice_paradas(
+        ruta.recorrido, paradas_recorrido, ruta.geometria, ruta.distancias_acumuladas
+    )
+    if guardar:
+        ruta.save(update_fields=['distancias_acumuladas', 'indice_paradas', 'fecha_actualizacion'])
+    return ruta
+
+
+def indice_vigente(ruta, paradas_recorrido) -> bool:
+    parada_ids = [
+        rp.parada_id for rp in paradas_recorrido
+        if rp.parada.latitud_parada is not None and rp.parada.longitud_parada is not None
+    ]
+    return bool(ruta.indice_paradas) and ruta.indice_paradas.get('parada_ids') == parada_ids
+
+
+def osrm_base_url() -> str:
+    base_url = getattr(settings, 'OSRM_BASE_URL', '').strip() or 'https://router.project-osrm.org'
+    return base_url.rstrip('/')
+
+
+def osrm_route_url(puntos) -> str:
+    coordinates = ';'.join(f"{lng},{lat}" for lat, lng in puntos)
+    return f"{osrm_base_url()}/route/v1/driving/{coordinates}"
+
+
+def parsear_respuesta_osrm(data):
+    """Convierte la respuesta de OSRM en una lista de [lat, lng] o None."""
+    if data.get('code') != 'Ok' or not data.get('routes'):
+        return None
+    geometry = data['routes'][0].get('geometry', {}).get('coordinates')
+    if not geometry:
+        return None
+    return [[lat, lng] for lng, lat in geometry]
+
+
+def rutear_con_osrm(puntos, timeout=None):
+    """Pide a OSRM la geometría que une los puntos (lat, lng). Devuelve None si falla."""
+    if len(puntos) < 2:
+        return None
+    timeout = timeout or getattr(settings, 'OSRM_TIMEOUT', 5)
+    try:
+        response = requests.get(osrm_route_url(puntos), params=OSRM_PARAMS, timeout=timeout)
+        response.raise_for_status()
+        return parsear_respuesta_osrm(response.json())
+    except (requests.RequestException, ValueError) as exc:
+        logger.warning("OSRM routing failed: %s", exc)
+        return None
+
+
+async def rutear_varios_async(lista_puntos, concurrencia=None, timeout=None):
+    """
+    Traza varias rutas a la vez. Cada pedido a OSRM corre en un thread (requests es
+    bloqueante) con el timeout puesto en el propio pedido, y el semáforo recién se
+    libera cuando el thread termina: nunca hay más de `concurrencia` pedidos en vuelo.
+    La demora total queda acotada por la ruta más lenta y no por la suma de todas.
+    Devuelve las geometrías en el mismo orden (None para las que fallaron).
+    """
+    concurrencia = concurrencia or getattr(settings, 'OSRM_CONCURRENCIA', 4)
+    timeout = timeout or getattr(settings, 'OSRM_TIMEOUT', 5)
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def rutear(puntos):
+        async with semaforo:
+            return await asyncio.to_thread(rutear_con_osrm, puntos, timeout)
+
+    return await asyncio.gather(*(rutear(puntos) for puntos in lista_puntos))
+
+
+def rutear_varios(lista_puntos, concurrencia=None, timeout=None):
+    """Versión para código sincrónico (vistas WSGI, comandos de management)."""
+    if not lista_puntos:
+        return []
+    return async_to_sync(rutear_varios_async)(lista_puntos, concurrencia, timeout)
+
+
+def puntos_paradas(paradas_recorrido):
+    """Coordenadas (lat, lng) de una lista ordenada de RecorridoParada."""
+    return [
+        (rp.parada.latitud_parada, rp.parada.longitud_parada)
+        for rp in paradas_recorrido
+        if rp.parada.latitud_parada is not None and rp.parada.longitud_parada is not None
+    ]
+
+
+def calcular_firma(puntos) -> str:
+    texto = ';'.join(f"{lat:.6f},{lng:.6f}" for lat, lng in puntos)
+    return hashlib.sha256(texto.encode()).hexdigest()
+
+
+def paradas_ordenadas(recorrido):
+    return list(
+        RecorridoParada.objects
+        .filter(recorrido=recorrido)
+        .select_related('parada')
+        .order_by('orden')
+    )
+
+
+def guardar_ruta(recorrido, puntos, geometria_osrm, paradas_recorrido=None):
+    """
+    Persiste la geometría trazada (o la línea recta entre paradas como fallback).
+    Si OSRM no respondió pero ya hay una ruta de OSRM para estas mismas paradas,
+    se conserva esa en lugar de reemplazarla por la línea recta.
+    """
+    if geometria_osrm is None:
+        guardada = RutaRecorrido.objects.filter(recorrido=recorrido).select_related('recorrido').first()
+        if guardada is not None and guardada.trazada_con_osrm and ruta_vigente(guardada, puntos):
+            logger.warning("OSRM no respondió: se conserva la ruta guardada de %s", recorrido)
+            return guardada
+    if paradas_recorrido is None:
+        paradas_recorrido = paradas_ordenadas(recorrido)
+    geometria = geometria_osrm or [[lat, lng] for lat, lng in puntos]
+    distancias = distancias_acumuladas(geometria)
+    ruta, _ = RutaRecorrido.objects.update_or_create(
+        recorrido=recorrido,
+        defaults={
+            'geometria': geometria,
+            'firma_paradas': calcular_firma(puntos),
+            'trazada_con_osrm': bool(geometria_osrm),
+            'distancia_total_m': distancias[-1],
+            'distancias_acumuladas': distancias,
+            'indice_paradas': construir_indice_paradas(recorrido, paradas_recorrido, geometria, distancias),
+        },
+    )
+    return ruta
+
+
+def ruta_vigente(ruta, puntos) -> bool:
+    """La geometría guardada corresponde a las paradas actuales (aunque sea la línea recta)."""
+    return ruta is not None and ruta.firma_paradas == calcular_firma(puntos)
+
+
+def requiere_trazado(ruta, puntos) -> bool:
+    """
+    Hay que (re)trazar si falta la ruta, si cambiaron las paradas o si quedó en
+    línea recta porque OSRM falló y ya pasó la espera para reintentar (así un
+    OSRM caído no se consulta en cada request).
+    """
+    if not ruta_vigente(ruta, puntos):
+        return True
+    if ruta.trazada_con_osrm:
+        return False
+    espera = timedelta(seconds=getattr(settings, 'OSRM_REINTENTO', 600))
+    return timezone.now() - ruta.fecha_actualizacion >= espera
+
+
+def trazar_pendientes(pendientes, concurrencia=None, timeout=None):
+    """
+    Traza en paralelo y guarda las rutas de una lista de
+    (recorrido, paradas_recorrido, puntos). Devuelve las RutaRecorrido guardadas.
+    """
+    geometrias = rutear_varios([puntos for _, _, puntos in pendientes], concurrencia, timeout)
+    return [
+        guardar_ruta(recorrido, puntos, geometria, paradas_recorrido)
+        for (recorrido, paradas_recorrido, puntos), geometria in zip(pendientes, geometrias)
+    ]
+
+
+def obtener_ruta(recorrido, paradas_recorrido=None, trazar=True):
+    """
+    Devuelve la RutaRecorrido guardada del recorrido.
+    Si no existe o las paradas cambiaron desde que se trazó, la vuelve a trazar.
+    Una ruta que quedó en línea recta se reintenta con OSRM pasado OSRM_REINTENTO.
+    Con trazar=False es de solo lectura (vistas públicas): nunca consulta OSRM ni
+    escribe; devuelve None si no hay ruta vigente y, si el índice de paradas
+    quedó desactualizado, lo recalcula solo en memoria.
+    """
+    if paradas_recorrido is None:
+        paradas_recorrido = paradas_ordenadas(recorrido)
+    puntos = puntos_paradas(paradas_recorrido)
+    if len(puntos) < 2:
+        return None
+
+    ruta = RutaRecorrido.objects.filter(recorrido=recorrido).select_related('recorrido').first()
+    if trazar and requiere_trazado(ruta, puntos):
+        return guardar_ruta(recorrido, puntos, rutear_con_osrm(puntos), paradas_recorrido)
+    if ruta_vigente(ruta, puntos):
+        if not indice_vigente(ruta, paradas_recorrido):
+            actualizar_indice_paradas(ruta, paradas_recorrido, guardar=trazar)
+        return ruta
+    return None
+
+
+_trazados_pendientes = set()
+_lock_trazados = threading.Lock()
+_executor_trazados = None
+
+
+def _trazar_en_segundo_plano(recorrido_id):
+    try:
+        recorrido = Recorrido.objects.filter(pk=recorrido_id).first()
+        if recorrido is not None:
+            obtener_ruta(recorrido)
+    except Exception as exc:
+        logger.error("Error trazando la ruta del recorrido %s: %s", recorrido_id, exc)
+    finally:
+        with _lock_trazados:
+            _trazados_pendientes.discard(recorrido_id)
+        connection.close()
+
+
+def programar_trazado(recorrido_ids):
+    """
+    Encola (re)trazar las rutas de los recorridos en segundo plano, una sola vez
+    por recorrido aunque se pida varias. Lo usan los signals cuando cambian las
+    paradas: las vistas públicas solo leen la ruta guardada.
+    """
+    global _executor_trazados
+    with _lock_trazados:
+        if _executor_trazados is None:
+            _executor_trazados = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rutas')
+        nuevos = [recorrido_id for recorrido_id in dict.fromkeys(recorrido_ids)
+                  if recorrido_id not in _trazados_pendientes]
+        _trazados_pendientes.update(nuevos)
+    for recorrido_id in nuevos:
+        _executor_trazados.submit(_trazar_en_segundo_plano, recorrido_id)
+
+
+def construir_geojson():
+    """
+    FeatureCollection con la geometría de todos los recorridos, sus paradas
+    y los atractivos asociados a cada parada.
+    """
+    recorridos = list(Recorrido.objects.order_by('color_recorrido'))
+    paradas_por_recorrido = {recorrido.id: [] for recorrido in recorridos}
+    for rp in RecorridoParada.objects.select_related('parada').order_by('recorrido_id', 'orden'):
+        paradas_por_recorrido.setdefault(rp.recorrido_id, []).append(rp)
+    # Solo lectura: las rutas faltantes o desactualizadas no se dibujan hasta que
+    # las trace construir_rutas o el trazado en segundo plano de los signals
+    rutas = {ruta.recorrido_id: ruta for ruta in RutaRecorrido.objects.all()}
+
+    features = []
+    paradas = {}
+    for recorrido in recorridos:
+        paradas_recorrido = paradas_por_recorrido.get(recorrido.id, [])
+        puntos = puntos_paradas(paradas_recorrido)
+        ruta = rutas.get(recorrido.id)
+
+        color = resolver_color(recorrido.color_recorrido)
+        if len(puntos) >= 2 and ruta_vigente(ruta, puntos):
+            features.append({
+                'type': 'Feature',
+                'id': f"recorrido-{recorrido.id}",
+                'geometry': {
+                    'type': 'LineString',
+                    'coordinates': [[lng, lat] for lat, lng in ruta.geometria],
+                },
+                'properties': {
+                    'tipo': 'recorrido',
+                    'id': recorrido.id,
+                    'nombre': recorrido.color_recorrido,
+                    'color': color,
+                    'line_dash': None if ruta.trazada_con_osrm else '6,6',
+                    'distancia_m': round(ruta.distancia_total_m),
+                    'paradas': [rp.parada_id for rp in paradas_recorrido],
+                },
+            })
+
+        for rp in paradas_recorrido:
+            parada = paradas.setdefault(rp.parada_id, {'parada': rp.parada, 'recorridos': []})
+            parada['recorridos'].append({'id': recorrido.id, 'orden': rp.orden, 'color': color})
+
+    for parada_id, data in paradas.items():
+        parada = data['parada']
+        features.append({
+            'type': 'Feature',
+            'id': f"parada-{parada_id}",
+            'geometry': {
+                'type': 'Point',
+                'coordinates': [parada.longitud_parada, parada.latitud_parada],
+            },
+            'properties': {
+                'tipo': 'parada',
+                'id': parada_id,
+                'nombre': parada.nombre_parada,
+                'direccion': parada.direccion_parada,
+                'recorridos': data['recorridos'],
+            },
+        })
+
+    paradas_por_atractivo = {}
+    for atractivo_id, parada_id in ParadaAtractivo.objects.values_list('atractivo_id', 'parada_id'):
+        paradas_por_atractivo.setdefault(atractivo_id, []).append(parada_id)
+    for atractivo in Atractivo.objects.filter(id__in=paradas_por_atractivo.keys()).order_by('id'):
+        features.append({
+            'type': 'Feature',
+            'id': f"atractivo-{atractivo.id}",
+            'geometry': {
+                'type': 'Point',
+                'coordinates': [atractivo.longitud_atractivo, atractivo.latitud_atractivo],
+            },
+            'properties': {
+                'tipo': 'atractivo',
+                'id': atractivo.id,
+                'nombre': atractivo.nombre_atractivo,
+                'calificacion_estrellas': atractivo.calificacion_estrellas,
+                'paradas': paradas_por_atractivo[atractivo.id],
+            },
+        })
+
+    return {
+        'type': 'FeatureCollection',
+        'version': GEOJSON_VERSION,
+        'features': features,
+    }
+
+
+GEOJSON_CACHE_KEY = f"mapa:geojson:v{GEOJSON_VERSION}"
+
+
+def geojson_serializado():
+    """
+    Devuelve (cuerpo, etag) del GeoJSON de recorridos.
+    Se serializa una sola vez y queda en cache hasta que cambien los datos
+    (ver signals.py); el ETag es el hash del contenido.
+    """
+    cached = cache.get(GEOJSON_CACHE_KEY)
+    if cached is not None:
+        return cached
+
+    cuerpo = json.dumps(construir_geojson(), separators=(',', ':')).encode()
+    etag = hashlib.sha256(cuerpo).hexdigest()[:32]
+    cache.set(GEOJSON_CACHE_KEY, (cuerpo, etag), None)
+    return cuerpo, etag
+
+
+def invalidar_geojson():
+    cache.delete(GEOJSON_CACHE_KEY)
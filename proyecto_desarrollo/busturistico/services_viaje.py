@@ -1,6 +1,14 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
 from django.utils import timezone
 
-from .models import EstadoViaje, HistorialEstadoViaje, Viaje
+from .models import EstadoViaje, HistorialEstadoViaje, Recorrido, RutaRecorrido, Viaje
+from .services_ruta import duracion_segundos
+
+# Tolerancia por sobre la duración programada antes de dar un viaje por terminado
+MARGEN_FINALIZACION = timedelta(minutes=15)
 
 
 def finalizar_viaje(viaje: Viaje, timestamp=None, registrar_inicio=True) -> bool:
@@ -27,13 +35,77 @@ def finalizar_viaje(viaje: Viaje, timestamp=None, registrar_inicio=True) -> bool
 
     viaje.save(update_fields=update_fields)
 
-    estado_completado, _ = EstadoViaje.objects.get_or_create(
-        nombre_estado='Completado',
-        defaults={'descripcion_estado': 'Viaje completado'}
-    )
     HistorialEstadoViaje.objects.create(
         viaje=viaje,
-        estado_viaje=estado_completado,
+        estado_viaje=estado_completado(),
         fecha_cambio_estado=ahora
     )
     return True
+
+
+def estado_completado() -> EstadoViaje:
+    estado, _ = EstadoViaje.objects.get_or_create(
+        nombre_estado='Completado',
+        defaults={'descripcion_estado': 'Viaje completado'}
+    )
+    return estado
+
+
+def duraciones_programadas():
+    """{recorrido_id: duración programada (timedelta)} de todos los recorridos."""
+    distancias = dict(RutaRecorrido.objects.values_list('recorrido_id', 'distancia_total_m'))
+    return {
+        recorrido.id: timedelta(seconds=duracion_segundos(recorrido, distancias.get(recorrido.id, 0.0)))
+        for recorrido in Recorrido.objects.all()
+    }
+
+
+def finalizar_viajes_vencidos(ahora=None, margen=MARGEN_FINALIZACION) -> int:
+    """
+    Cierra en bloque los viajes en curso cuyo fin programado (inicio real +
+    duración del recorrido) quedó más de `margen` en el pasado: un único UPDATE
+    y un único INSERT del historial. El fin se registra en el horario programado.
+    Retorna la cantidad de viajes finalizados.
+    """
+    ahora = ahora or timezone.now()
+    duraciones = duraciones_programadas()
+    if not duraciones:
+        return 0
+
+    condicion = Q()
+    for recorrido_id, duracion in duraciones.items():
+        condicion |= Q(recorrido_id=recorrido_id, fecha_hora_inicio_real__lt=ahora - duracion - margen)
+
+    with transaction.atomic():
+        vencidos = list(
+            Viaje.objects
+            .select_for_update()
+            .filter(condicion, fecha_hora_inicio_real__isnull=False, fecha_hora_fin_real__isnull=True)
+            .values_list('id', 'recorrido_id', 'fecha_hora_inicio_real')
+        )
+        if not vencidos:
+            return 0
+
+        fin_programado = [
+            When(recorrido_id=recorrido_id, then=F('fecha_hora_inicio_real') + Value(duracion))
+            for recorrido_id, duracion in duraciones.items()
+        ]
+        minutos_programados = [
+            When(recorrido_id=recorrido_id, then=Value(int(duracion.total_seconds() // 60)))
+            for recorrido_id, duracion in duraciones.items()
+        ]
+        Viaje.objects.filter(id__in=[viaje_id for viaje_id, _, _ in vencidos]).update(
+            fecha_hora_fin_real=Case(*fin_programado),
+            duracion_minutos_real=Case(*minutos_programados, output_field=IntegerField()),
+        )
+
+        estado = estado_completado()
+        HistorialEstadoViaje.objects.bulk_create([
+            HistorialEstadoViaje(
+                viaje_id=viaje_id,
+                estado_viaje=estado,
+                fecha_cambio_estado=inicio + duraciones[recorrido_id],
+            )
+            for viaje_id, recorrido_id, inicio in vencidos
+        ])
+    return len(vencidos)
@@ -0,0 +1,221 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import (
+    Atractivo, Chofer, EstadoBusHistorial, Parada, ParadaAtractivo, Recorrido, RecorridoParada, RutaRecorrido, Viaje,
+)
+from .services_autocompletar import actualizar_entidades
+from .services_busqueda import TIPO_POR_MODELO, desindexar, indexar
+from .services_cache import (
+    MODELOS_CATALOGO, MODELOS_CON_TIEMPOS, generacion, generacion_anterior, incrementar_generacion,
+)
+from .services_choferes import invalidar_chofer
+from .services_espacial import vincular_por_cercania
+from .services_horarios import invalidar_proximas_salidas, invalidar_tablero
+from .services_imagenes import CAMPOS_FOTO, programar_derivadas
+from .services_ruta import actualizar_indice_paradas, invalidar_geojson, programar_trazado
+
+MODELOS_MAPA = (Recorrido, Parada, RecorridoParada, Atractivo, ParadaAtractivo, RutaRecorrido)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidar_mapa(sender, **kwargs):
+    """Descarta el GeoJSON cacheado cuando cambia algún dato que se dibuja en el mapa."""
+    if sender in MODELOS_MAPA:
+        invalidar_geojson()
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def incrementar_generacion_catalogo(sender, **kwargs):
+    """Nueva versión del modelo: las páginas y fragmentos cacheados con la anterior dejan de usarse."""
+    if sender in MODELOS_CON_TIEMPOS:
+        incrementar_generacion(sender)
+
+
+@receiver(pre_save, sender=Recorrido)
+def recordar_duracion(sender, instance, raw=False, **kwargs):
+    """Guarda la duración anterior para saber después si hay que recalcular los tiempos."""
+    if instance.pk and not raw:
+        instance._duracion_previa = sender.objects.filter(pk=instance.pk).values_list(
+            'duracion_aproximada_recorrido', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Recorrido)
+def recalcular_tiempos_ruta(sender, instance, created, raw=False, **kwargs):
+    """
+    La duración del recorrido define los offsets de cada parada: si cambió se
+    recalcula el índice. Un recorrido nuevo todavía no tiene ruta, y en
+    loaddata el índice lo arma construir_rutas.
+    """
+    if created or raw:
+        return
+    duracion = instance.duracion_aproximada_recorrido
+    if getattr(instance, '_duracion_previa', None) == duracion:
+        return
+    instance._duracion_previa = duracion
+    ruta = RutaRecorrido.objects.filter(recorrido=instance).first()
+    if ruta:
+        ruta.recorrido = instance
+        actualizar_indice_paradas(ruta)
+
+
+@receiver(post_save, sender=RecorridoParada)
+@receiver(post_delete, sender=RecorridoParada)
+def retrazar_ruta(sender, instance, raw=False, **kwargs):
+    """
+    Cambiaron las paradas del recorrido: su ruta se vuelve a trazar en segundo
+    plano (las vistas públicas solo leen la guardada). En loaddata no se traza;
+    para eso está construir_rutas.
+    """
+    if raw:
+        return
+    recorrido_id = instance.recorrido_id
+    transaction.on_commit(lambda: programar_trazado([recorrido_id]))
+
+
+@receiver(post_save, sender=Viaje)
+@receiver(post_delete, sender=Viaje)
+def invalidar_horarios(sender, **kwargs):
+    """Un viaje programado, iniciado o borrado cambia las próximas salidas, el tablero y la red de viajes."""
+    invalidar_proximas_salidas()
+    invalidar_tablero()
+    incrementar_generacion(Viaje)
+
+
+@receiver(post_save, sender=RutaRecorrido)
+@receiver(post_save, sender=RecorridoParada)
+@receiver(post_delete, sender=RecorridoParada)
+def invalidar_tablero_paradas(sender, **kwargs):
+    """Cambian los offsets de las paradas: el tablero se vuelve a materializar."""
+    invalidar_tablero()
+
+
+@receiver(post_save, sender=EstadoBusHistorial)
+@receiver(post_delete, sender=EstadoBusHistorial)
+def incrementar_generacion_estados(sender, **kwargs):
+    """Cambió el estado actual de algún bus: el contador de operativos se vuelve a calcular."""
+    incrementar_generacion(sender)
+
+
+@receiver(pre_save)
+def recordar_foto(sender, instance, raw=False, **kwargs):
+    """Guarda el nombre anterior de la foto para saber después si cambió."""
+    campo = CAMPOS_FOTO.get(sender)
+    if campo is not None and instance.pk and not raw:
+        instance._foto_previa = sender.objects.filter(pk=instance.pk).values_list(campo, flat=True).first()
+
+
+@receiver(post_save)
+def generar_variantes_foto(sender, instance, created, raw=False, **kwargs):
+    """
+    Variantes redimensionadas de la foto, en segundo plano y una vez confirmada
+    la transacción. Solo si la foto es nueva o cambió de archivo. En loaddata
+    no se generan; para eso está generar_variantes_fotos.
+    """
+    campo = CAMPOS_FOTO.get(sender)
+    if campo is None or raw:
+        return
+    foto = getattr(instance, campo)
+    if not foto:
+        return
+    nombre = foto.name
+    if not created and getattr(instance, '_foto_previa', None) == nombre:
+        return
+    instance._foto_previa = nombre
+    transaction.on_commit(lambda: programar_derivadas(nombre, sender))
+
+
+@receiver(post_save)
+def indexar_busqueda(sender, instance, raw=False, **kwargs):
+    """
+    Mantiene el índice de texto al día, dentro de la misma transacción que el
+    cambio. En loaddata no se indexa; para eso está reindexar_busqueda.
+    """
+    if raw:
+        return
+    if sender in TIPO_POR_MODELO:
+        indexar(instance)
+
+
+@receiver(post_delete)
+def desindexar_busqueda(sender, instance, **kwargs):
+    if sender in TIPO_POR_MODELO:
+        desindexar(sender, instance.pk)
+
+
+def entidades_afectadas(sender, instance):
+    """(tipo, id) de las sugerencias de autocompletado que dependen de la instancia."""
+    if sender in TIPO_POR_MODELO:
+        return [(TIPO_POR_MODELO[sender], instance.pk)]
+    if sender is RecorridoParada:
+        return [('recorrido', instance.recorrido_id), ('parada', instance.parada_id)]
+    if sender is ParadaAtractivo:
+        return [('parada', instance.parada_id), ('atractivo', instance.atractivo_id)]
+    return []
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def actualizar_autocompletado(sender, instance, **kwargs):
+    afectadas = entidades_afectadas(sender, instance)
+    if afectadas:
+        # incrementar_generacion_catalogo ya corrió: la generación actual es la de este cambio
+        nueva = generacion(*MODELOS_CATALOGO)
+        previa = generacion_anterior(nueva, sender, MODELOS_CATALOGO)
+        transaction.on_commit(lambda: actualizar_entidades(afectadas, previa, nueva))
+
+
+CAMPOS_COORDENADAS = {
+    Atractivo: ('latitud_atractivo', 'longitud_atractivo'),
+    Parada: ('latitud_parada', 'longitud_parada'),
+}
+
+
+@receiver(pre_save, sender=Atractivo)
+@receiver(pre_save, sender=Parada)
+def recordar_coordenadas(sender, instance, raw=False, **kwargs):
+    """Guarda las coordenadas anteriores para saber después si hay que revincular."""
+    if instance.pk and not raw:
+        instance._coordenadas_previas = sender.objects.filter(pk=instance.pk).values_list(
+            *CAMPOS_COORDENADAS[sender]
+        ).first()
+
+
+@receiver(post_save, sender=Atractivo)
+@receiver(post_save, sender=Parada)
+def revincular_por_cercania(sender, instance, created, raw=False, **kwargs):
+    """Solo si el punto es nuevo o se movió se recalculan sus vínculos de cercanía."""
+    if raw:
+        # loaddata: los vínculos se arman en lote con vincular_atractivos
+        return
+    coordenadas = tuple(getattr(instance, campo) for campo in CAMPOS_COORDENADAS[sender])
+    if not created and getattr(instance, '_coordenadas_previas', None) == coordenadas:
+        return
+    instance._coordenadas_previas = coordenadas
+    ids = {'atractivo_ids' if sender is Atractivo else 'parada_ids': [instance.pk]}
+    transaction.on_commit(lambda: vincular_por_cercania(**ids))
+    if sender is Parada and not created:
+        # Una parada movida cambia la firma de las rutas que pasan por ella
+        recorrido_ids = list(
+            RecorridoParada.objects.filter(parada=instance).values_list('recorrido_id', flat=True)
+        )
+        if recorrido_ids:
+            transaction.on_commit(lambda: programar_trazado(recorrido_ids))
+
+
+@receiver(post_save, sender=Chofer)
+@receiver(post_delete, sender=Chofer)
+def invalidar_identidad_chofer(sender, instance, **kwargs):
+    """Alta/baja del chofer (activo) o cambio de datos: la próxima request lo vuelve a leer."""
+    invalidar_chofer(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidar_identidad_usuario(sender, instance, **kwargs):
+    if not instance.is_active:
+        invalidar_chofer(instance.pk)
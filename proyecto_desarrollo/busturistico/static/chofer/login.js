@@ -0,0 +1,93 @@
+// Validación del formulario
+(function() {
+    'use strict';
+
+    const form = document.getElementById('loginForm');
+    const submitBtn = document.getElementById('submitBtn');
+
+    form.addEventListener('submit', function(event) {
+        if (!form.checkValidity()) {
+            event.preventDefault();
+            event.stopPropagation();
+        } else {
+            // Mostrar loading
+            submitBtn.classList.add('loading');
+            submitBtn.disabled = true;
+        }
+
+        form.classList.add('was-validated');
+    }, false);
+})();
+
+// Formato automático para legajo
+document.getElementById('legajo').addEventListener('input', function(e) {
+    let value = e.target.value.replace(/[^0-9]/g, '');
+    if (value.length > 6) value = value.substring(0, 6);
+    e.target.value = value;
+});
+
+// Formato automático para DNI
+document.getElementById('dni').addEventListener('input', function(e) {
+    let value = e.target.value.replace(/[^0-9]/g, '');
+    if (value.length > 8) value = value.substring(0, 8);
+    e.target.value = value;
+});
+
+// Animación de entrada
+document.addEventListener('DOMContentLoaded', function() {
+    const card = document.querySelector('.login-card');
+    card.style.opacity = '0';
+    card.style.transform = 'translateY(30px)';
+
+    setTimeout(() => {
+        card.style.transition = 'all 0.6s ease-out';
+        card.style.opacity = '1';
+        card.style.transform = 'translateY(0)';
+    }, 100);
+});
+
+// Efecto de partículas (opcional)
+function createParticle() {
+    const particle = document.createElement('div');
+    particle.style.cssText = `
+        position: absolute;
+        width: 4px;
+        height: 4px;
+        background: rgba(255, 255, 255, 0.3);
+        border-radius: 50%;
+        pointer-events: none;
+        animation: particleFloat 8s linear infinite;
+    `;
+
+    particle.style.left = Math.random() * 100 + '%';
+    particle.style.top = '100%';
+
+    document.body.appendChild(particle);
+
+    setTimeout(() => particle.remove(), 8000);
+}
+
+// Crear partículas cada 2 segundos
+setInterval(createParticle, 2000);
+
+// Agregar animación CSS para partículas
+const style = document.createElement('style');
+style.textContent = `
+    @keyframes particleFloat {
+        0% {
+            transform: translateY(0) rotate(0deg);
+            opacity: 0;
+        }
+        10% {
+            opacity: 1;
+        }
+        90% {
+            opacity: 1;
+        }
+        100% {
+            transform: translateY(-100vh) rotate(360deg);
+            opacity: 0;
+        }
+    }
+`;
+document.head.appendChild(style);
@@ -0,0 +1,58 @@
+// Sugerencias mientras se escribe en los inputs con data-autocompletar-url
+(function () {
+    'use strict';
+
+    const ESPERA_MS = 120;
+    const ICONOS = { recorrido: 'fa-route', parada: 'fa-map-marker-alt', atractivo: 'fa-landmark' };
+
+    document.querySelectorAll('input[data-autocompletar-url]').forEach(input => {
+        const lista = document.getElementById(input.dataset.autocompletarLista);
+        let temporizador = null;
+        let controlador = null;
+
+        function cerrar() {
+            lista.innerHTML = '';
+            lista.classList.add('d-none');
+        }
+
+        function mostrar(sugerencias) {
+            lista.innerHTML = '';
+            sugerencias.filter(s => s.url).forEach(s => {
+                const item = document.createElement('a');
+                item.href = s.url;
+                item.className = 'list-group-item list-group-item-action';
+                const icono = document.createElement('i');
+                icono.className = `fas ${ICONOS[s.tipo] || 'fa-search'} text-muted me-2`;
+                item.appendChild(icono);
+                item.appendChild(document.createTextNode(s.nombre));
+                lista.appendChild(item);
+            });
+            lista.classList.toggle('d-none', !lista.children.length);
+        }
+
+        input.addEventListener('input', () => {
+            clearTimeout(temporizador);
+            const texto = input.value.trim();
+            if (!texto) {
+                cerrar();
+                return;
+            }
+            temporizador = setTimeout(() => {
+                if (controlador) controlador.abort();
+                controlador = new AbortController();
+                const url = `${input.dataset.autocompletarUrl}?q=${encodeURIComponent(texto)}`;
+                fetch(url, { signal: controlador.signal })
+                    .then(respuesta => respuesta.json())
+                    .then(datos => mostrar(datos.sugerencias))
+                    .catch(error => { if (error.name !== 'AbortError') cerrar(); });
+            }, ESPERA_MS);
+        });
+
+        input.addEventListener('keydown', evento => {
+            if (evento.key === 'Escape') cerrar();
+        });
+        document.addEventListener('click', evento => {
+            if (!lista.contains(evento.target) && evento.target !== input) cerrar();
+        });
+    });
+})();
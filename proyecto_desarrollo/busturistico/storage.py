@@ -0,0 +1,57 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # opcional: sin el paquete solo se generan los .gz
+    brotli = None
+
+EXTENSIONES_COMPRIMIBLES = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.ttf', '.eot', '.otf')
+# Por debajo de este tamaño la compresión no compensa el overhead
+TAMANO_MINIMO_BYTES = 256
+
+
+class ManifestComprimidoStorage(ManifestStaticFilesStorage):
+    """
+    Estáticos con nombre fingerprinteado (archivo.<hash>.css) para poder servirlos
+    con cache de un año, más copias precomprimidas .gz/.br al lado de cada uno para
+    que el servidor web (gzip_static / brotli_static) no comprima en cada request.
+    """
+
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Sin collectstatic (desarrollo, tests) se usa el nombre sin hash
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        generados = set()
+        for nombre, hasheado, procesado in super().post_process(paths, dry_run, **options):
+            if hasheado and not isinstance(procesado, Exception):
+                generados.update((nombre, hasheado))
+            yield nombre, hasheado, procesado
+
+        if dry_run:
+            return
+        for nombre in sorted(generados):
+            if nombre.endswith(EXTENSIONES_COMPRIMIBLES):
+                self.comprimir(nombre)
+
+    def comprimir(self, nombre):
+        ruta = self.path(nombre)
+        with open(ruta, 'rb') as archivo:
+            contenido = archivo.read()
+        if len(contenido) < TAMANO_MINIMO_BYTES:
+            return
+        # mtime=0: la salida es determinística entre builds
+        variantes = [('.gz', gzip.compress(contenido, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variantes.append(('.br', brotli.compress(contenido)))
+        for sufijo, comprimido in variantes:
+            if len(comprimido) < len(contenido):
+                with open(ruta + sufijo, 'wb') as archivo:
+                    archivo.write(comprimido)
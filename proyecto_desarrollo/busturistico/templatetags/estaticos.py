@@ -0,0 +1,11 @@
+from django import template
+
+from busturistico.services_estaticos import etiqueta_asset
+
+register = template.Library()
+
+
+@register.simple_tag
+def asset(nombre):
+    """{% asset 'bootstrap-css' %}: dependencia de terceros, local si está vendorizada."""
+    return etiqueta_asset(nombre)
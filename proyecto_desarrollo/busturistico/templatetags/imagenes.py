@@ -0,0 +1,14 @@
+from django import template
+
+from busturistico.services_imagenes import srcset as srcset_foto
+
+register = template.Library()
+
+
+@register.filter
+def srcset(foto, formato='jpeg'):
+    """
+    srcset="{{ parada.foto_parada|srcset:'webp' }}" con las variantes de la foto.
+    Devuelve '' mientras no se hayan generado: el navegador usa el src original.
+    """
+    return srcset_foto(foto, formato)
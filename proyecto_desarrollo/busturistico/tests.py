@@ -1,3 +1,356 @@
-from django.test import TestCase
+import io
+import random
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+from datetime import date, datetime, time
+from pathlib import Path
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .models import Bus, Chofer, Parada, Recorrido, RecorridoParada, UbicacionColectivo, Viaje
+from .services_choferes import importar_choferes, leer_filas
+from .services_espacial import KDTree
+from .services_estaticos import ASSETS, vendorizar
+from .services_eta import eta_a_parada, etas_siguientes, offset_por_distancia
+from .services_mapmatching import IndiceSegmentos, registrar_lote
+from .services_planificador import red_viajes
+from .services_ruta import haversine_m
+
+# Cache propio por clase de tests (el de desarrollo es un directorio compartido)
+# y un hasher rápido para las contraseñas de los choferes
+AJUSTES_PRUEBAS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher'],
+}
+FECHA = date(2025, 3, 10)
+
+
+def crear_parada(nombre, lat, lng):
+    return Parada.objects.create(
+        nombre_parada=nombre, direccion_parada='', descripcion_parada='', latitud_parada=lat, longitud_parada=lng,
+    )
+
+
+def crear_recorrido(paradas, duracion=time(0, 30), color='Rojo'):
+    recorrido = Recorrido.objects.create(
+        color_recorrido=color, duracion_aproximada_recorrido=duracion, descripcion_recorrido='',
+    )
+    for orden, parada in enumerate(paradas, start=1):
+        RecorridoParada.objects.create(recorrido=recorrido, parada=parada, orden=orden)
+    return recorrido
+
+
+def crear_viaje(recorrido, hora=time(10, 0), **campos):
+    bus, _ = Bus.objects.get_or_create(
+        patente_bus='AB123CD', defaults={'numero_unidad': 1, 'fecha_compra': timezone.now()},
+    )
+    chofer = Chofer.objects.filter(legajo_chofer='L1').first() or Chofer.objects.create(
+        nombre_chofer='Ana', apellido_chofer='Paz', legajo_chofer='L1', dni_chofer=30123456,
+        telefono='1', fecha_ingreso=FECHA,
+    )
+    return Viaje.objects.create(
+        fecha_programada=FECHA, hora_inicio_programada=hora, patente_bus=bus, chofer=chofer,
+        recorrido=recorrido, **campos,
+    )
+
+
+class RespuestaFalsa:
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+class SesionFalsa:
+    """Sirve contenidos fijos por URL en lugar de ir al CDN."""
+
+    def __init__(self, contenidos):
+        self.contenidos = contenidos
+        self.pedidas = []
+
+    def get(self, url, timeout=None):
+        self.pedidas.append(url)
+        return RespuestaFalsa(self.contenidos.get(url, b'binario'))
+
+
+class VendorizarEstaticosTests(SimpleTestCase):
+    def setUp(self):
+        temporal = tempfile.TemporaryDirectory()
+        self.addCleanup(temporal.cleanup)
+        self.static = Path(temporal.name) / 'static'
+        self.root = Path(temporal.name) / 'staticfiles'
+        css = ASSETS['bootstrap-css']['url']
+        js = ASSETS['leaflet-js']['url']
+        self.sesion = SesionFalsa({
+            css: b'.a{background:url(../fonts/x.woff2)}\n/*# sourceMappingURL=bootstrap.min.css.map */',
+            js: b'window.L={};\n//# sourceMappingURL=leaflet.js.map\n',
+        })
+
+    def test_quita_source_maps_y_descarga_url_css(self):
+        vendorizar('bootstrap-css', self.static, self.sesion)
+        vendorizar('leaflet-js', self.static, self.sesion)
+        css = (self.static / ASSETS['bootstrap-css']['ruta']).read_bytes()
+        js = (self.static / ASSETS['leaflet-js']['ruta']).read_bytes()
+        self.assertNotIn(b'sourceMappingURL', css)
+        self.assertNotIn(b'sourceMappingURL', js)
+        self.assertIn(b'url(../fonts/x.woff2)', css)
+        self.assertTrue((self.static / 'vendor/bootstrap/5.3.2/fonts/x.woff2').exists())
+        self.assertFalse(any(url.endswith('.map') for url in self.sesion.pedidas))
+
+    def test_collectstatic_sobre_lo_vendorizado(self):
+        for nombre in ('bootstrap-css', 'leaflet-js'):
+            vendorizar(nombre, self.static, self.sesion)
+        with override_settings(
+            STATICFILES_DIRS=[self.static],
+            STATIC_ROOT=self.root,
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        hasheados = list(self.root.glob('vendor/bootstrap/5.3.2/css/bootstrap.min.*.css'))
+        self.assertEqual(len(hasheados), 1)
+        self.assertRegex(hasheados[0].read_text(), r'url\("?\.\./fonts/x\.[0-9a-f]{12}\.woff2"?\)')
+
+
+@override_settings(**AJUSTES_PRUEBAS)
+class PlanificadorTests(TestCase):
+    def setUp(self):
+        # Paradas a ~2,2 km entre sí: ninguna queda al alcance caminando de otra
+        self.a = crear_parada('A', -34.60, -58.40)
+        self.b = crear_parada('B', -34.62, -58.40)
+        self.c = crear_parada('C', -34.64, -58.40)
+
+    def punto(self, parada):
+        return parada.latitud_parada, parada.longitud_parada
+
+    def test_sin_viajes(self):
+        crear_recorrido([self.a, self.b, self.c])
+        red = red_viajes(FECHA)
+        self.assertEqual(red.conexiones, [])
+        self.assertIsNone(red.planificar(self.punto(self.a), self.punto(self.c), 9 * 3600))
+        # Sin buses igual se puede ir caminando si el destino está cerca
+        llegada, tramos = red.planificar((-34.600, -58.400), (-34.605, -58.400), 9 * 3600)
+        self.assertEqual([tramo['tipo'] for tramo in tramos], ['caminar'])
+        self.assertGreater(llegada, 9 * 3600)
+
+    def test_parada_visitada_dos_veces(self):
+        # Circuito A -> B -> C -> A: A es salida y llegada del mismo viaje.
+        # La duración se reparte por distancia: A 0 s, B 450 s, C 900 s, A 1800 s
+        crear_viaje(crear_recorrido([self.a, self.b, self.c, self.a]))
+        red = red_viajes(FECHA)
+        self.assertEqual(len(red.conexiones), 3)
+
+        llegada, tramos = red.planificar(self.punto(self.a), self.punto(self.c), 9 * 3600)
+        self.assertEqual(llegada, 10 * 3600 + 900)
+        self.assertEqual(len(tramos), 1)
+        self.assertEqual((tramos[0]['desde']['id'], tramos[0]['hasta']['id']), (self.a.id, self.c.id))
+        self.assertEqual(tramos[0]['paradas'], 2)
+
+        # Subiendo en C el mismo viaje vuelve a pasar por A
+        llegada, tramos = red.planificar(self.punto(self.c), self.punto(self.a), 10 * 3600 + 600)
+        self.assertEqual(llegada, 10 * 3600 + 1800)
+        self.assertEqual((tramos[0]['desde']['id'], tramos[0]['hasta']['id']), (self.c.id, self.a.id))
+        self.assertEqual(tramos[0]['paradas'], 1)
+
+        # Si el bus ya pasó por C no hay otro viaje ese día
+        self.assertIsNone(red.planificar(self.punto(self.c), self.punto(self.a), 10 * 3600 + 1000))
+
+
+class KDTreeTests(SimpleTestCase):
+    def setUp(self):
+        azar = random.Random(7)
+        self.puntos = [
+            (-34.6 + azar.uniform(-0.05, 0.05), -58.4 + azar.uniform(-0.05, 0.05), i) for i in range(300)
+        ]
+        self.arbol = KDTree(self.puntos)
+
+    def por_fuerza_bruta(self, lat, lng, radio_m):
+        distancias = [(haversine_m(lat, lng, p_lat, p_lng), valor) for p_lat, p_lng, valor in self.puntos]
+        return sorted((d, valor) for d, valor in distancias if d <= radio_m)
+
+    def test_vacio_y_sin_coordenadas(self):
+        arbol = KDTree([(None, -58.4, 'a'), (-34.6, None, 'b')])
+        self.assertEqual(len(arbol), 0)
+        self.assertEqual(arbol.cercanos(-34.6, -58.4, 1000, 5), [])
+        self.assertEqual(arbol.en_radio(-34.6, -58.4, 1000), [])
+
+    def test_cercanos_igual_a_fuerza_bruta(self):
+        for lat, lng in ((-34.6, -58.4), (-34.64, -58.44), (-34.7, -58.4)):
+            esperados = self.por_fuerza_bruta(lat, lng, 3000)[:5]
+            obtenidos = [(d, valor) for d, _, _, valor in self.arbol.cercanos(lat, lng, 3000, 5)]
+            self.assertEqual([valor for _, valor in obtenidos], [valor for _, valor in esperados])
+
+    def test_cercanos_k_mayor_que_el_arbol_y_k_cero(self):
+        arbol = KDTree(self.puntos[:3])
+        self.assertEqual(len(arbol.cercanos(-34.6, -58.4, 50000, 10)), 3)
+        self.assertEqual(arbol.cercanos(-34.6, -58.4, 50000, 0), [])
+
+    def test_en_radio_igual_a_fuerza_bruta(self):
+        esperados = self.por_fuerza_bruta(-34.61, -58.39, 1500)
+        obtenidos = [(d, valor) for d, _, _, valor in self.arbol.en_radio(-34.61, -58.39, 1500)]
+        self.assertEqual([valor for _, valor in obtenidos], [valor for _, valor in esperados])
+
+    def test_radio_incluye_el_borde(self):
+        lat, lng, valor = self.puntos[0]
+        distancia = haversine_m(-34.6, -58.4, lat, lng)
+        self.assertIn(valor, [v for _, _, _, v in self.arbol.en_radio(-34.6, -58.4, distancia)])
+        self.assertNotIn(valor, [v for _, _, _, v in self.arbol.en_radio(-34.6, -58.4, distancia - 0.01)])
+        # Un punto exactamente sobre la consulta está a 0 m
+        self.assertEqual(self.arbol.cercanos(lat, lng, 0, 1)[0][3], valor)
+
+
+class EtaTests(SimpleTestCase):
+    # Cuatro paradas; la tercera comparte posición con la segunda (distancia repetida)
+    # y la primera vuelve a aparecer al final (recorrido circular)
+    INDICE = {
+        'parada_ids': [1, 2, 3, 1],
+        'ordenes': [1, 2, 3, 4],
+        'distancias_m': [0.0, 1000.0, 1000.0, 3000.0],
+        'offsets_s': [0.0, 100.0, 160.0, 400.0],
+    }
+
+    def test_offset_interpola_entre_paradas(self):
+        self.assertEqual(offset_por_distancia(self.INDICE, 500.0), 50.0)
+        self.assertEqual(offset_por_distancia(self.INDICE, 2000.0), 280.0)
+
+    def test_offset_en_los_bordes(self):
+        self.assertEqual(offset_por_distancia(self.INDICE, -10.0), 0.0)
+        self.assertEqual(offset_por_distancia(self.INDICE, 0.0), 0.0)
+        self.assertEqual(offset_por_distancia(self.INDICE, 3000.0), 400.0)
+        self.assertEqual(offset_por_distancia(self.INDICE, 5000.0), 400.0)
+        # Justo en paradas con la misma distancia se toma la última de ellas
+        self.assertEqual(offset_por_distancia(self.INDICE, 1000.0), 160.0)
+
+    def test_etas_siguientes_excluye_la_parada_recien_pasada(self):
+        etas = etas_siguientes(self.INDICE, 100.0)
+        self.assertEqual([(eta['orden'], eta['eta_s']) for eta in etas], [(3, 60.0), (4, 300.0)])
+        self.assertEqual(etas_siguientes(self.INDICE, 400.0), [])
+
+    def test_eta_a_parada_visitada_dos_veces(self):
+        ruta = SimpleNamespace(indice_paradas=self.INDICE)
+        self.assertEqual(eta_a_parada(ruta, 1, 0.0), 400.0)
+        self.assertEqual(eta_a_parada(ruta, 1, 50.0), 350.0)
+        self.assertEqual(eta_a_parada(ruta, 2, 50.0), 50.0)
+        self.assertIsNone(eta_a_parada(ruta, 2, 100.0))
+        self.assertIsNone(eta_a_parada(ruta, 99, 0.0))
+
+
+class MapMatchingTests(SimpleTestCase):
+    # Dos tramos en L: hacia el este y después hacia el norte
+    GEOMETRIA = [(-34.600, -58.400), (-34.600, -58.390), (-34.590, -58.390)]
+
+    def setUp(self):
+        self.indice = IndiceSegmentos(self.GEOMETRIA)
+
+    def test_punto_sobre_el_vertice_entre_segmentos(self):
+        esquina = self.indice.distancias[1]
+        for segmento_previo, distancia_previa in ((0, 0.0), (1, esquina)):
+            segmento, distancia, desvio = self.indice.matchear(self.GEOMETRIA[1], segmento_previo, distancia_previa)
+            self.assertIn(segmento, (0, 1))
+            self.assertAlmostEqual(distancia, esquina, places=3)
+            self.assertAlmostEqual(desvio, 0.0, places=3)
+
+    def test_despues_del_vertice_sigue_por_el_segmento_siguiente(self):
+        segmento, distancia, _ = self.indice.matchear(self.GEOMETRIA[1])
+        segmento, siguiente, desvio = self.indice.matchear((-34.595, -58.390), segmento, distancia)
+        self.assertEqual(segmento, 1)
+        self.assertGreater(siguiente, distancia)
+        self.assertAlmostEqual(desvio, 0.0, places=3)
+
+    def test_extremos_de_la_ruta(self):
+        self.assertEqual(self.indice.matchear(self.GEOMETRIA[0])[:2], (0, 0.0))
+        segmento, distancia, _ = self.indice.matchear(self.GEOMETRIA[-1])
+        self.assertEqual(segmento, 1)
+        self.assertAlmostEqual(distancia, self.indice.distancias[-1], places=3)
+
+    def test_no_retrocede_por_ruido(self):
+        segmento, distancia, _ = self.indice.matchear((-34.595, -58.390))
+        # Un punto anterior (ruido del GPS) no resta distancia recorrida
+        _, despues, _ = self.indice.matchear((-34.600, -58.395), segmento, distancia)
+        self.assertEqual(despues, distancia)
+
+
+@override_settings(**AJUSTES_PRUEBAS)
+@mock.patch('busturistico.services_mapmatching.programar_trazado')
+class RegistrarLoteTests(TestCase):
+    def setUp(self):
+        recorrido = crear_recorrido([crear_parada('A', -34.60, -58.40), crear_parada('B', -34.62, -58.40)])
+        self.viaje = crear_viaje(recorrido, fecha_hora_inicio_real=timezone.now())
+        self.epoch_ms = int(timezone.now().timestamp() * 1000)
+
+    def posicion(self, secuencia, lat=-34.61):
+        return [secuencia, self.epoch_ms + secuencia * 1000, lat, -58.40]
+
+    def test_secuencias_repetidas_dentro_del_lote(self, programar_trazado):
+        lote = [self.posicion(1), self.posicion(1, lat=-34.615), self.posicion(2)]
+        resultado = registrar_lote(self.viaje, 'tel-1', lote)
+        self.assertEqual(resultado, {'guardadas': 2, 'repetidas': 0, 'rechazadas': 0})
+        self.assertEqual(UbicacionColectivo.objects.filter(viaje=self.viaje, secuencia=1).count(), 1)
+        # Sin ruta guardada no se traza en el request: se encola
+        programar_trazado.assert_called_with([self.viaje.recorrido_id])
+
+    def test_reenviar_el_lote_no_duplica(self, programar_trazado):
+        lote = [self.posicion(1), self.posicion(2), ['x', 0, 0, 0]]
+        self.assertEqual(registrar_lote(self.viaje, 'tel-1', lote), {'guardadas': 2, 'repetidas': 0, 'rechazadas': 1})
+        lote.append(self.posicion(3))
+        self.assertEqual(registrar_lote(self.viaje, 'tel-1', lote), {'guardadas': 1, 'repetidas': 2, 'rechazadas': 1})
+        self.assertEqual(UbicacionColectivo.objects.filter(viaje=self.viaje).count(), 3)
+
+    def test_la_secuencia_es_por_viaje_y_dispositivo(self, programar_trazado):
+        registrar_lote(self.viaje, 'tel-1', [self.posicion(1)])
+        self.assertEqual(registrar_lote(self.viaje, 'tel-2', [self.posicion(1)])['guardadas'], 1)
+        otro = crear_viaje(self.viaje.recorrido, hora=time(11, 0), fecha_hora_inicio_real=timezone.now())
+        self.assertEqual(registrar_lote(otro, 'tel-1', [self.posicion(1)])['guardadas'], 1)
+
+
+@override_settings(**AJUSTES_PRUEBAS)
+class ImportarChoferesTests(TestCase):
+    ENCABEZADO = 'Nombre;Apellido;Legajo;DNI;Teléfono;Fecha_Ingreso;Activo\n'
+
+    def filas(self, *lineas):
+        contenido = (self.ENCABEZADO + ''.join(linea + '\n' for linea in lineas)).encode()
+        return leer_filas(io.BytesIO(contenido), 'choferes.csv')
+
+    def test_legajo_repetido_en_el_archivo(self):
+        resultado = importar_choferes(self.filas(
+            'Ana;Paz;L10;30000001;111;2024-01-02;si',
+            'Luis;Sosa;L11;30000002;222;02/01/2024;',
+            'Eva;Rey;L10;30000003;333;2024-01-02;si',
+            'Juan;Gil;L12;30000004;444;2024-01-02;no',
+        ))
+        self.assertEqual(resultado.creados, ['L10', 'L11', 'L12'])
+        self.assertEqual(len(resultado.errores), 1)
+        fila, mensaje = resultado.errores[0]
+        self.assertEqual(fila, 4)
+        self.assertIn('(fila 2)', mensaje)
+        self.assertEqual(Chofer.objects.get(legajo_chofer='L10').nombre_chofer, 'Ana')
+        # Solo los activos reciben usuario, con el DNI como contraseña inicial
+        self.assertTrue(Chofer.objects.get(legajo_chofer='L10').user.check_password('30000001'))
+        self.assertIsNone(Chofer.objects.get(legajo_chofer='L12').user)
+
+    def test_choque_con_la_base_reintenta_fila_por_fila(self):
+        def hashear_mientras_otro_importa(textos, procesos=None):
+            # Otra importación guarda el mismo legajo después del control de unicidad
+            Chofer.objects.create(
+                nombre_chofer='Otro', apellido_chofer='Chofer', legajo_chofer='L21', dni_chofer=1,
+                telefono='1', fecha_ingreso=FECHA, activo=False,
+            )
+            return [make_password(texto) for texto in textos]
+
+        with mock.patch('busturistico.services_choferes.hashear_contrasenas', hashear_mientras_otro_importa):
+            resultado = importar_choferes(self.filas(
+                'Ana;Paz;L20;30000001;111;2024-01-02;si',
+                'Luis;Sosa;L21;30000002;222;2024-01-02;si',
+                'Eva;Rey;L22;30000003;333;2024-01-02;si',
+            ))
+        self.assertEqual(resultado.creados, ['L20', 'L22'])
+        self.assertEqual([fila for fila, _ in resultado.errores], [3])
+        self.assertIn('No se pudo guardar', resultado.errores[0][1])
+        # La fila que chocó no deja un usuario huérfano
+        self.assertFalse(User.objects.filter(username='chofer_L21').exists())
+        self.assertEqual(Chofer.objects.get(legajo_chofer='L21').nombre_chofer, 'Otro')
@@ -0,0 +1,16 @@
+from django.urls import path
+from . import views_api
+
+urlpatterns = [
+    path('v1/mapa/recorridos.geojson', views_api.RecorridosGeoJSONView.as_view(), name='api-recorridos-geojson'),
+    path('v1/mapa/viewport/', views_api.ViewportMapaView.as_view(), name='api-mapa-viewport'),
+    path('recorridos/<int:pk>/etas/', views_api.RecorridoEtasView.as_view(), name='api-recorrido-etas'),
+    path('recorridos/<int:pk>/viajes/', views_api.ViajesEnCursoView.as_view(), name='api-recorrido-viajes'),
+    path('recorridos/<int:pk>/buses/', views_api.PosicionesBusesView.as_view(), name='api-recorrido-buses'),
+    path('recorridos/<int:pk>/buses/stream/', views_api.PosicionesStreamView.as_view(), name='api-recorrido-buses-stream'),
+    path('paradas/cercanas/', views_api.ParadasCercanasView.as_view(), name='api-paradas-cercanas'),
+    path('paradas/<int:pk>/etas/', views_api.ParadaEtasView.as_view(), name='api-parada-etas'),
+    path('paradas/<int:pk>/salidas/', views_api.ParadaSalidasView.as_view(), name='api-parada-salidas'),
+    path('planificar/', views_api.PlanificarViajeView.as_view(), name='api-planificar'),
+    path('autocompletar/', views_api.AutocompletarView.as_view(), name='api-autocompletar'),
+]
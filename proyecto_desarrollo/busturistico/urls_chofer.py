@@ -1,9 +1,12 @@
 from django.urls import path
 from .views_chofer import (
     ChoferRecorridosView,
+    EstadoChoferView,
     IniciarRecorridoView,
     DetalleViajeView,
     FinalizarViajeView,
+    RegistrarUbicacionView,
+    RegistrarUbicacionesLoteView,
 )
 
 urlpatterns = [
@@ -19,6 +22,15 @@ urlpatterns = [
     # Ver detalle del viaje en curso
     path('viaje-en-curso/', DetalleViajeView.as_view(), name='viaje-en-curso'),
 
+    # Estado compacto del chofer para la app (polling con ETag)
+    path('api/estado/', EstadoChoferView.as_view(), name='chofer-estado'),
+
+    # Posición GPS del viaje en curso (enviada desde el dispositivo del chofer)
+    path('api/viajes/<int:pk>/ubicacion/', RegistrarUbicacionView.as_view(), name='registrar-ubicacion'),
+
+    # Posiciones encoladas en el dispositivo y subidas en lote (idempotente por secuencia)
+    path('api/viajes/<int:pk>/ubicaciones/', RegistrarUbicacionesLoteView.as_view(), name='registrar-ubicaciones-lote'),
+
     # Finalizar el viaje en curso
     path('finalizar-viaje/', FinalizarViajeView.as_view(), name='finalizar-viaje'),
 ]
@@ -1,7 +1,7 @@
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
 from django.db import transaction
-from django.db.models import Count, OuterRef, Subquery
+from django.db.models import Count, F, OuterRef, Subquery
 from django.shortcuts import redirect, get_object_or_404
 from django.urls import reverse_lazy
 from django.http import HttpResponseNotAllowed
@@ -11,7 +11,7 @@ from django.db import transaction
 from .forms import ParadaForm 
 from .models import Parada
 from django.views.generic import (
-    TemplateView, ListView, CreateView, UpdateView, DeleteView, DetailView
+    TemplateView, ListView, CreateView, UpdateView, DeleteView, DetailView, FormView
 ) 
 
 from .models import (
@@ -20,9 +20,10 @@ from .models import (
      Viaje, Consulta
 )
 from .forms import (
-    AtractivoForm, BusForm, ChoferForm, ParadaForm,
+    AtractivoForm, BusForm, ChoferForm, ImportarChoferesForm, ParadaForm,
     RecorridoForm, ViajeCreateForm
 )
+from .services_choferes import PROCESOS_WEB, importar_choferes, leer_filas
 
 from django.core.mail import send_mail
 from django.conf import settings
@@ -141,6 +142,22 @@ class CrearChoferView(SuperUserRequiredMixin, CreateView):
     template_name = 'admin/chofer_form.html'
     success_url = reverse_lazy('admin-choferes')
 
+class ImportarChoferesView(SuperUserRequiredMixin, FormView):
+    """Alta masiva de choferes desde CSV/XLSX; las filas con errores se listan y el resto se crea."""
+    form_class = ImportarChoferesForm
+    template_name = 'admin/chofer_importar.html'
+
+    def form_valid(self, form):
+        archivo = form.cleaned_data['archivo']
+        try:
+            resultado = importar_choferes(leer_filas(archivo.file, archivo.name), procesos=PROCESOS_WEB)
+        except ValueError as exc:
+            form.add_error('archivo', str(exc))
+            return self.form_invalid(form)
+        if resultado.creados:
+            messages.success(self.request, f"Se importaron {len(resultado.creados)} choferes.")
+        return self.render_to_response(self.get_context_data(form=form, resultado=resultado))
+
 class EditarChoferView(SuperUserRequiredMixin, UpdateView):
     model = Chofer
     form_class = ChoferForm
@@ -640,7 +657,9 @@ class AtractivoDetailView(SuperUserRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["parada_atractivos"] = ParadaAtractivo.objects.filter(atractivo=self.object).select_related("parada")
+        context["parada_atractivos"] = ParadaAtractivo.objects.filter(atractivo=self.object).select_related("parada").order_by(
+            F("distancia_m").asc(nulls_last=True), "parada__nombre_parada"
+        )
         return context
 
 class CrearAtractivoView(SuperUserRequiredMixin, CreateView):
@@ -0,0 +1,260 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views import View
+
+from .models import Parada, Recorrido
+from .services_autocompletar import SUGERENCIAS_MAXIMAS, SUGERENCIAS_POR_DEFECTO, sugerencias
+from .services_espacial import (
+    CERCANAS_MAXIMAS, CERCANAS_POR_DEFECTO, RADIO_CERCANAS_M, RADIO_MAXIMO_M, elementos_viewport, paradas_cercanas,
+)
+from .services_eta import etas_recorrido, llegadas_a_parada
+from .services_horarios import PASADAS_POR_PARADA, pasadas_por_parada
+from .services_planificador import planificar_viaje
+from .services_posiciones import (
+    TICK_SEGUNDOS, buses_en_rectangulo, evento_sse, posiciones_cacheadas, stream_posiciones, viajes_en_curso,
+)
+from .services_ruta import geojson_serializado
+
+# Tiempo que navegadores y proxies pueden reutilizar el GeoJSON sin revalidar
+GEOJSON_MAX_AGE = 300
+# Las ETA cambian segundo a segundo: solo se permite un cacheo corto
+ETA_MAX_AGE = 10
+# El tablero programado solo cambia cuando pasa un bus o se modifican los horarios
+TABLERO_MAX_AGE = 60
+# Las sugerencias solo cambian con el catálogo
+AUTOCOMPLETAR_MAX_AGE = 300
+# Las paradas cercanas a un punto solo cambian con el catálogo
+CERCANAS_MAX_AGE = 300
+# Paradas y atractivos del viewport solo cambian con el catálogo (los buses, a cada tick)
+VIEWPORT_MAX_AGE = 300
+CAPAS_VIEWPORT = ('paradas', 'atractivos', 'buses')
+ZOOM_MAXIMO = 20
+# El itinerario depende de la hora de la consulta
+PLANIFICAR_MAX_AGE = 30
+
+
+class RecorridosGeoJSONView(View):
+    """
+    GeoJSON de solo lectura con todos los recorridos, paradas y atractivos.
+    Responde 304 si el cliente ya tiene la versión actual (If-None-Match).
+    """
+
+    def get(self, request, *args, **kwargs):
+        cuerpo, etag = geojson_serializado()
+        response = HttpResponse(cuerpo, content_type='application/geo+json')
+        response['ETag'] = quote_etag(etag)
+        patch_cache_control(response, public=True, max_age=GEOJSON_MAX_AGE)
+        return get_conditional_response(request, etag=response['ETag'], response=response)
+
+
+class RecorridoEtasView(View):
+    """ETA de cada viaje en curso del recorrido a las paradas que le quedan."""
+
+    def get(self, request, pk, *args, **kwargs):
+        recorrido = get_object_or_404(Recorrido, pk=pk)
+        response = JsonResponse(etas_recorrido(recorrido))
+        patch_cache_control(response, public=True, max_age=ETA_MAX_AGE)
+        return response
+
+
+class ViajesEnCursoView(View):
+    """
+    Viajes en curso del recorrido y la animación programada con la que el mapa
+    los mueve hasta que llega su posición real. Lleva la hora del servidor para
+    corregir el reloj del navegador, así que no se cachea.
+    """
+
+    def get(self, request, pk, *args, **kwargs):
+        recorrido = get_object_or_404(Recorrido, pk=pk)
+        response = JsonResponse(viajes_en_curso(recorrido))
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+class ParadaEtasView(View):
+    """Próximas llegadas de buses en curso a una parada."""
+
+    def get(self, request, pk, *args, **kwargs):
+        parada = get_object_or_404(Parada, pk=pk)
+        response = JsonResponse({
+            'parada_id': parada.id,
+            'llegadas': llegadas_a_parada(parada),
+        })
+        patch_cache_control(response, public=True, max_age=ETA_MAX_AGE)
+        return response
+
+
+class ParadaSalidasView(View):
+    """Tablero de la parada: próximas pasadas programadas de hoy de todos sus recorridos."""
+
+    def get(self, request, pk, *args, **kwargs):
+        parada = get_object_or_404(Parada, pk=pk)
+        try:
+            limite = min(max(int(request.GET.get('limite', PASADAS_POR_PARADA)), 1), 50)
+        except ValueError:
+            limite = PASADAS_POR_PARADA
+        response = JsonResponse({
+            'parada_id': parada.id,
+            'pasadas': pasadas_por_parada(parada.id, limite),
+        })
+        patch_cache_control(response, public=True, max_age=TABLERO_MAX_AGE)
+        return response
+
+
+class PosicionesBusesView(View):
+    """
+    Posición, rumbo y próxima parada de cada viaje en curso del recorrido, para
+    clientes que hacen polling. Mientras el cálculo del tick siga en cache, un
+    If-None-Match / If-Modified-Since vigente se responde 304 sin tocar la base.
+    """
+
+    def get(self, request, pk, *args, **kwargs):
+        entrada = posiciones_cacheadas(pk)
+        if entrada is None:
+            raise Http404
+        etag = quote_etag(entrada['etag'])
+        last_modified = entrada['modificado'].timestamp()
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(entrada['cuerpo'], content_type='application/json')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public=True, max_age=TICK_SEGUNDOS)
+        return response
+
+
+class PosicionesStreamView(View):
+    """
+    Posiciones en vivo de los buses del recorrido como Server-Sent Events:
+    un evento 'snapshot' al conectarse y luego 'delta' con los buses que se movieron.
+    Requiere servir el proyecto por ASGI (config/asgi.py); bajo WSGI responde
+    un único snapshot y el navegador se reconecta solo, como un polling.
+    """
+
+    async def get(self, request, pk, *args, **kwargs):
+        if not await Recorrido.objects.filter(pk=pk).aexists():
+            raise Http404
+
+        if isinstance(request, ASGIRequest):
+            response = StreamingHttpResponse(stream_posiciones(pk), content_type='text/event-stream')
+            response['X-Accel-Buffering'] = 'no'
+        else:
+            entrada = await sync_to_async(posiciones_cacheadas, thread_sensitive=False)(pk)
+            # None si el recorrido se borró entre el chequeo y el cálculo: snapshot vacío
+            buses = list(entrada['posiciones'].values()) if entrada else []
+            response = HttpResponse(
+                evento_sse({'tipo': 'snapshot', 'buses': buses}),
+                content_type='text/event-stream',
+            )
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+class AutocompletarView(View):
+    """Sugerencias para la búsqueda mientras se escribe, servidas desde memoria."""
+
+    def get(self, request, *args, **kwargs):
+        texto = request.GET.get('q', '')
+        try:
+            k = min(max(int(request.GET.get('k', SUGERENCIAS_POR_DEFECTO)), 1), SUGERENCIAS_MAXIMAS)
+        except ValueError:
+            k = SUGERENCIAS_POR_DEFECTO
+        response = JsonResponse({'q': texto, 'sugerencias': sugerencias(texto, k)})
+        patch_cache_control(response, public=True, max_age=AUTOCOMPLETAR_MAX_AGE)
+        return response
+
+
+class ParametroInvalido(ValueError):
+    pass
+
+
+def parametro_float(request, nombre, minimo, maximo, por_defecto=None):
+    valor = request.GET.get(nombre)
+    if valor in (None, ''):
+        if por_defecto is None:
+            raise ParametroInvalido(f"Falta el parámetro {nombre}.")
+        return por_defecto
+    try:
+        numero = float(valor)
+    except ValueError:
+        raise ParametroInvalido(f"El parámetro {nombre} debe ser numérico.")
+    if not (minimo <= numero <= maximo):
+        raise ParametroInvalido(f"El parámetro {nombre} debe estar entre {minimo} y {maximo}.")
+    return numero
+
+
+class ParadasCercanasView(View):
+    """Las k paradas más cercanas a lat/lng dentro de `radio` metros, con su distancia."""
+
+    def get(self, request, *args, **kwargs):
+        try:
+            lat = parametro_float(request, 'lat', -90, 90)
+            lng = parametro_float(request, 'lng', -180, 180)
+            radio = parametro_float(request, 'radio', 1, RADIO_MAXIMO_M, RADIO_CERCANAS_M)
+            k = int(parametro_float(request, 'k', 1, CERCANAS_MAXIMAS, CERCANAS_POR_DEFECTO))
+        except ParametroInvalido as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+
+        response = JsonResponse({
+            'lat': lat,
+            'lng': lng,
+            'radio': radio,
+            'paradas': paradas_cercanas(lat, lng, radio, k),
+        })
+        patch_cache_control(response, public=True, max_age=CERCANAS_MAX_AGE)
+        return response
+
+
+class PlanificarViajeView(View):
+    """Itinerario de origen a destino (lat/lng) saliendo ahora, con caminatas, buses y trasbordos."""
+
+    def get(self, request, *args, **kwargs):
+        try:
+            origen = (parametro_float(request, 'origen_lat', -90, 90), parametro_float(request, 'origen_lng', -180, 180))
+            destino = (parametro_float(request, 'destino_lat', -90, 90), parametro_float(request, 'destino_lng', -180, 180))
+        except ParametroInvalido as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+
+        response = JsonResponse({'plan': planificar_viaje(origen, destino)})
+        patch_cache_control(response, public=True, max_age=PLANIFICAR_MAX_AGE)
+        return response
+
+
+def parametro_bbox(request):
+    """bbox=oeste,sur,este,norte, el formato de L.LatLngBounds.toBBoxString()."""
+    valor = request.GET.get('bbox')
+    if not valor:
+        raise ParametroInvalido("Falta el parámetro bbox.")
+    try:
+        oeste, sur, este, norte = (float(parte) for parte in valor.split(','))
+    except ValueError:
+        raise ParametroInvalido("El parámetro bbox debe ser oeste,sur,este,norte.")
+    if not (-90 <= sur <= norte <= 90 and -180 <= oeste <= este <= 180):
+        raise ParametroInvalido("El parámetro bbox no es un rectángulo válido.")
+    return sur, oeste, norte, este
+
+
+class ViewportMapaView(View):
+    """
+    Paradas, atractivos y buses en curso dentro del viewport del mapa. A zoom
+    bajo (o con demasiados puntos) paradas y atractivos llegan agrupados.
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            sur, oeste, norte, este = parametro_bbox(request)
+            zoom = int(parametro_float(request, 'zoom', 0, ZOOM_MAXIMO))
+        except ParametroInvalido as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+        capas = [capa for capa in request.GET.get('capas', ','.join(CAPAS_VIEWPORT)).split(',') if capa in CAPAS_VIEWPORT]
+
+        datos = {'zoom': zoom, **elementos_viewport(sur, oeste, norte, este, zoom, capas)}
+        if 'buses' in capas:
+            datos['buses'] = buses_en_rectangulo(sur, oeste, norte, este)
+        response = JsonResponse(datos)
+        patch_cache_control(response, public=True, max_age=TICK_SEGUNDOS if 'buses' in capas else VIEWPORT_MAX_AGE)
+        return response
@@ -2,9 +2,13 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout
 from django.utils.decorators import method_decorator
 from django.views.generic import ListView, View
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 # --- Imports de Modelo ---
 from .models import (
     Recorrido,
@@ -19,32 +23,53 @@ from .models import (
 from django.contrib import messages
 from django.core.exceptions import PermissionDenied
 import datetime
+import hashlib
+import json
 import logging
 import math
-import requests
+import zlib
 # --- Nuevos Imports para Asincronía y DB ---
 import threading
 from django.db import connection, transaction
 # --- Fin de Imports ---
 
+from .services_choferes import chofer_activo, estado_chofer, viajes_pendientes
 from .services_viaje import finalizar_viaje
+from .services_ruta import obtener_ruta, paradas_ordenadas
+from .services_mapmatching import (
+    LOTE_MAXIMO, fuera_de_ruta, matchear_secuencia, registrar_lote, registrar_ubicacion,
+)
 
 logger = logging.getLogger(__name__)
 
+# Tope del cuerpo ya descomprimido de un lote de posiciones
+CUERPO_LOTE_MAXIMO = 1024 * 1024
+
+
+def cuerpo_json(request):
+    """JSON del cuerpo, descomprimiéndolo si vino con Content-Encoding: gzip."""
+    cuerpo = request.body
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        descompresor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        cuerpo = descompresor.decompress(cuerpo, CUERPO_LOTE_MAXIMO + 1)
+        if len(cuerpo) > CUERPO_LOTE_MAXIMO:
+            raise ValueError('Cuerpo demasiado grande.')
+    return json.loads(cuerpo)
+
 class ChoferRequiredMixin:
     """Mixin que requiere que el usuario sea un chofer activo"""
     
     @method_decorator(login_required(login_url='chofer-login'))
     def dispatch(self, request, *args, **kwargs):
-        try:
-            chofer = Chofer.objects.get(user=request.user, activo=True)
-            request.chofer = chofer
-        except Chofer.DoesNotExist:
+        # Identidad cacheada por usuario: se invalida cuando cambia el Chofer o se desactiva el User
+        chofer = chofer_activo(request.user)
+        if chofer is None:
             # Si el usuario no es un chofer activo, cerramos sesión y redirigimos a login
             logout(request)
             request.session['chofer_login_prompt'] = True
             return redirect('chofer-login')
-        
+        request.chofer = chofer
+
         return super().dispatch(request, *args, **kwargs)
 
 class ChoferRecorridosView(ChoferRequiredMixin, ListView):
@@ -70,32 +95,11 @@ class ChoferRecorridosView(ChoferRequiredMixin, ListView):
         chofer = self.request.chofer
         context['chofer'] = chofer
 
-        # 1) Viaje en curso
-        viaje_en_curso = (
-            Viaje.objects.filter(
-                chofer=chofer,
-                fecha_hora_inicio_real__isnull=False,
-                fecha_hora_fin_real__isnull=True
-            )
-            .select_related('patente_bus', 'recorrido')
-            .first()
-        )
+        # Viaje en curso y asignados en una sola consulta
+        viaje_en_curso, sin_iniciar = viajes_pendientes(chofer)
         context['viaje_en_curso'] = viaje_en_curso
-
-        if not viaje_en_curso:
-            # 2) Viaje asignado aún no iniciado (tomamos el más próximo por fecha_programada)
-            viaje_asignado = (
-                Viaje.objects.filter(
-                    chofer=chofer,
-                    fecha_hora_inicio_real__isnull=True
-                )
-                .select_related('patente_bus', 'recorrido')
-                .order_by('fecha_programada', 'id')
-                .first()
-            )
-            context['viaje_asignado'] = viaje_asignado
-        else:
-            context['viaje_asignado'] = None
+        # Si no hay viaje en curso, el asignado más próximo aún no iniciado
+        context['viaje_asignado'] = sin_iniciar[0] if not viaje_en_curso and sin_iniciar else None
 
         return context
 
@@ -203,12 +207,8 @@ class IniciarRecorridoView(ChoferRequiredMixin, View):
         now = timezone.now()
 
         # 1) Ruta basada en las paradas cargadas
-        rps = list(
-            RecorridoParada.objects
-            .filter(recorrido=recorrido)
-            .select_related('parada')
-            .order_by('orden')
-        )
+        rps = paradas_ordenadas(recorrido)
+        ruta = obtener_ruta(recorrido, rps)
         raw_points = [
             (rp.parada.latitud_parada, rp.parada.longitud_parada)
             for rp in rps
@@ -228,8 +228,8 @@ class IniciarRecorridoView(ChoferRequiredMixin, View):
         def interp(a, b, t):
             return a + (b - a) * t
 
-        # Lógica de ruteo OSRM y Fallback
-        coords = self._route_with_osrm(raw_points)
+        # Geometría guardada (trazada con OSRM) y Fallback
+        coords = [tuple(punto) for punto in ruta.geometria] if ruta else None
         if not coords:
             coords = raw_points
         
@@ -289,6 +289,10 @@ class IniciarRecorridoView(ChoferRequiredMixin, View):
                     )
                 )
 
+        # Proyectar cada punto sobre la ruta (distancia recorrida y desvío)
+        if ruta:
+            matchear_secuencia(ruta, ubicaciones_a_crear)
+
         # 2) ¡Optimización clave: Insertar todo en una sola consulta!
         # Esto reduce cientos o miles de consultas a UNA.
         UbicacionColectivo.objects.bulk_create(ubicaciones_a_crear)
@@ -314,34 +318,6 @@ class IniciarRecorridoView(ChoferRequiredMixin, View):
         finally:
             connection.close()
 
-    def _route_with_osrm(self, points):
-        if len(points) < 2:
-            return None
-
-        base_url = getattr(settings, 'OSRM_BASE_URL', 'https://bonnie-stoney-boorishly.ngrok-free.dev').strip() or 'https://router.project-osrm.org'
-        base_url = base_url.rstrip('/')
-        coordinates = ';'.join(f"{lng},{lat}" for lat, lng in points)
-        params = {'overview': 'full', 'geometries': 'geojson'}
-        url = f"{base_url}/route/v1/driving/{coordinates}"
-        try:
-            response = requests.get(url, params=params, timeout=5)
-            response.raise_for_status()
-            data = response.json()
-        except requests.RequestException as exc:
-            logger.warning("OSRM routing failed: %s", exc)
-            return None
-
-        routes = data.get('routes')
-        if not routes:
-            return None
-
-        geometry = routes[0].get('geometry', {}).get('coordinates')
-        if not geometry:
-            return None
-
-        return [(lat, lng) for lng, lat in geometry]
-
-
 # --------------------------------------------------------------------------------------
 # El resto de tus vistas (sin cambios)
 # --------------------------------------------------------------------------------------
@@ -367,6 +343,87 @@ class DetalleViajeView(ChoferRequiredMixin, View):
         }
         return render(request, self.template_name, context)
 
+class RegistrarUbicacionView(ChoferRequiredMixin, View):
+    """
+    Recibe la posición GPS del dispositivo del chofer para su viaje en curso.
+    Cada posición se proyecta sobre la ruta del recorrido (map-matching).
+    """
+
+    def post(self, request, pk, *args, **kwargs):
+        viaje = Viaje.objects.filter(
+            pk=pk,
+            chofer=request.chofer,
+            fecha_hora_inicio_real__isnull=False,
+            fecha_hora_fin_real__isnull=True
+        ).select_related('recorrido').first()
+        if not viaje:
+            return JsonResponse({'error': 'No tienes este viaje en curso.'}, status=404)
+
+        try:
+            data = json.loads(request.body)
+            lat = float(data['lat'])
+            lng = float(data['lng'])
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'error': 'Se esperan los campos numéricos lat y lng.'}, status=400)
+
+        ubicacion = registrar_ubicacion(viaje, lat, lng)
+        return JsonResponse({
+            'id': ubicacion.id,
+            'distancia_recorrida_m': ubicacion.distancia_recorrida_m,
+            'desvio_m': ubicacion.desvio_m,
+            'fuera_de_ruta': fuera_de_ruta(ubicacion),
+        }, status=201)
+
+class RegistrarUbicacionesLoteView(ChoferRequiredMixin, View):
+    """
+    Recibe las posiciones que el dispositivo del chofer fue encolando (sin
+    señal, en túneles) y sube juntas, opcionalmente con gzip:
+    {"dispositivo": "...", "posiciones": [[secuencia, epoch_ms, lat, lng], ...]}.
+    Se aceptan también para un viaje recién finalizado, hasta su hora de fin.
+    """
+
+    def post(self, request, pk, *args, **kwargs):
+        viaje = Viaje.objects.filter(
+            pk=pk,
+            chofer=request.chofer,
+            fecha_hora_inicio_real__isnull=False,
+        ).select_related('recorrido').first()
+        if not viaje:
+            return JsonResponse({'error': 'No tienes este viaje.'}, status=404)
+
+        try:
+            data = cuerpo_json(request)
+            dispositivo = str(data['dispositivo'])
+            posiciones = data['posiciones']
+        except (ValueError, KeyError, TypeError, zlib.error):
+            return JsonResponse({'error': 'Se esperan los campos dispositivo y posiciones.'}, status=400)
+        if not 0 < len(dispositivo) <= 64 or not isinstance(posiciones, list):
+            return JsonResponse({'error': 'Se esperan los campos dispositivo y posiciones.'}, status=400)
+        if len(posiciones) > LOTE_MAXIMO:
+            return JsonResponse({'error': f'Como máximo {LOTE_MAXIMO} posiciones por lote.'}, status=413)
+
+        return JsonResponse(registrar_lote(viaje, dispositivo, posiciones))
+
+class EstadoChoferView(ChoferRequiredMixin, View):
+    """
+    Estado compacto para la app del chofer: viaje en curso (tiempo transcurrido
+    y próxima parada) y asignados de hoy. Pensado para polling: con
+    If-None-Match vigente responde 304 sin cuerpo.
+    """
+
+    def get(self, request, *args, **kwargs):
+        cuerpo = json.dumps(
+            estado_chofer(request.chofer), cls=DjangoJSONEncoder, separators=(',', ':'),
+        ).encode()
+        etag = quote_etag(hashlib.sha256(cuerpo).hexdigest()[:32])
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(cuerpo, content_type='application/json')
+        response['ETag'] = etag
+        # Es del chofer logueado: nada de caches compartidos, y siempre se revalida
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
 class FinalizarViajeView(ChoferRequiredMixin, View):
     def post(self, request, *args, **kwargs):
         chofer = request.chofer
@@ -1,44 +1,82 @@
 from django.views.generic import TemplateView, ListView, CreateView, DetailView, View
-from django.db.models import Count, Q
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.http import HttpResponse
+from django.db.models import Count, F, Q
 from django.utils import timezone
 from .models import Consulta, Bus, Chofer, Viaje, EstadoBusHistorial, EstadoBus, EstadoViaje, Parada, Recorrido, ParadaAtractivo, RecorridoParada, Precio
 from django.views import View
 from django.shortcuts import render, redirect,  get_object_or_404
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib import messages
-from django.conf import settings
-from datetime import timedelta
-import requests
 import json
-from .services_viaje import finalizar_viaje
-
+from .services_ruta import duracion_segundos, obtener_ruta, paradas_ordenadas, resolver_color
+from .services_eta import etas_recorrido, llegadas_a_parada
+from .services_horarios import horarios_recorrido, pasadas_por_parada, proximas_salidas
+from .services_busqueda import RESULTADOS_POR_PAGINA, buscar
+from .services_catalogo import catalogo
+from .services_estadisticas import estadisticas_inicio
+from .services_cache import (
+    CACHE_PAGINAS_TIMEOUT, MODELOS_CATALOGO, MODELOS_CON_TIEMPOS,
+    cacheado_por_generacion, clave_pagina, clave_por_generacion,
+)
+
+
+class PaginaCacheadaMixin:
+    """
+    Cachea la página completa (no depende del usuario) con una clave por URL
+    versionada con la generación de cache_modelos: se sirve desde el cache
+    hasta que alguno de esos modelos se modifica.
+    """
+    cache_modelos = MODELOS_CATALOGO
+
+    def cache_clave_extra(self):
+        """Datos que no son del catálogo pero cambian el HTML (ej. horarios)."""
+        return ''
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+
+        nombre = clave_pagina(type(self).__name__, request.get_full_path(), self.cache_clave_extra())
+        clave = clave_por_generacion(nombre, self.cache_modelos)
+        cacheada = cache.get(clave)
+        if cacheada is not None:
+            contenido, content_type = cacheada
+            return HttpResponse(contenido, content_type=content_type)
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            if hasattr(response, 'render'):
+                response.render()
+            cache.set(clave, (response.content, response['Content-Type']), CACHE_PAGINAS_TIMEOUT)
+        return response
+
+
+class UsuarioInicioView(PaginaCacheadaMixin, TemplateView):
+    template_name = 'usuario/inicio.html'
 
+    def cache_clave_extra(self):
+        # Los buses operativos no son parte del catálogo
+        return str(estadisticas_inicio()['buses_operativos'])
 
-class UsuarioInicioView(TemplateView):
-    template_name = 'usuario/inicio.html'
-    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        
-        # Estadísticas para mostrar en la página
-        context.update({
-            'total_recorridos': Recorrido.objects.count(),
-            'total_paradas': Parada.objects.count(),
-            'buses_operativos': Bus.objects.filter(
-                estadobushistorial__estado_bus__nombre_estado='Operativo'
-            ).distinct().count(),
-            'recorridos_populares': Recorrido.objects.annotate(
-                total_paradas=Count('recorridoparadas')  # usando recorridoparadas
-            ).order_by('-total_paradas')[:3],
-        })
-        
+
+        # Estadísticas para mostrar en la página (precalculadas, ver services_estadisticas)
+        context.update(estadisticas_inicio())
+
         return context
 
-class UsuarioRecorridosView(ListView):
+class UsuarioRecorridosView(PaginaCacheadaMixin, ListView):
     model = Recorrido
     template_name = 'usuario/recorridos.html'
     context_object_name = 'recorridos'
     paginate_by = 6  # Paginación para mejor UX
+
+    def cache_clave_extra(self):
+        # Los próximos horarios ya están cacheados hasta la próxima salida
+        return repr(sorted(proximas_salidas().items()))
     
     def get_queryset(self):
         # CORREGIDO: Usar related_name correcto
@@ -60,27 +98,12 @@ class UsuarioRecorridosView(ListView):
         context = super().get_context_data(**kwargs)
         context['search_query'] = self.request.GET.get('search', '')
 
-        # Adjuntar próximos horarios de viajes programados a cada recorrido de la página actual
-        now = timezone.localtime()
-        today = now.date()
+        # Próximos horarios de cada recorrido de la página (una consulta para todos, cacheada)
         page_obj = context.get('page_obj')
         if page_obj:
+            salidas = proximas_salidas()
             for recorrido in page_obj.object_list:
-                viajes_qs = (
-                    Viaje.objects
-                    .filter(
-                        recorrido=recorrido,
-                        fecha_hora_inicio_real__isnull=True,
-                        fecha_programada=today,
-                        hora_inicio_programada__gte=now.time(),
-                    )
-                    .order_by('hora_inicio_programada')
-                )
-
-                # Guardar una lista de strings HH:MM (máximo 3) para usar en la plantilla
-                recorrido.proximos_horarios = [
-                    v.hora_inicio_programada.strftime('%H:%M') for v in viajes_qs[:3]
-                ]
+                recorrido.proximos_horarios = horarios_recorrido(recorrido.id, 3, salidas)
         return context
 
 class UsuarioDetalleRecorridoView(DetailView):
@@ -90,36 +113,58 @@ class UsuarioDetalleRecorridoView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # CORREGIDO: Usar RecorridoParada correctamente
-        paradas_recorrido = RecorridoParada.objects.filter(
-            recorrido=self.object
-        ).select_related('parada').order_by('orden')
-        
+        # Paradas y tiempos desde la salida: solo cambian con el catálogo o la ruta
+        catalogo = cacheado_por_generacion(
+            f"fragmento:detalle-recorrido:{self.object.id}", MODELOS_CON_TIEMPOS, self.get_paradas_con_tiempos
+        )
+        paradas_recorrido = catalogo['paradas']
+
+        # Próximo bus en curso por parada (la menor ETA entre los viajes activos)
+        proximo_bus = {}
+        for viaje in etas_recorrido(self.object, ruta=catalogo['ruta'])['viajes']:
+            for parada in viaje['paradas']:
+                eta_min = max(round(parada['eta_s'] / 60), 0)
+                proximo_bus[parada['orden']] = min(eta_min, proximo_bus.get(parada['orden'], eta_min))
+
+        for parada_recorrido in paradas_recorrido:
+            parada_recorrido.proximo_bus_min = proximo_bus.get(parada_recorrido.orden)
+
         context.update({
             'paradas': paradas_recorrido,
-            'total_paradas': paradas_recorrido.count(),
-            'duracion_estimada': paradas_recorrido.count() * 30,  # 30 min por parada aprox
+            'total_paradas': len(paradas_recorrido),
+            'duracion_estimada': catalogo['duracion_estimada'],
             'proximos_horarios': self.get_proximos_horarios(),
         })
         return context
-    
+
+    def get_paradas_con_tiempos(self):
+        # CORREGIDO: Usar RecorridoParada correctamente
+        paradas_recorrido = paradas_ordenadas(self.object)
+
+        # Tiempos desde la salida según el índice de paradas de la ruta
+        ruta = obtener_ruta(self.object, paradas_recorrido, trazar=False)
+        indice = ruta.indice_paradas if ruta else {}
+        offsets = dict(zip(indice.get('ordenes', []), indice.get('offsets_s', [])))
+
+        for parada_recorrido in paradas_recorrido:
+            offset_s = offsets.get(parada_recorrido.orden)
+            parada_recorrido.minutos_desde_salida = round(offset_s / 60) if offset_s is not None else None
+
+        if indice.get('offsets_s'):
+            duracion_estimada = round(indice['offsets_s'][-1] / 60)
+        else:
+            duracion_estimada = round(duracion_segundos(self.object, 0) / 60)
+
+        return {
+            'paradas': list(paradas_recorrido),
+            'ruta': ruta,
+            'duracion_estimada': duracion_estimada,
+        }
+
     def get_proximos_horarios(self):
         """Obtener próximos horarios de viajes programados (no iniciados) para el recorrido."""
-        now = timezone.localtime()
-        today = now.date()
-        viajes_qs = (
-            Viaje.objects
-            .filter(
-                recorrido=self.object,
-                fecha_hora_inicio_real__isnull=True,
-                fecha_programada=today,
-                hora_inicio_programada__gte=now.time(),
-            )
-            .order_by('hora_inicio_programada')
-        )
-
         # Devolver hasta 6 próximos horarios como strings HH:MM
-        return [v.hora_inicio_programada.strftime('%H:%M') for v in viajes_qs[:6]]
+        return horarios_recorrido(self.object.id, 6)
 
 class UsuarioDetalleParadaView(DetailView):
     model = Parada
@@ -128,20 +173,34 @@ class UsuarioDetalleParadaView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        atractivos = ParadaAtractivo.objects.filter(parada=self.object)
-        
+        catalogo = cacheado_por_generacion(
+            f"fragmento:detalle-parada:{self.object.id}", MODELOS_CATALOGO, self.get_catalogo_parada
+        )
+
+        context.update({
+            'atractivos': catalogo['atractivos'],
+            'total_atractivos': len(catalogo['atractivos']),
+            'recorridos_relacionados': catalogo['recorridos_relacionados'],
+            'proximas_llegadas': llegadas_a_parada(self.object),
+            'proximas_pasadas': pasadas_por_parada(self.object.id),
+        })
+        return context
+
+    def get_catalogo_parada(self):
+        atractivos = ParadaAtractivo.objects.filter(parada=self.object).select_related('atractivo').order_by(
+            F('distancia_m').asc(nulls_last=True), 'atractivo__nombre_atractivo'
+        )
+
         # Recorridos que incluyen esta parada
         # CORREGIDO: Usar recorridoparadas en lugar de recorridoparada
         recorridos_relacionados = Recorrido.objects.filter(
             recorridoparadas__parada=self.object
         ).distinct()
-        
-        context.update({
-            'atractivos': atractivos,
-            'total_atractivos': atractivos.count(),
-            'recorridos_relacionados': recorridos_relacionados,
-        })
-        return context
+
+        return {
+            'atractivos': list(atractivos),
+            'recorridos_relacionados': list(recorridos_relacionados),
+        }
 class UsuarioContactoView(View):
     template_name = "usuario/contacto.html"
 
@@ -182,32 +241,28 @@ class UsuarioContactoView(View):
 # Vista adicional para búsqueda AJAX (opcional)
 class UsuarioBusquedaView(TemplateView):
     template_name = 'usuario/busqueda.html'
-    
+    paginate_by = RESULTADOS_POR_PAGINA
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        query = self.request.GET.get('q', '')
-        
+        query = self.request.GET.get('q', '').strip()
+        context['query'] = query
+
         if query:
-            recorridos = Recorrido.objects.filter(
-                Q(color_recorrido__icontains=query) |
-                Q(descripcion_recorrido__icontains=query)
-            )[:5]
-            
-            paradas = Parada.objects.filter(
-                Q(nombre_parada__icontains=query) |
-                Q(direccion_parada__icontains=query)
-            )[:5]
-            
+            paginator = Paginator(buscar(query), self.paginate_by)
+            page_obj = paginator.get_page(self.request.GET.get('page'))
             context.update({
-                'query': query,
-                'recorridos': recorridos,
-                'paradas': paradas,
+                'paginator': paginator,
+                'page_obj': page_obj,
+                'resultados': page_obj.object_list,
+                'is_paginated': page_obj.has_other_pages(),
             })
-            
+
         return context
 
-class UsuarioPreciosView(TemplateView):
+class UsuarioPreciosView(PaginaCacheadaMixin, TemplateView):
     template_name = 'usuario/precios.html'
+    cache_modelos = (Precio,)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -216,305 +271,63 @@ class UsuarioPreciosView(TemplateView):
         context['precios'] = Precio.objects.all()
         return context
 
-class UsuarioMapaFoliumView(TemplateView):
+class UsuarioMapaFoliumView(PaginaCacheadaMixin, TemplateView):
+    """
+    Página del mapa. La geometría de los recorridos, paradas y atractivos no se
+    arma acá: el navegador la descarga (y cachea) desde el endpoint GeoJSON, y
+    los viajes en curso los pide aparte, así la página queda cacheada hasta que
+    cambie el catálogo o la duración de un recorrido.
+    """
     template_name = 'usuario/mapa_folium.html'
+    cache_modelos = MODELOS_CON_TIEMPOS
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        recorridos_disponibles = (
-            Recorrido.objects
-            .filter(recorridoparadas__isnull=False)
-            .distinct()
-        )
+        # El selector sale del catálogo en memoria; solo se carga el recorrido elegido
+        recorridos_disponibles = catalogo().recorridos_con_paradas()
 
         recorrido = None
+        seleccionado = None
         recorrido_id = self.request.GET.get('recorrido')
         if recorrido_id:
-            recorrido = recorridos_disponibles.filter(pk=recorrido_id).first()
-        if not recorrido:
-            recorrido = recorridos_disponibles.first()
+            seleccionado = next((r for r in recorridos_disponibles if str(r.id) == recorrido_id), None)
+        if not seleccionado and recorridos_disponibles:
+            seleccionado = recorridos_disponibles[0]
+        if seleccionado:
+            recorrido = Recorrido.objects.filter(pk=seleccionado.id).first()
 
         if not recorrido:
             context['error'] = 'No hay recorridos con paradas cargadas para mostrar.'
             return context
 
-        paradas_qs = list(
-            RecorridoParada.objects
-            .filter(recorrido=recorrido)
-            .select_related('parada')
-            .order_by('orden')
-        )
+        paradas_qs = paradas_ordenadas(recorrido)
 
         if len(paradas_qs) < 2:
             context['error'] = 'Se necesitan al menos dos paradas con coordenadas para trazar la ruta.'
             context['recorrido'] = recorrido
             return context
 
-        warnings_list = []
-
-        color_palette = {
-            'rojo': '#dc3545',
-            'verde': '#198754',
-            'azul': '#0d6efd',
-            'amarillo': '#ffc107',
-            'naranja': '#fd7e14',
-            'violeta': '#6f42c1',
-            'purpura': '#6f42c1',
-            'morado': '#6f42c1',
-            'rosa': '#e83e8c',
-            'celeste': '#0dcaf0',
-            'cian': '#0dcaf0',
-            'gris': '#6c757d',
-        }
-
-        def resolve_color(nombre: str) -> str:
-            if not nombre:
-                return '#0d6efd'
-            key = nombre.strip().lower()
-            return color_palette.get(key, '#0d6efd')
-
-        def build_route_data(recorrido_obj, paradas_list):
-            waypoints = [
-                [p.parada.longitud_parada, p.parada.latitud_parada]
-                for p in paradas_list
-            ]
-            osrm_route = None
-            osrm_ok = False
-            base_url = getattr(settings, 'OSRM_BASE_URL', '').strip() or 'https://router.project-osrm.org'
-            base_url = base_url.rstrip('/')
-            coordinates = ';'.join(f"{lon},{lat}" for lon, lat in waypoints)
-            params = {'overview': 'full', 'geometries': 'geojson'}
-            try:
-                response = requests.get(f"{base_url}/route/v1/driving/{coordinates}", params=params, timeout=5)
-                response.raise_for_status()
-                data = response.json()
-                if data.get('code') == 'Ok' and data.get('routes'):
-                    osrm_route = data['routes'][0]['geometry']['coordinates']
-                    osrm_ok = True
-                else:
-                    warnings_list.append(
-                        f"OSRM no devolvió una ruta óptima para el recorrido {recorrido_obj.color_recorrido}."
-                    )
-            except requests.exceptions.HTTPError:
-                warnings_list.append(
-                    f"OSRM devolvió un estado inesperado para el recorrido {recorrido_obj.color_recorrido}."
-                )
-            except requests.RequestException:
-                warnings_list.append(
-                    f"No se pudo contactar a OSRM para el recorrido {recorrido_obj.color_recorrido}."
-                )
-
-            if osrm_ok and osrm_route:
-                route_coords = [[coord[1], coord[0]] for coord in osrm_route]
-                line_dash = None
-            else:
-                route_coords = [[wp[1], wp[0]] for wp in waypoints]
-                line_dash = '6,6'
-
-            coords_for_bounds = route_coords or [[wp[1], wp[0]] for wp in waypoints]
-            if not coords_for_bounds:
-                return None
-
-            latitudes = [coord[0] for coord in coords_for_bounds]
-            longitudes = [coord[1] for coord in coords_for_bounds]
-            bounds = [
-                [min(latitudes), min(longitudes)],
-                [max(latitudes), max(longitudes)]
-            ]
-            center = [
-                sum(latitudes) / len(latitudes),
-                sum(longitudes) / len(longitudes)
-            ]
-
-            paradas_geo = [
-                {
-                    'lat': parada.parada.latitud_parada,
-                    'lng': parada.parada.longitud_parada,
-                    'nombre': parada.parada.nombre_parada,
-                    'orden': parada.orden,
-                }
-                for parada in paradas_list
-            ]
-
-            return {
-                'route_coords': route_coords,
-                'route_color': resolve_color(recorrido_obj.color_recorrido),
-                'line_dash': line_dash,
-                'paradas_geo': paradas_geo,
-                'bounds_points': coords_for_bounds,
-                'bounds': bounds,
-                'center': center,
-            }
-
-        route_data = build_route_data(recorrido, paradas_qs)
-        if not route_data:
-            context['error'] = 'No se pudo construir la ruta para el recorrido seleccionado.'
-            context['recorrido'] = recorrido
-            return context
-
-        default_delay_ms = 2000
-        now_dt = timezone.localtime()
-        route_coords = route_data['route_coords']
-
-        if not route_coords:
-            context['error'] = 'No hay coordenadas suficientes para animar este recorrido.'
+        ruta = obtener_ruta(recorrido, paradas_qs, trazar=False)
+        if not ruta or not ruta.geometria:
+            context['error'] = 'La ruta del recorrido seleccionado todavía no está trazada.'
             context['recorrido'] = recorrido
             return context
 
-        total_points = len(route_coords)
-        segment_count = max(total_points - 1, 1)
-        total_duration_ms = default_delay_ms * segment_count
-
-        def interpolate(point_a, point_b, fraction):
-            lat = point_a[0] + (point_b[0] - point_a[0]) * fraction
-            lng = point_a[1] + (point_b[1] - point_a[1]) * fraction
-            return lat, lng
-
-        def build_animation(start_dt):
-            if start_dt is None:
-                return None, [], True
-
-            elapsed_ms = int(max((now_dt - start_dt).total_seconds(), 0) * 1000)
-            elapsed_ms = min(elapsed_ms, total_duration_ms)
-
-            current_index = min(elapsed_ms // default_delay_ms, total_points - 1)
-            ms_into_segment = 0 if current_index == total_points - 1 else elapsed_ms % default_delay_ms
-
-            if current_index == total_points - 1 or default_delay_ms == 0:
-                lat, lng = route_coords[-1]
-            else:
-                fraction = ms_into_segment / default_delay_ms if default_delay_ms else 0
-                lat, lng = interpolate(route_coords[current_index], route_coords[current_index + 1], fraction)
-
-            initial_point = {
-                'lat': lat,
-                'lng': lng,
-                'timestamp': now_dt.isoformat(),
-            }
-
-            future_points = []
-            if current_index < total_points - 1:
-                remaining_delay = default_delay_ms - ms_into_segment if ms_into_segment else default_delay_ms
-                time_cursor = now_dt
-                for idx in range(current_index + 1, total_points):
-                    delay_ms = remaining_delay if idx == current_index + 1 else default_delay_ms
-                    time_cursor += timedelta(milliseconds=delay_ms)
-                    future_points.append({
-                        'lat': route_coords[idx][0],
-                        'lng': route_coords[idx][1],
-                        'delay_ms': delay_ms,
-                        'timestamp': time_cursor.isoformat(),
-                    })
-                    remaining_delay = default_delay_ms
-
-            finished = current_index == total_points - 1 and not future_points
-            return initial_point, future_points, finished
-
-        base_payload = {
-            'viaje_id': None,
-            'recorrido_id': recorrido.id,
-            'recorrido_color': recorrido.color_recorrido,
-            'paradas_total': len(paradas_qs),
-            'route_coords': route_coords,
-            'route_color': route_data['route_color'],
-            'line_dash': route_data['line_dash'],
-            'paradas': route_data['paradas_geo'],
-            'bus': None,
-            'is_focused': True,
-            'show_paradas': True,
-        }
-
-        active_viajes_qs = (
-            Viaje.objects
-            .filter(
-                fecha_hora_inicio_real__isnull=False,
-                fecha_hora_fin_real__isnull=True
+        warnings_list = []
+        if not ruta.trazada_con_osrm:
+            warnings_list.append(
+                f"OSRM no devolvió una ruta óptima para el recorrido {recorrido.color_recorrido}."
             )
-            .select_related('patente_bus', 'chofer', 'recorrido')
-            .order_by('fecha_hora_inicio_real')
-        )
-
-        selected_viaje_id_param = self.request.GET.get('viaje_id')
-        try:
-            selected_viaje_id = int(selected_viaje_id_param)
-        except (TypeError, ValueError):
-            selected_viaje_id = None
-
-        active_viajes_for_recorrido = [
-            viaje for viaje in active_viajes_qs if viaje.recorrido_id == recorrido.id
-        ]
-
-        if selected_viaje_id is not None and not any(v.id == selected_viaje_id for v in active_viajes_for_recorrido):
-            selected_viaje_id = None
-
-        map_payloads = []
-        active_viajes_info = []
-
-        for viaje in active_viajes_for_recorrido:
-            animation = build_animation(viaje.fecha_hora_inicio_real)
-            if not animation:
-                continue
-            initial_point, future_points, finished = animation
-            if finished:
-                if viaje.fecha_hora_fin_real is None:
-                    finalizar_viaje(viaje, timestamp=now_dt, registrar_inicio=False)
-                continue
-
-            bus_patente = viaje.patente_bus.patente_bus if viaje.patente_bus_id else None
-            bus_numero = viaje.patente_bus.numero_unidad if viaje.patente_bus_id else None
-            chofer_nombre = str(viaje.chofer) if viaje.chofer_id else None
-
-            tooltip_parts = [f"Recorrido {viaje.recorrido.color_recorrido}"]
-            if bus_numero is not None:
-                tooltip_parts.append(f"Unidad {bus_numero}")
-            if bus_patente:
-                tooltip_parts.append(f"Patente {bus_patente}")
-            if chofer_nombre:
-                tooltip_parts.append(f"Chofer {chofer_nombre}")
-
-            is_selected = selected_viaje_id is None or viaje.id == selected_viaje_id
-            if is_selected:
-                map_payloads.append({
-                    **base_payload,
-                    'viaje_id': viaje.id,
-                    'is_focused': selected_viaje_id is None or viaje.id == selected_viaje_id,
-                    'bus': {
-                        'tooltip': " · ".join(tooltip_parts),
-                        'initial_point': initial_point,
-                        'future_points': future_points,
-                        'marker_color': route_data['route_color'],
-                        'pan_map': True,
-                    },
-                })
-
-            info_is_focused = selected_viaje_id is not None and viaje.id == selected_viaje_id
-            active_viajes_info.append({
-                'viaje_id': viaje.id,
-                'recorrido_id': viaje.recorrido_id,
-                'recorrido_color': viaje.recorrido.color_recorrido,
-                'bus_patente': bus_patente,
-                'bus_numero': bus_numero,
-                'chofer': chofer_nombre,
-                'is_focused': info_is_focused or selected_viaje_id is None,
-            })
-
-        if not map_payloads:
-            map_payloads.append(base_payload)
 
         context['recorrido'] = recorrido
         context['paradas'] = [p.parada for p in paradas_qs]
-
-        context['active_viajes_info'] = active_viajes_info
-        context['map_payloads'] = map_payloads
-        context['map_payloads_json'] = json.dumps(map_payloads)
-        context['map_center_json'] = json.dumps(route_data['center'])
-        context['map_bounds_json'] = json.dumps(route_data['bounds'])
-        context['animation_default_delay_ms'] = default_delay_ms
+        context['route_color'] = resolver_color(recorrido.color_recorrido)
+        context['geojson_url'] = reverse('api-recorridos-geojson')
+        context['viewport_url'] = reverse('api-mapa-viewport')
+        context['viajes_url'] = reverse('api-recorrido-viajes', args=[recorrido.id])
+        context['buses_stream_url'] = reverse('api-recorrido-buses-stream', args=[recorrido.id])
         context['selected_recorrido_id'] = recorrido.id
-        context['selected_viaje_id'] = selected_viaje_id
-        context['viajes_filtrables'] = active_viajes_for_recorrido
-        context['recorridos_filtrables'] = list(recorridos_disponibles)
-        context['has_active_viajes'] = bool(active_viajes_info)
+        context['recorridos_filtrables'] = recorridos_disponibles
         if warnings_list:
             context['warnings'] = warnings_list
         return context
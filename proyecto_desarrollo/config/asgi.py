@@ -3,6 +3,11 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Servir el proyecto por ASGI (p. ej. ``uvicorn config.asgi:application``) es
+necesario para el stream en vivo de posiciones de buses
+(/api/recorridos/<id>/buses/stream/), que mantiene la conexión abierta sin
+ocupar un worker por cliente.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -78,6 +78,22 @@ DATABASES = {
 }
 
 
+# Cache
+# Tiene que ser compartido entre procesos: los contadores de generación y la
+# identidad cacheada de los choferes se invalidan en un worker y los demás
+# tienen que enterarse (LocMemCache es por proceso; el check
+# busturistico.E001 lo rechaza fuera de DEBUG). Con Redis/Memcached disponibles
+# alcanza con cambiar BACKEND/LOCATION.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', str(BASE_DIR / 'cache')),
+        # Los contadores de generación no expiran: que no los descarte el cull
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
@@ -115,6 +131,11 @@ STATICFILES_DIRS = [
     BASE_DIR / "static",                          
 ]
 STATIC_ROOT = BASE_DIR / "staticfiles"
+# collectstatic genera nombres con hash y copias .gz/.br (ver busturistico/storage.py)
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "busturistico.storage.ManifestComprimidoStorage"},
+}
 
 # Media files
 MEDIA_URL = '/media/'
@@ -131,6 +152,9 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # Motor de ruteo (OSRM)
 OSRM_BASE_URL = os.environ.get('OSRM_BASE_URL', 'https://bonnie-stoney-boorishly.ngrok-free.dev')
+OSRM_TIMEOUT = 5          # segundos por pedido
+OSRM_CONCURRENCIA = 4     # pedidos simultáneos al trazar varias rutas
+OSRM_REINTENTO = 600      # segundos antes de reintentar una ruta que quedó en línea recta
 
 
 
@@ -22,6 +22,7 @@ urlpatterns = [
     path('admin/choferes/', views.ChoferesView.as_view(), name='admin-choferes'),
     path('admin/choferes/detalle/<int:pk>/', views.ChoferDetailView.as_view(), name='admin-detalle-chofer'),
     path('admin/nuevo-chofer/', views.CrearChoferView.as_view(), name='admin-nuevo-chofer'),
+    path('admin/choferes/importar/', views.ImportarChoferesView.as_view(), name='admin-importar-choferes'),
     path('admin/choferes/editar/<int:pk>/', views.EditarChoferView.as_view(), name='admin-editar-chofer'),
     path('admin/choferes/eliminar/<int:pk>/', views.EliminarChoferView.as_view(), name='admin-eliminar-chofer'),
 
@@ -59,6 +60,9 @@ urlpatterns = [
     path('admin/consultas/', views.ConsultasView.as_view(), name='admin-consultas'),
     path('admin/consultas/<int:pk>/', views.ConsultaDetailView.as_view(), name='admin-consulta-detalle'),
 
+    # API pública (JSON / GeoJSON)
+    path('api/', include('busturistico.urls_api')),
+
     # Usuario público
     path('', include('busturistico.urls_usuario')),
     